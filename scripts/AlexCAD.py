@@ -18,18 +18,6 @@ scene is a group that has a view (or grouped views) and a "selected" subgroup
 # -- add example of difference between wireframe and stl (Corner Three Way)
 '''
 
-try:
-    from stl import mesh
-    STL_SUPPORTED = True
-except ImportError:
-    STL_SUPPORTED = False
-    print('''\
-numpy-stl required for stl imports
-    > pip install numpy-stl # or
-    > const install numpy-stl
-    ''')
-    raise
-
 import webbrowser
 import os.path
 import sys
@@ -220,7 +208,7 @@ def group_selected(*args):
         pass
     else:
         util.register_undo()
-        out = things.Group()
+        out = things.Group(hierarchical=app_config.get('hierarchical_groups', False))
         for thing in scene.selected.ungroup():
             scene.remove(thing)
             out.append(thing)
@@ -1140,27 +1128,9 @@ def alex_export_library_json():
     
     tk.Label(dialog, text="Select library to export:", font=("Arial", 12, "bold")).pack(pady=10)
     
-    # Get available libraries
-    available_libraries = []
-    library_objects = {}
-    library_info = {}  # Store name -> (object, part_count)
-    
-    # Add Main library
-    available_libraries.append("Main")
-    library_objects["Main"] = parts_db.Main
-    library_info["Main"] = (parts_db.Main, len(parts_db.Main.part_list()))
-    
-    # Find other libraries
-    for full_name in glob.glob(f'{parts_db.part_libraries_dir}/*'):
-        if os.path.isdir(full_name):
-            db_path = os.path.join(full_name, 'Parts.db')
-            if os.path.isfile(db_path):
-                name = os.path.split(full_name)[1]
-                if name != 'Main':
-                    available_libraries.append(name)
-                    lib = parts_db.Library(name)
-                    library_objects[name] = lib
-                    library_info[name] = (lib, len(lib.part_list()))
+    # Get available libraries and their part counts in one query
+    part_counts = parts_db.federation.part_counts()
+    available_libraries = list(part_counts)
     
     # Sort libraries alphabetically (Main first)
     available_libraries.sort(key=lambda x: (x != "Main", x.lower()))
@@ -1191,7 +1161,7 @@ def alex_export_library_json():
         for lib_name in available_libraries:
             # Apply wildcard filter
             if fnmatch.fnmatch(lib_name.lower(), filter_pattern.lower()):
-                lib, part_count = library_info[lib_name]
+                part_count = part_counts[lib_name]
                 display_text = f"{lib_name} ({part_count} parts)"
                 listbox.insert(tk.END, display_text)
     
@@ -1241,7 +1211,7 @@ def alex_export_library_json():
     def on_ok():
         lib_name = get_selected_library_name()
         if lib_name:
-            result['library'] = library_objects[lib_name]
+            result['library'] = parts_db.get_library(lib_name)
             result['library_name'] = lib_name
             result['confirmed'] = True
             dialog.destroy()
@@ -1291,7 +1261,7 @@ def alex_export_library_json():
     if filename:
         try:
             # Export selected library
-            json_export.export_library_to_json(
+            export_data = json_export.export_library_to_json(
                 selected_library,
                 filename,
                 description=f"Alex CAD Parts Library - {selected_name}"
@@ -1299,7 +1269,7 @@ def alex_export_library_json():
             messagebox.showinfo(
                 "Export Successful",
                 f"Library '{selected_name}' exported to:\n{filename}\n\n"
-                f"Total parts: {len(selected_library.part_list())}"
+                f"Total parts: {export_data['part_count']}"
             )
         except Exception as e:
             messagebox.showerror(
@@ -1372,7 +1342,7 @@ def alex_import_library_json():
             
             # Create new library
             try:
-                result['library'] = parts_db.Library(lib_name)
+                result['library'] = parts_db.get_library(lib_name)
                 result['confirmed'] = True
                 dialog.destroy()
             except Exception as e:
@@ -1504,12 +1474,8 @@ def on_library_file_changed(filepath):
                         library_name = parts[idx + 1]
             
             if library_name:
-                # Reload the library
-                new_library = parts_db.Library(library_name)
-                
-                # Update the global Main library if it's the main library
-                if library_name == 'Main':
-                    parts_db.Main = new_library
+                # The shared library's catalog reloads itself once the database changes
+                parts_db.get_library(library_name)
                 
                 messagebox.showinfo(
                     "Reload Successful",
@@ -1680,12 +1646,10 @@ def alex_update_3d_viewer(viewer_widget=None):
             return
         
         # Export scene to temporary STL file by combining part STLs
-        from stl import mesh
+        from packages import stl_io
         import numpy as np
         
-        all_vertices = []
-        all_faces = []
-        vertex_offset = 0
+        all_vertices = [] ### (3n, 3) corner arrays, three per triangle
         parts_loaded = 0
         
         print(f"\n=== 3D Viewer Debug ===")
@@ -1721,7 +1685,7 @@ def alex_update_3d_viewer(viewer_widget=None):
                         
                         if os.path.exists(stl_path):
                             try:
-                                part_mesh = mesh.Mesh.from_file(stl_path)
+                                part_mesh = stl_io.load(stl_path)
                                 vertices = part_mesh.vectors.reshape(-1, 3)
                                 
                                 # Apply transformations
@@ -1735,11 +1699,7 @@ def alex_update_3d_viewer(viewer_widget=None):
                                 if hasattr(member, 'pos') and member.pos is not None:
                                     vertices = vertices + np.array(member.pos)
                                 
-                                all_vertices.extend(vertices.tolist())
-                                num_vertices = len(vertices)
-                                for k in range(0, num_vertices, 3):
-                                    all_faces.append([vertex_offset + k, vertex_offset + k + 1, vertex_offset + k + 2])
-                                vertex_offset += num_vertices
+                                all_vertices.append(vertices)
                                 parts_loaded += 1
                                 print(f"      ✓ Loaded {member.name}")
                             except Exception as e:
@@ -1761,7 +1721,7 @@ def alex_update_3d_viewer(viewer_widget=None):
                 
                 if os.path.exists(stl_path):
                     try:
-                        part_mesh = mesh.Mesh.from_file(stl_path)
+                        part_mesh = stl_io.load(stl_path)
                         
                         # Get vertices from the mesh
                         vertices = part_mesh.vectors.reshape(-1, 3)
@@ -1786,18 +1746,8 @@ def alex_update_3d_viewer(viewer_widget=None):
                             vertices = vertices + np.array(thing.pos)
                         
                         # Add to combined mesh
-                        all_vertices.extend(vertices.tolist())
-                        
-                        # Create faces (triangles)
+                        all_vertices.append(vertices)
                         num_vertices = len(vertices)
-                        for i in range(0, num_vertices, 3):
-                            all_faces.append([
-                                vertex_offset + i,
-                                vertex_offset + i + 1,
-                                vertex_offset + i + 2
-                            ])
-                        
-                        vertex_offset += num_vertices
                         parts_loaded += 1
                         print(f"  ✓ Loaded {thing.name} ({num_vertices} vertices)")
                     except Exception as e:
@@ -1814,21 +1764,14 @@ def alex_update_3d_viewer(viewer_widget=None):
             )
             return
         
-        # Create combined mesh
-        vertices = np.array(all_vertices)
-        faces = np.array(all_faces)
-        
-        # Create STL mesh
-        combined_mesh = mesh.Mesh(np.zeros(len(faces), dtype=mesh.Mesh.dtype))
-        for i, face in enumerate(faces):
-            for j in range(3):
-                combined_mesh.vectors[i][j] = vertices[face[j]]
+        # Create combined mesh, three consecutive corners per triangle
+        faces = np.concatenate(all_vertices).reshape((-1, 3, 3))
         
         # Save to temporary file
         with tempfile.NamedTemporaryFile(mode='wb', suffix='.stl', delete=False) as f:
             temp_stl_path = f.name
         
-        combined_mesh.save(temp_stl_path)
+        stl_io.write(temp_stl_path, faces)
         print(f"Saved combined mesh to: {temp_stl_path}")
         
         # Load into viewer
@@ -1951,11 +1894,8 @@ def stl_import_dialog():
     
 def alex_import():
     filetypes = (("Extruded AL","*.xcad"),
-                 # ("Mesh", "*.stl"),
+                 ("Mesh", "*.stl"),
                  ("all files","*.*"))
-    if not STL_SUPPORTED:
-        filetypes = (("Extruded AL","*.xcad"),
-                     ("all files","*.*"))
     filename = filedialog.askopenfilename(
         #initialdir = "/",
         title = "Select file",
@@ -2041,8 +1981,6 @@ filemenu = tk.Menu(menubar, tearoff=0)
 filemenu.add_command(label="New", command=alex_new)
 filemenu.add_command(label="Open", command=alex_open_dialog)
 filemenu.add_command(label="Import", command=alex_import)
-if False and STL_SUPPORTED:
-    filemenu.add_command(label="Import STL", command=stl_import_dialog)
 filemenu.add_command(label="Save", command=alex_save)
 filemenu.add_command(label="Save As", command=alex_save_as)
 filemenu.add_command(label="📋 Bill of Materials", command=alex_enhanced_bom)
@@ -2117,6 +2055,9 @@ views, rt_angle_images = view_layout.create_view_layout(
 )
 
 scene = things.Scene(views, selected, export_cb=export_cb)
+if app_config.get('columnar_scene', False): ### batched moves for very large scenes
+    from packages.scene_store import SceneStore
+    scene.use_store(SceneStore())
 
 
 
@@ -0,0 +1,161 @@
+'''
+Content-addressed store for library assets (STL, wireframe .npy, png).
+
+Every distinct file content is kept once, as part_libraries/.assets/ab/<sha256><ext>,
+and the files in library directories are hard links to it.  Copying an asset
+from one library to another is then a link, not a copy, and disk use does not
+grow with the number of libraries.  Where hard links are not available (other
+file system, FAT) files are copied as before.
+
+Linked files are shared: never write one in place, write a new file and
+os.replace() it over the old name (as wireframes.add_wf and thumbnails.render do).
+
+    python -m packages.assets [--gc]    ### link existing duplicate assets
+'''
+import hashlib
+import os
+import shutil
+import sys
+import threading
+
+if '.' not in sys.path:
+    sys.path.append('.')
+from packages.constants import part_libraries_dir
+
+asset_dirs = ('STL', 'Wireframes', 'Thumbnails')
+asset_exts = ('.stl', '.npy', '.png')
+
+class AssetStore:
+    def __init__(self, root):
+        self.root = root
+        self.digests = {} ### (dev, ino, size, mtime_ns) -> sha256 of the file
+        self.lock = threading.Lock()
+
+    def digest(self, fn):
+        st = os.stat(fn)
+        key = (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)
+        with self.lock:
+            digest = self.digests.get(key)
+        if digest is None:
+            h = hashlib.sha256()
+            with open(fn, 'rb') as f:
+                for chunk in iter(lambda: f.read(2 ** 20), b''):
+                    h.update(chunk)
+            digest = h.hexdigest()
+            with self.lock:
+                self.digests[key] = digest
+        return digest
+
+    def blob_path(self, digest, ext=''):
+        return os.path.join(self.root, digest[:2], digest + ext.lower())
+
+    def add(self, fn):
+        '''
+        Put the content of fn in the store (linking fn itself when possible).
+        Returns the blob path.
+        '''
+        digest = self.digest(fn)
+        blob = self.blob_path(digest, os.path.splitext(fn)[1])
+        if not os.path.exists(blob):
+            os.makedirs(os.path.dirname(blob), exist_ok=True)
+            try:
+                os.link(fn, blob)
+            except FileExistsError:
+                pass
+            except OSError:
+                place(shutil.copy2, fn, blob)
+        st = os.stat(blob)
+        with self.lock:
+            self.digests[(st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns)] = digest
+        return blob
+
+    def link(self, src, dst):
+        '''
+        Make dst a file with the content of src, sharing storage with every
+        other file of that content.  An existing dst is replaced.
+        '''
+        if os.path.exists(dst) and os.path.samefile(src, dst):
+            return dst
+        blob = self.add(src)
+        try:
+            place(os.link, blob, dst)
+        except OSError:
+            place(shutil.copy2, blob, dst)
+        return dst
+
+    def dedupe(self, fns):
+        '''
+        Replace copies among fns by links to the store.
+        Returns the number of bytes freed.
+        '''
+        freed = 0
+        for fn in fns:
+            blob = self.add(fn)
+            if not os.path.samefile(fn, blob):
+                size = os.path.getsize(fn)
+                self.link(blob, fn)
+                if os.path.samefile(fn, blob):
+                    freed += size
+        return freed
+
+    def blobs(self):
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            for fn in filenames:
+                yield os.path.join(dirpath, fn)
+
+    def gc(self):
+        '''
+        Remove blobs no library file links to any more.  Returns how many.
+        '''
+        removed = 0
+        for blob in list(self.blobs()):
+            if os.stat(blob).st_nlink == 1:
+                os.remove(blob)
+                removed += 1
+        return removed
+
+    def stats(self):
+        blobs = list(self.blobs())
+        return {'blobs': len(blobs),
+                'bytes': sum(os.path.getsize(blob) for blob in blobs),
+                'links': sum(os.stat(blob).st_nlink - 1 for blob in blobs)}
+
+def place(make, src, dst):
+    '''
+    make(src, tmp) next to dst and move it over dst in one step.
+    '''
+    tmp = f'{dst}.{os.getpid()}.{threading.get_ident()}.tmp'
+    try:
+        make(src, tmp)
+        os.replace(tmp, dst)
+    finally:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+
+def library_assets(root=part_libraries_dir):
+    for lib_dir in sorted(os.listdir(root)):
+        if lib_dir.startswith('.'):
+            continue
+        for sub in asset_dirs:
+            d = os.path.join(root, lib_dir, sub)
+            if os.path.isdir(d):
+                for fn in sorted(os.listdir(d)):
+                    if fn.lower().endswith(asset_exts):
+                        yield os.path.join(d, fn)
+
+store = AssetStore(os.path.join(part_libraries_dir, '.assets'))
+
+def link(src, dst):
+    return store.link(src, dst)
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    freed = store.dedupe(library_assets())
+    print(f'Linked duplicate assets, {freed / 2 ** 20:.1f} MiB freed')
+    if '--gc' in argv:
+        print(f'Removed {store.gc()} unused blobs')
+    stats = store.stats()
+    print(f"{stats['blobs']} blobs, {stats['bytes'] / 2 ** 20:.1f} MiB, {stats['links']} links")
+
+if __name__ == '__main__':
+    main()
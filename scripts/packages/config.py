@@ -31,6 +31,8 @@ class Config:
         """Return default configuration."""
         return {
             'hot_reload_enabled': True,  # Default to enabled
+            'columnar_scene': False,  # Keep part placement in a SceneStore
+            'hierarchical_groups': False,  # New groups keep members relative to a group frame
         }
     
     def save(self):
@@ -17,7 +17,8 @@ stl_dir = os.path.join(package_dir, 'STL')
 npy_dir = os.path.join(package_dir, 'wireframes')
 scripts_dir = os.path.split(package_dir)[0]
 alex_dir = os.path.split(scripts_dir)[0]
-part_libraries_dir = os.path.join(alex_dir, 'part_libraries')
+### ALEX_PART_LIBRARIES points at another copy of the libraries, e.g. for tests
+part_libraries_dir = os.environ.get('ALEX_PART_LIBRARIES', os.path.join(alex_dir, 'part_libraries'))
 
 openscad_path = shutil.which('openscad')
 if openscad_path is None:
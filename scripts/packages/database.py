@@ -1,6 +1,64 @@
+import os
 import sqlite3
+import threading
+from collections import OrderedDict, namedtuple
+
+DEFAULT_BATCH_SIZE = 500
+
+class ConnectionManager:
+    '''
+    Hand out one sqlite connection per (thread, filename) so background
+    threads never share a connection with the UI thread.  New connections
+    are tuned with pragmas; WAL journaling lets readers run concurrently
+    with a writer.  WAL needs -wal and -shm files beside the database, so
+    the journal mode is left alone where the directory is not writable.
+    '''
+    default_pragmas = {'journal_mode': 'WAL',
+                       'synchronous': 'NORMAL',
+                       'mmap_size': 256 * 2 ** 20,
+                       'cache_size': -16 * 2 ** 10, ## KiB
+                       'temp_store': 'MEMORY',
+                       'recursive_triggers': 'ON'} ## REPLACE fires delete triggers
+
+    def __init__(self, pragmas=None, timeout=30.):
+        self.pragmas = dict(self.default_pragmas)
+        if pragmas is not None:
+            self.pragmas.update(pragmas)
+        self.timeout = timeout
+        self.local = threading.local()
+
+    def connections(self):
+        if not hasattr(self.local, 'connections'):
+            self.local.connections = {}
+        return self.local.connections
+
+    def connect(self, fn):
+        connections = self.connections()
+        if fn not in connections:
+            db = sqlite3.connect(fn, timeout=self.timeout)
+            for key, value in self.pragmas.items():
+                if key == 'journal_mode' and not self.writable(fn):
+                    continue
+                db.execute('PRAGMA %s=%s' % (key, value))
+            connections[fn] = db
+        return connections[fn]
+
+    def writable(self, fn):
+        if fn == ':memory:' or fn.startswith('file:'):
+            return True
+        return os.access(os.path.dirname(os.path.abspath(fn)), os.W_OK)
+
+    def close(self, fn=None):
+        '''
+        Close the calling thread's connection to fn (all of them if fn is None).
+        '''
+        connections = self.connections()
+        for key in list(connections):
+            if fn is None or key == fn:
+                connections.pop(key).close()
 
 class Struct:
+    ### record type of older versions; kept so saved designs still unpickle
     def __init__(self, **kwargs):
         self.attrs = kwargs
         self.__dict__.update(kwargs)
@@ -10,10 +68,133 @@ class Struct:
         return self.attrs[key]
     def __repr__(self):
         return f'Struct(**{self.attrs})'
+
+row_types = {}
+def make_row_type(name, colnames):
+    '''
+    Return a compact (tuple based, no __dict__) record class for colnames.
+    Values are available as attributes, record.Name, and by column name,
+    record['Name'].  One class is shared per (name, colnames).
+    '''
+    key = (name, tuple(colnames))
+    if key in row_types:
+        return row_types[key]
+    class Row(namedtuple(name, colnames)):
+        __slots__ = ()
+        def __getitem__(self, key):
+            if isinstance(key, str):
+                return getattr(self, key)
+            return tuple.__getitem__(self, key)
+        def keys(self):
+            return self._fields
+        def __reduce__(self):
+            ### the class is generated, so pickle the recipe instead
+            return (make_row, (name, self._fields, tuple(self)))
+    Row.__name__ = name
+    Row.__qualname__ = name
+    row_types[key] = Row
+    return Row
+
+def make_row(name, colnames, values):
+    return make_row_type(name, colnames)._make(values)
+
+class Predicate:
+    '''
+    Parameterized WHERE clause: sql text with ? place holders plus params.
+    '''
+    def __init__(self, sql, params=()):
+        self.sql = sql
+        self.params = tuple(params)
+    def __and__(self, other):
+        return And(self, other)
+    def __or__(self, other):
+        return Or(self, other)
+    def __repr__(self):
+        return f'Predicate({self.sql!r}, {self.params})'
+
+class Eq(Predicate):
+    def __init__(self, column, value):
+        Predicate.__init__(self, '%s=?' % column, (value,))
+
+class In(Predicate):
+    def __init__(self, column, values):
+        values = tuple(values)
+        if len(values) == 0:
+            Predicate.__init__(self, '0')
+        else:
+            Predicate.__init__(self, '%s IN (%s)' % (column, ','.join('?' * len(values))), values)
+
+class KeyIn(Predicate):
+    ### (a, b) IN (VALUES (?, ?), ...) for keys of one or more columns
+    def __init__(self, columns, keys):
+        if len(columns) == 1:
+            In.__init__(self, columns[0], [k[0] for k in keys])
+        elif len(keys) == 0:
+            Predicate.__init__(self, '0')
+        else:
+            row = '(%s)' % ','.join('?' * len(columns))
+            Predicate.__init__(self, '(%s) IN (VALUES %s)' % (','.join(columns), ','.join([row] * len(keys))),
+                               sum((tuple(k) for k in keys), ()))
+
+class Like(Predicate):
+    def __init__(self, column, pattern):
+        Predicate.__init__(self, '%s LIKE ?' % column, (pattern,))
+
+class Range(Predicate):
+    '''
+    lo <= column <= hi, either bound may be None
+    '''
+    def __init__(self, column, lo=None, hi=None):
+        terms = []
+        params = []
+        if lo is not None:
+            terms.append('%s>=?' % column)
+            params.append(lo)
+        if hi is not None:
+            terms.append('%s<=?' % column)
+            params.append(hi)
+        if len(terms) == 0:
+            terms.append('1')
+        Predicate.__init__(self, ' AND '.join(terms), params)
+
+class And(Predicate):
+    def __init__(self, *predicates):
+        Predicate.__init__(self, ' AND '.join('(%s)' % p.sql for p in predicates),
+                           sum((p.params for p in predicates), ()))
+
+class Or(Predicate):
+    def __init__(self, *predicates):
+        Predicate.__init__(self, ' OR '.join('(%s)' % p.sql for p in predicates),
+                           sum((p.params for p in predicates), ()))
+
+def as_predicate(where):
+    if where is None or isinstance(where, Predicate):
+        return where
+    if isinstance(where, str):
+        return Predicate(where)
+    return And(*where)
+
+class InsertResult:
+    def __init__(self):
+        self.inserted = 0
+        self.ignored = 0
+        self.replaced = 0
+        self.updated = 0
+    def total(self):
+        return self.inserted + self.ignored + self.replaced + self.updated
+    def __repr__(self):
+        return (f'InsertResult(inserted={self.inserted}, ignored={self.ignored}, '
+                f'replaced={self.replaced}, updated={self.updated})')
+
 class Table:
+    statement_cache_size = 128 ### In() lists of each length make their own statement
+
     def __init__(self, name, *columns):
         self.name = name
         self.columns = columns
+        self.statements = OrderedDict() ### least recently used first
+        self.statements_lock = threading.Lock()
+        self.row_types = {}
 
     def create(self, db):
         cols = ['%s' % col for col in self.columns]
@@ -28,64 +209,241 @@ class Table:
             print ('%s Dropped' % self.name)
         else:
             print ('Drop not executed')
-    def create_index(self, db, colnames, unique=False):
-        idx_name = ''.join(colnames)
+    def create_index(self, db, colnames, unique=False, name=None):
+        idx_name = name or ''.join(colnames)
         cols = ','.join(colnames)
         unique = ['', 'UNIQUE'][unique]
-        sql = 'CREATE %s INDEX %s ON %s(%s)' % (unique, idx_name, self.name, cols)
+        sql = 'CREATE %s INDEX IF NOT EXISTS %s ON %s(%s)' % (unique, idx_name, self.name, cols)
         db.execute(sql)
     def insert(self, db, values):
-        place_holders = ','.join('?' * len(values[0]))
-        cols = ','.join([col.name for col in self.columns])
-        sql = 'INSERT INTO %s(%s) VALUES (%s);' % (self.name, cols, place_holders)
-        #print('sql:', sql)
-        rowcount = 0
-        for row in values:
-            ### add quote to string fields
+        return self.insert_many(db, values, on_conflict='ignore').inserted
+
+    def insert_many(self, db, values, on_conflict='abort', key=None,
+                    update_columns=None, batch_size=5000, commit=True):
+        '''
+        Insert rows in one transaction per batch using a single executemany.
+
+        on_conflict -- 'abort' (raise and roll back the batch), 'ignore',
+                       'replace' or 'update'
+        key -- conflict target for 'update' and the key 'replace' counts
+               conflicts on (defaults to the UNIQUE columns)
+        update_columns -- columns to overwrite for 'update' (defaults to all
+                          non-key columns)
+        commit -- False to leave the rows in the caller's transaction
+
+        Returns InsertResult with per-row outcome counts.  They come from the
+        cursor's rowcount and, for 'replace' and 'update', a lookup of the
+        batch's keys, so the table is never counted.  That lookup is exact
+        only when key is the table's one unique key, so 'replace' raises
+        ValueError on a table with any other; 'update' needs no check, its
+        other unique keys abort the batch.
+        '''
+        values = list(values)
+        result = InsertResult()
+        if len(values) == 0:
+            return result
+        sql = self.insert_sql(len(values[0]), on_conflict, key, update_columns)
+        if key is None:
+            key = self.unique_columns()
+        if on_conflict == 'replace':
+            others = [k for k in self.unique_keys(db) if set(k) != set(key)]
+            if others:
+                raise ValueError(f"{self.name}: 'replace' can only count conflicts on {tuple(key)}, "
+                                 f"not on unique keys {others}; use 'update'")
+        for start in range(0, len(values), batch_size):
+            batch = values[start:start + batch_size]
             try:
-                rowcount += db.executemany(sql, [row]).rowcount
-            except sqlite3.IntegrityError:
-                pass
-            db.commit()
-        return rowcount
+                if on_conflict in ('replace', 'update'):
+                    conflicts = self.count_conflicts(db, batch, key)
+                rowcount = db.executemany(sql, batch).rowcount
+                if commit:
+                    db.commit()
+            except:
+                if commit:
+                    db.rollback()
+                raise
+            if on_conflict in ('abort', 'ignore'):
+                result.inserted += rowcount
+                result.ignored += len(batch) - rowcount
+            elif on_conflict == 'replace':
+                result.inserted += len(batch) - conflicts
+                result.replaced += conflicts
+            else:
+                ### every row either conflicts on key and is updated, or is inserted
+                result.inserted += rowcount - conflicts
+                result.updated += conflicts
+        return result
+
+    def unique_keys(self, db):
+        '''
+        Column tuples of the table's unique indexes and primary key, as sqlite has them.
+        '''
+        keys = set()
+        for seq, name, unique, *rest in db.execute('PRAGMA index_list(%s)' % self.name).fetchall():
+            if unique:
+                info = db.execute('PRAGMA index_info(%s)' % name).fetchall()
+                keys.add(tuple(row[2] for row in info))
+        pk = sorted((row[5], row[1]) for row in db.execute('PRAGMA table_info(%s)' % self.name) if row[5])
+        if pk:
+            keys.add(tuple(col for i, col in pk))
+        return sorted(keys)
+
+    def count_conflicts(self, db, rows, key):
+        '''
+        Number of rows whose key is already in the table or earlier in rows.
+        Keys with a NULL never conflict.
+        '''
+        if len(key) == 0:
+            return 0
+        cols = self.colnames()
+        positions = [cols.index(col) for col in key]
+        keys = [tuple(row[i] for i in positions) for row in rows]
+        keys = [k for k in keys if None not in k]
+        distinct = list(set(keys))
+        present = 0
+        chunk = max(1, DEFAULT_BATCH_SIZE // len(key))
+        for start in range(0, len(distinct), chunk):
+            present += self.count(db, where=KeyIn(key, distinct[start:start + chunk]))
+        return present + len(keys) - len(distinct)
+
+    def insert_sql(self, n_values, on_conflict='abort', key=None, update_columns=None):
+        cols = [col.name for col in self.columns][:n_values]
+        place_holders = ','.join('?' * n_values)
+        if on_conflict in ('abort', 'update'):
+            verb = 'INSERT'
+        elif on_conflict in ('ignore', 'replace'):
+            verb = 'INSERT OR %s' % on_conflict.upper()
+        else:
+            raise ValueError(f"Unknown conflict mode '{on_conflict}'")
+        sql = '%s INTO %s(%s) VALUES (%s)' % (verb, self.name, ','.join(cols), place_holders)
+        if on_conflict == 'update':
+            if key is None:
+                key = self.unique_columns()
+            if len(key) == 0:
+                raise ValueError(f"Table {self.name} has no UNIQUE column to update on")
+            if update_columns is None:
+                update_columns = [col for col in cols if col not in key]
+            sets = ','.join(f'{col}=excluded.{col}' for col in update_columns)
+            sql += ' ON CONFLICT(%s) DO UPDATE SET %s' % (','.join(key), sets)
+        return sql + ';'
+
+    def unique_columns(self):
+        return [col.name for col in self.columns if col.kw.get('UNIQUE')]
 
-    def delete(self, db, where):
-        sql = f'DELETE FROM {self.name} WHERE {where}'
-        #<print(sql)
+    def count(self, db, where=None):
+        where = as_predicate(where)
+        sql = self.statement('SELECT COUNT(*)', where)
+        params = where.params if where is not None else ()
+        return db.execute(sql, params).fetchone()[0]
+
+    def colnames(self):
+        return tuple(col.name for col in self.columns)
+
+    def row_type(self, columns=None):
+        '''
+        Return the record class for the projection columns (all columns by default).
+        '''
+        columns = self.colnames() if columns is None else tuple(columns)
+        if columns not in self.row_types:
+            self.row_types[columns] = make_row_type(self.name, columns)
+        return self.row_types[columns]
+
+    def statement(self, verb, where=None, order_by=None, limit=None):
+        '''
+        Return (cached) sql text for verb ("SELECT *", "DELETE", ...) and
+        the predicate shape.  Identical text lets sqlite reuse the prepared
+        statement from the connection's statement cache.  At most
+        statement_cache_size shapes are kept, least recently used dropped.
+        '''
+        if isinstance(order_by, str):
+            order_by = (order_by,)
+        elif order_by is not None:
+            order_by = tuple(order_by)
+        key = (verb, where.sql if where is not None else None, order_by, limit is not None)
+        with self.statements_lock:
+            sql = self.statements.get(key)
+            if sql is not None:
+                self.statements.move_to_end(key)
+                return sql
+        sql = '%s FROM %s' % (verb, self.name)
+        if where is not None:
+            sql += ' WHERE ' + where.sql
+        if order_by:
+            sql += ' ORDER BY ' + ','.join(order_by)
+        if limit is not None:
+            sql += ' LIMIT ?'
+        with self.statements_lock:
+            self.statements[key] = sql
+            while len(self.statements) > self.statement_cache_size:
+                self.statements.popitem(last=False)
+        return sql
+
+    def delete(self, db, where, commit=True):
+        where = as_predicate(where)
+        sql = self.statement('DELETE', where)
         try:
-            cur = db.execute(sql)
-            db.commit()
+            cur = db.execute(sql, where.params)
+            if commit:
+                db.commit()
         except sqlite3.OperationalError:
             print(sql)
             raise
+        return cur.rowcount
         
-    def select(self, db, where=None):
-        sql = 'SELECT * FROM %s' % self.name
-        if where is not None:
-            sql += ' WHERE ' + where
+    def execute_select(self, db, where=None, order_by=None, limit=None, columns=None):
+        where = as_predicate(where)
+        row_type = self.row_type(columns)
+        verb = 'SELECT ' + ','.join(row_type._fields)
+        sql = self.statement(verb, where, order_by, limit)
+        params = where.params if where is not None else ()
+        if limit is not None:
+            params = params + (limit,)
         try:
-            cur = db.execute(sql)
+            cur = db.execute(sql, params)
         except sqlite3.OperationalError:
             print(sql)
             raise
-        out = []
-        colnames = [col.name for col in self.columns]
-        for row in cur.fetchall():
-            l = Struct(**dict(zip(colnames, row)))
-            out.append(l)
-        return out
+        return row_type, cur
+
+    def select(self, db, where=None, order_by=None, limit=None, columns=None):
+        '''
+        where -- Predicate (Eq, In, Like, Range, ...), list of predicates
+                 (combined with AND) or a raw sql string
+        columns -- project onto these columns (default all)
+        '''
+        row_type, cur = self.execute_select(db, where, order_by, limit, columns)
+        make = row_type._make
+        return [make(row) for row in cur.fetchall()]
+
+    def iter_select(self, db, where=None, order_by=None, limit=None, columns=None,
+                    batch_size=DEFAULT_BATCH_SIZE):
+        '''
+        Like select() but yield records, fetching batch_size rows at a time.
+        '''
+        row_type, cur = self.execute_select(db, where, order_by, limit, columns)
+        make = row_type._make
+        while True:
+            rows = cur.fetchmany(batch_size)
+            if not rows:
+                break
+            for row in rows:
+                yield make(row)
 
     def join(self, db, other, col, where=None):
+        return list(self.iter_join(db, other, col, where))
+
+    def iter_join(self, db, other, col, where=None, batch_size=DEFAULT_BATCH_SIZE):
         sql = 'SELECT * FROM %s LEFT JOIN %s ON %s.%s' % (self.name, other.name, self.name, col)
         if where:
             sql += ' WHERE ' + where
         cur = db.execute(sql)
         colnames = [l[0] for l in cur.description]
-        out = []
-        for row in cur.fetchall():
-            l = dict(zip(colnames, row))
-            out.append(l)
-        return out
+        while True:
+            rows = cur.fetchmany(batch_size)
+            if not rows:
+                break
+            for row in rows:
+                yield dict(zip(colnames, row))
 
 class Column:
     def __init__(self, name, type, **kw):
@@ -122,3 +480,62 @@ class Text(DBType):
     def __init__(self):
         DBType.__init__(self, 'TEXT')
         self.convert = str
+
+
+schema_version_table = Table('schema_version',
+                             Column('Version', Integer()),
+                             Column('Description', String()),
+                             Column('Applied', String()))
+
+class Migration:
+    '''
+    One schema upgrade step.  steps are sql strings or callables taking db.
+    '''
+    def __init__(self, version, description, *steps):
+        self.version = version
+        self.description = description
+        self.steps = steps
+    def apply(self, db):
+        for step in self.steps:
+            if callable(step):
+                step(db)
+            else:
+                db.execute(step)
+    def __repr__(self):
+        return f'Migration({self.version}, {self.description!r})'
+
+def schema_version(db):
+    schema_version_table.create(db)
+    version = db.execute('SELECT MAX(Version) FROM schema_version').fetchone()[0]
+    return version or 0
+
+def migrate(db, migrations):
+    '''
+    Bring db up to date by applying, in version order, every migration newer
+    than its schema_version.  Each migration runs in its own transaction, so
+    a failing step leaves the database at the previous version.
+
+    Returns the list of applied versions.
+    '''
+    migrations = sorted(migrations, key=lambda m: m.version)
+    versions = [m.version for m in migrations]
+    if len(set(versions)) != len(versions):
+        raise ValueError(f"Duplicate migration versions in {versions}")
+    applied = []
+    db.commit()
+    if len(migrations) == 0 or schema_version(db) >= migrations[-1].version:
+        return applied
+    for migration in migrations:
+        db.execute('BEGIN IMMEDIATE')
+        try:
+            ### re-check under the write lock, another connection may have upgraded
+            if schema_version(db) < migration.version:
+                migration.apply(db)
+                db.execute("INSERT INTO schema_version VALUES (?, ?, datetime('now'))",
+                           (migration.version, migration.description))
+                applied.append(migration.version)
+            db.commit()
+        except:
+            db.rollback()
+            raise
+    return applied
@@ -0,0 +1,173 @@
+'''
+Fast interface engagement for the parts of a Scene.
+
+An interface of a part is engaged when another (top-level, non-group) scene
+member has its box center on the line through the interface hotspot along
+the interface direction, and a face of its box is flush with the opposite
+face of the part's box (see parts_db.Interface.engaged).
+
+Parts are only ever turned in right angles, so that line is parallel to an
+axis.  Engagement hashes every member under the three axis-parallel lines
+through its box center, so finding what lies on an interface's line is a
+dictionary lookup instead of a pass over the scene with a convex hull per
+part.  The table follows the scene's spatial index: members that moved are
+hashed again when the index refreshes them.
+
+The open interfaces of a part are kept until it moves or a member is
+hashed onto or off one of its interface lines.  Those parts are collected
+as stale, both the ones a move engaged and the ones it left open, so the
+scene can redraw them (Scene.render_engaged).
+
+    scene.engagement.open_interfaces(part)  ### [(interface, hotspot, direction)]
+'''
+from collections import defaultdict
+
+import numpy as np
+
+class Engagement:
+    def __init__(self, index, tolerance=.01):
+        self.index = index
+        self.tolerance = tolerance
+        self.lines = defaultdict(set) ### (axis, cell, cell) -> members centered on that line
+        self.keys = {}                ### member -> its line keys
+        self.boxes = {}               ### member -> mins and maxs, hstacked
+        self.interest = defaultdict(set) ### line key -> owners with an interface line near it
+        self.watched = {}             ### owner -> its keys in interest
+        self.open = {}                ### owner -> (version, open interfaces)
+        self.stale = set()            ### owners whose open interfaces may have changed
+        index.watchers.append(self)
+
+    def cell(self, x):
+        return int(np.floor(x / self.tolerance))
+
+    def line_key(self, axis, point):
+        i, j = [a for a in range(3) if a != axis]
+        return (axis, self.cell(point[i]), self.cell(point[j]))
+
+    def update(self, member):
+        self.unhash(member)
+        self.forget(member) ### its interfaces moved with it
+        if member.iscontainer(): ### cant interface w/ a group
+            return
+        mins, maxs = member.get_boundingbox()
+        center = (mins + maxs) / 2
+        keys = [self.line_key(axis, center) for axis in range(3)]
+        for key in keys:
+            self.lines[key].add(member)
+        self.keys[member] = keys
+        self.boxes[member] = np.hstack([mins, maxs])
+        self.touch(keys)
+
+    def discard(self, member):
+        ### member left the scene
+        self.unhash(member)
+        self.forget(member)
+        for thing in parts_of(member):
+            self.stale.discard(thing)
+
+    def unhash(self, member):
+        keys = self.keys.pop(member, ())
+        for key in keys:
+            line = self.lines[key]
+            line.discard(member)
+            if not line:
+                del self.lines[key]
+        self.boxes.pop(member, None)
+        self.touch(keys)
+
+    def touch(self, keys):
+        ### owners looking along these lines have to look again
+        for key in keys:
+            for owner in self.interest.get(key, ()):
+                self.open.pop(owner, None)
+                self.stale.add(owner)
+
+    def forget(self, member):
+        for thing in parts_of(member):
+            self.open.pop(thing, None)
+            for key in self.watched.pop(thing, ()):
+                owners = self.interest[key]
+                owners.discard(thing)
+                if not owners:
+                    del self.interest[key]
+
+    def take_stale(self):
+        '''
+        Return the owners whose open interfaces may have changed since the
+        last call, and forget them.
+        '''
+        self.index.refresh()
+        stale = self.stale
+        self.stale = set()
+        return stale
+
+    def neighbour_keys(self, axis, point):
+        ### the line's cell and the ones around it
+        axis, a, b = self.line_key(axis, point)
+        return [(axis, a + da, b + db) for da in (-1, 0, 1) for db in (-1, 0, 1)]
+
+    def on_line(self, axis, point):
+        ### members that may be centered on the line, neighbouring cells included
+        for key in self.neighbour_keys(axis, point):
+            yield from self.lines.get(key, ())
+
+    def engaged_at(self, owner, owner_bb, p, d):
+        axis = int(np.argmax(np.abs(d)))
+        if abs(abs(d[axis]) - 1) > 1e-6: ### not along an axis: check every member on the line
+            candidates = self.index.ray(p, d, radius=self.tolerance, t_min=-np.inf)
+            candidates = [thing for thing in candidates if thing in self.boxes]
+        else:
+            candidates = self.on_line(axis, p)
+        boxes = [self.boxes[thing] for thing in candidates if thing is not owner]
+        if not boxes:
+            return False
+        boxes = np.array(boxes)
+        r = (boxes[:, :3] + boxes[:, 3:]) / 2 - p
+        on_line = np.linalg.norm(r - np.outer(r @ d, d), axis=1) < self.tolerance
+        flush = np.min(np.abs(np.roll(owner_bb, 3) - boxes), axis=1) < self.tolerance
+        return bool(np.any(on_line & flush))
+
+    def engaged(self, owner, interface):
+        self.index.refresh()
+        p, d = interface.get_pos_dir(owner)
+        return self.engaged_at(owner, np.hstack(owner.get_boundingbox()), p, d)
+
+    def open_interfaces(self, part):
+        '''
+        Return [(interface, hotspot, direction)] in world space for the
+        interfaces of part that are not engaged.
+        '''
+        interfaces = part.interfaces
+        if not interfaces:
+            return []
+        self.index.refresh()
+        version = part.version
+        cache = self.open.get(part)
+        if cache is not None and cache[0] == version:
+            return cache[1]
+        owner_bb = np.hstack(part.get_boundingbox())
+        out = []
+        keys = []
+        for interface, p, d in zip(interfaces, *part.interface_frames()):
+            if not self.engaged_at(part, owner_bb, p, d):
+                out.append((interface, p, d))
+            axis = int(np.argmax(np.abs(d)))
+            if abs(abs(d[axis]) - 1) > 1e-6:
+                keys = None ### found by a ray, not by line: check every time
+            elif keys is not None:
+                keys.extend(self.neighbour_keys(axis, p))
+        if keys is not None and self.index.owner(part) is not None:
+            self.forget(part)
+            self.watched[part] = keys
+            for key in keys:
+                self.interest[key].add(part)
+            self.open[part] = (version, out)
+        return out
+
+def parts_of(member):
+    ### member and everything inside it
+    out = [member]
+    if member.iscontainer():
+        for thing in member.things:
+            out.extend(parts_of(thing))
+    return out
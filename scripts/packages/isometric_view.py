@@ -217,9 +217,9 @@ class IsoView:
                             for thing in self.scene.selected.ungroup():
                                 thing.render(self.scene.view, selected=False)
                         else:                                          ### cant drag the axis
-                            for thing in self.scene.things:            ### grab containing group
-                                if thing.contains(clicked):
-                                    clicked = thing
+                            member = self.scene.index.owner(clicked)   ### grab containing group
+                            if member is not None:
+                                clicked = member
                             if self.scene.selected.contains(clicked):
                                 ### already toggle selected status for clicked part
                                 ### unless dragging starts??
@@ -287,7 +287,9 @@ class IsoView:
             corner_1 = (np.array([event.x, event.y]) - self.offset) / self.scale
             corner_2 = (self.click_pt - self.offset) / self.scale
             selection_box = Rectangle(corner_1, corner_2)
-            for thing in self.scene:
+            lo = [selection_box.left, selection_box.bottom]
+            hi = [selection_box.right, selection_box.top]
+            for thing in self.scene.index.projected(self.B, lo, hi): ### only things whose box reaches the rectangle
                 verts = thing.get_verts()
                 verts = (self.B.T @ verts.T).T 
                 if selection_box.contains(verts):
@@ -14,6 +14,8 @@ from datetime import datetime
 from typing import Dict, List, Any, Optional
 
 from packages import parts_db
+from packages import assets
+from packages.database import DEFAULT_BATCH_SIZE, Eq, In
 
 
 def export_library_to_json(library: parts_db.Library, 
@@ -22,100 +24,18 @@ def export_library_to_json(library: parts_db.Library,
     """
     Export a parts library to JSON format.
     
+    Parts are streamed from the database to the file one at a time, so
+    memory use does not grow with the size of the library.
+    
     Args:
         library: The Library object to export
         output_path: Path where the JSON file should be saved
         description: Optional description for the library
     
     Returns:
-        Dictionary containing the exported data
+        Dictionary containing the exported library metadata, interface
+        definitions and the number of exported parts ("part_count")
     """
-    # Get all parts from the library
-    parts_records = library.part_list()
-    
-    # Build the parts list
-    parts_list = []
-    for record in parts_records:
-        part_dict = {
-            "name": record.Name,
-            "wireframe": record.Wireframe,
-            "stl_filename": record.STL_filename,
-            "url": record.URL,
-            "color": record.Color,
-            "dimensions": {
-                "dim1": record.Dim1,
-                "dim2": record.Dim2
-            },
-            "interfaces": []
-        }
-        
-        # Add interfaces
-        for i in range(1, 7):
-            interface_name = getattr(record, f"Interface_0{i}")
-            if interface_name and interface_name != "NA":
-                part_dict["interfaces"].append(interface_name)
-        
-        # Handle pricing
-        if record.Price == "{piecewise}":
-            part_dict["price"] = "piecewise"
-            part_dict["length"] = None
-            
-            # Get piecewise pricing data
-            piecewise_records = parts_db.piecewise_table.select(
-                library.db, 
-                where=f'PartName="{record.Name}"'
-            )
-            
-            piecewise_pricing = []
-            for pw_record in piecewise_records:
-                piecewise_pricing.append({
-                    "length_mm": pw_record.Length,
-                    "price": pw_record.Price
-                })
-            
-            # Sort by length
-            piecewise_pricing.sort(key=lambda x: x["length_mm"])
-            part_dict["piecewise_pricing"] = piecewise_pricing
-        else:
-            # Fixed price
-            part_dict["price"] = float(record.Price)
-            part_dict["length"] = record.Length
-        
-        # Enhanced metadata (optional fields with defaults)
-        # Material (default: aluminum)
-        part_dict["material"] = "aluminum"
-        
-        # Weight calculation (kg) - aluminum density: 2.7 g/cm³
-        # For extrusions: volume = dim1 * dim2 * length (all in mm)
-        # Convert to cm³: / 1000, then to grams: * 2.7, then to kg: / 1000
-        if part_dict["length"]:
-            volume_cm3 = (record.Dim1 * record.Dim2 * part_dict["length"]) / 1000
-            weight_kg = (volume_cm3 * 2.7) / 1000
-            part_dict["weight_kg"] = round(weight_kg, 4)
-        else:
-            part_dict["weight_kg"] = None
-        
-        # Categories and tags
-        part_dict["category"] = "extrusion"  # Default category
-        part_dict["tags"] = []  # Empty tags by default
-        
-        # Auto-tag based on name
-        name_lower = record.Name.lower()
-        if "corner" in name_lower:
-            part_dict["tags"].append("corner")
-            part_dict["category"] = "connector"
-        if "2020" in name_lower:
-            part_dict["tags"].append("2020")
-        if "3030" in name_lower:
-            part_dict["tags"].append("3030")
-        if "alex" in name_lower:
-            part_dict["tags"].append("profile")
-        
-        # Custom fields (extensible)
-        part_dict["custom_fields"] = {}
-        
-        parts_list.append(part_dict)
-    
     # Build interface definitions
     interface_definitions = {}
     for interface_name, interface_data in parts_db.interface_table.items():
@@ -125,23 +45,132 @@ def export_library_to_json(library: parts_db.Library,
                 "direction": list(interface_data[3:6])
             }
     
-    # Build the complete export structure
     export_data = {
         "library_name": library.name,
         "library_version": "1.0",
         "export_date": datetime.now().strftime("%Y-%m-%d"),
         "description": description or f"Alex CAD Parts Library - {library.name}",
-        "parts": parts_list,
-        "interface_definitions": interface_definitions
     }
     
-    # Write to file
+    # Write to file, same layout as json.dump(..., indent=4)
+    part_count = 0
     with open(output_path, 'w') as f:
-        json.dump(export_data, f, indent=4)
-    
+        f.write('{\n')
+        for key, value in export_data.items():
+            f.write(f'    {json.dumps(key)}: {_indent_json(value, 4)},\n')
+        f.write('    "parts": [')
+        for record in library.iter_parts():
+            if part_count > 0:
+                f.write(',')
+            f.write('\n        ' + _indent_json(record_to_part_dict(library, record), 8))
+            part_count += 1
+        f.write('\n    ]' if part_count > 0 else ']')
+        f.write(f',\n    "interface_definitions": {_indent_json(interface_definitions, 4)}\n}}')
+    
+    export_data["interface_definitions"] = interface_definitions
+    export_data["part_count"] = part_count
     return export_data
 
 
+def _indent_json(value: Any, indent: int) -> str:
+    """Serialize value with indent=4, nested ``indent`` spaces deep."""
+    return json.dumps(value, indent=4).replace('\n', '\n' + ' ' * indent)
+
+
+def record_to_part_dict(library: parts_db.Library, record) -> Dict[str, Any]:
+    """
+    Convert a Part table record to its JSON dictionary.
+    
+    Args:
+        library: The Library the record belongs to (for piecewise pricing)
+        record: Part table record
+    
+    Returns:
+        Part dictionary
+    """
+    part_dict = {
+        "name": record.Name,
+        "wireframe": record.Wireframe,
+        "stl_filename": record.STL_filename,
+        "url": record.URL,
+        "color": record.Color,
+        "dimensions": {
+            "dim1": record.Dim1,
+            "dim2": record.Dim2
+        },
+        "interfaces": []
+    }
+
+    # Add interfaces
+    for i in range(1, 7):
+        interface_name = getattr(record, f"Interface_0{i}")
+        if interface_name and interface_name != "NA":
+            part_dict["interfaces"].append(interface_name)
+
+    # Handle pricing
+    if record.Price == "{piecewise}":
+        part_dict["price"] = "piecewise"
+        part_dict["length"] = None
+
+        # Get piecewise pricing data
+        piecewise_records = parts_db.piecewise_table.select(
+            library.db, 
+            where=Eq('PartName', record.Name),
+            order_by='Length',
+            columns=('Length', 'Price')
+        )
+
+        piecewise_pricing = []
+        for pw_record in piecewise_records:
+            piecewise_pricing.append({
+                "length_mm": pw_record.Length,
+                "price": pw_record.Price
+            })
+
+        # Sort by length
+        piecewise_pricing.sort(key=lambda x: x["length_mm"])
+        part_dict["piecewise_pricing"] = piecewise_pricing
+    else:
+        # Fixed price
+        part_dict["price"] = float(record.Price)
+        part_dict["length"] = record.Length
+
+    # Enhanced metadata (optional fields with defaults)
+    # Material (default: aluminum)
+    part_dict["material"] = "aluminum"
+
+    # Weight calculation (kg) - aluminum density: 2.7 g/cm³
+    # For extrusions: volume = dim1 * dim2 * length (all in mm)
+    # Convert to cm³: / 1000, then to grams: * 2.7, then to kg: / 1000
+    if part_dict["length"]:
+        volume_cm3 = (record.Dim1 * record.Dim2 * part_dict["length"]) / 1000
+        weight_kg = (volume_cm3 * 2.7) / 1000
+        part_dict["weight_kg"] = round(weight_kg, 4)
+    else:
+        part_dict["weight_kg"] = None
+
+    # Categories and tags
+    part_dict["category"] = "extrusion"  # Default category
+    part_dict["tags"] = []  # Empty tags by default
+
+    # Auto-tag based on name
+    name_lower = record.Name.lower()
+    if "corner" in name_lower:
+        part_dict["tags"].append("corner")
+        part_dict["category"] = "connector"
+    if "2020" in name_lower:
+        part_dict["tags"].append("2020")
+    if "3030" in name_lower:
+        part_dict["tags"].append("3030")
+    if "alex" in name_lower:
+        part_dict["tags"].append("profile")
+
+    # Custom fields (extensible)
+    part_dict["custom_fields"] = {}
+    
+    return part_dict
+
+
 def import_library_from_json(json_path: str, 
                              target_library: parts_db.Library,
                              overwrite: bool = False,
@@ -153,7 +182,7 @@ def import_library_from_json(json_path: str,
         json_path: Path to the JSON file
         target_library: The Library object to import into
         overwrite: If True, overwrite existing parts with the same name
-        source_library: Optional source library to copy files from (defaults to Main)
+        source_library: Optional source library to link files from (defaults to Main)
     
     Returns:
         Number of parts imported
@@ -162,8 +191,6 @@ def import_library_from_json(json_path: str,
         ValueError: If JSON structure is invalid
         FileNotFoundError: If JSON file doesn't exist
     """
-    import shutil
-    
     # Load JSON
     with open(json_path, 'r') as f:
         data = json.load(f)
@@ -175,26 +202,19 @@ def import_library_from_json(json_path: str,
     if source_library is None:
         source_library = parts_db.Main
     
-    parts_imported = 0
+    existing_names = set(target_library.get_names())
+    
+    part_rows = []
+    piecewise_rows = []
+    piecewise_names = []
+    imported_parts = []
     
     for part_data in data["parts"]:
         # Check if part already exists
-        existing = parts_db.part_table.select(
-            target_library.db,
-            where=f'Name="{part_data["name"]}"'
-        )
-        
-        if existing and not overwrite:
+        if part_data["name"] in existing_names and not overwrite:
             print(f"Skipping {part_data['name']} - already exists")
             continue
         
-        # Delete existing if overwriting
-        if existing and overwrite:
-            parts_db.part_table.delete(
-                target_library.db,
-                where=f'Name="{part_data["name"]}"'
-            )
-        
         # Prepare part values for database
         values = [
             part_data["name"],
@@ -212,64 +232,77 @@ def import_library_from_json(json_path: str,
         interfaces = part_data.get("interfaces", [])
         values.extend(interfaces)
         values.extend(["NA"] * (6 - len(interfaces)))
-        
-        # Insert part
-        parts_db.part_table.insert(target_library.db, [values])
+        part_rows.append(values)
         
         # Handle piecewise pricing
         if part_data["price"] == "piecewise":
-            # Delete existing piecewise data
-            parts_db.piecewise_table.delete(
-                target_library.db,
-                where=f'PartName="{part_data["name"]}"'
-            )
-            
-            # Insert new piecewise data
-            piecewise_values = [
+            piecewise_names.append(part_data["name"])
+            piecewise_rows.extend(
                 (part_data["name"], tier["length_mm"], tier["price"])
                 for tier in part_data["piecewise_pricing"]
-            ]
-            parts_db.piecewise_table.insert(target_library.db, piecewise_values)
-        
-        # Copy STL file if it exists
+            )
+        imported_parts.append(part_data)
+    
+    # Insert parts and their piecewise prices in a single transaction,
+    # replacing existing ones when overwriting
+    db = target_library.db
+    on_conflict = 'replace' if overwrite else 'ignore'
+    db.commit()
+    db.execute('BEGIN IMMEDIATE')
+    try:
+        parts_db.part_table.insert_many(db, part_rows, on_conflict=on_conflict, commit=False)
+        # Replace piecewise data of the imported piecewise parts, a chunk of
+        # names at a time to stay under sqlite's limit on parameters
+        for start in range(0, len(piecewise_names), DEFAULT_BATCH_SIZE):
+            parts_db.piecewise_table.delete(
+                db,
+                where=In('PartName', piecewise_names[start:start + DEFAULT_BATCH_SIZE]),
+                commit=False
+            )
+        parts_db.piecewise_table.insert_many(db, piecewise_rows, on_conflict='ignore', commit=False)
+        db.commit()
+    except:
+        db.rollback()
+        raise
+    
+    for part_data in imported_parts:
+        # Link STL file if it exists (assets are shared, not copied)
         if part_data["stl_filename"]:
             source_stl = os.path.join(source_library.stl_dir, part_data["stl_filename"])
             target_stl = os.path.join(target_library.stl_dir, part_data["stl_filename"])
             
             if os.path.exists(source_stl) and not os.path.exists(target_stl):
                 try:
-                    shutil.copy2(source_stl, target_stl)
-                    print(f"Copied STL: {part_data['stl_filename']}")
+                    assets.link(source_stl, target_stl)
+                    print(f"Linked STL: {part_data['stl_filename']}")
                 except Exception as e:
-                    print(f"Warning: Could not copy STL {part_data['stl_filename']}: {e}")
+                    print(f"Warning: Could not link STL {part_data['stl_filename']}: {e}")
         
-        # Copy thumbnail if it exists
+        # Link thumbnail if it exists
         thumbnail_name = part_data["name"].replace(" ", "") + ".png"
         source_thumb = os.path.join(source_library.thumbnail_dir, thumbnail_name)
         target_thumb = os.path.join(target_library.thumbnail_dir, thumbnail_name)
         
         if os.path.exists(source_thumb) and not os.path.exists(target_thumb):
             try:
-                shutil.copy2(source_thumb, target_thumb)
-                print(f"Copied thumbnail: {thumbnail_name}")
+                assets.link(source_thumb, target_thumb)
+                print(f"Linked thumbnail: {thumbnail_name}")
             except Exception as e:
-                print(f"Warning: Could not copy thumbnail {thumbnail_name}: {e}")
+                print(f"Warning: Could not link thumbnail {thumbnail_name}: {e}")
         
-        # Copy wireframe if it's a custom one
+        # Link wireframe if it's a custom one
         wireframe_name = part_data["wireframe"] + ".npy"
         source_wf = os.path.join(source_library.wireframe_dir, wireframe_name)
         target_wf = os.path.join(target_library.wireframe_dir, wireframe_name)
         
         if os.path.exists(source_wf) and not os.path.exists(target_wf):
             try:
-                shutil.copy2(source_wf, target_wf)
-                print(f"Copied wireframe: {wireframe_name}")
+                assets.link(source_wf, target_wf)
+                print(f"Linked wireframe: {wireframe_name}")
             except Exception as e:
-                print(f"Warning: Could not copy wireframe {wireframe_name}: {e}")
-        
-        parts_imported += 1
+                print(f"Warning: Could not link wireframe {wireframe_name}: {e}")
     
-    return parts_imported
+    return len(imported_parts)
 
 
 def validate_json_structure(data: Dict[str, Any]) -> bool:
@@ -1,4 +1,3 @@
-import shutil
 import glob
 import re
 import tkinter as tk
@@ -12,6 +11,8 @@ import os.path
 import numpy as np
 import sqlite3
 import csv
+import threading
+from collections import OrderedDict
 import webbrowser
 from PIL import ImageTk, Image
 
@@ -24,9 +25,12 @@ from packages.util import curry
 from packages import things
 from packages import wireframes
 from packages import database
-from packages.database import String, Integer, Float, Table, Column
+from packages.database import String, Integer, Float, Table, Column, Eq, Like
 from packages.constants import DEG, alex_scad, bgcolor, openscad_path, part_libraries_dir
-from packages.interpolate import interp1d
+from packages import pricing
+from packages import thumbnails
+from packages import assets
+from packages import stl_io
 from packages.mylistbox import listbox
 from packages import piecewise_linear_cost_model as cm
 
@@ -58,32 +62,55 @@ def assimilate_stl(lib, part_name, fn, copy_only=False):
     else:
         new_fn = f'{lib.stl_dir}/{part_name}.stl'
     if not os.path.exists(new_fn):
-        thing = things.STL(fn)
-        pts = thing.mesh.vectors.reshape((-1, 3))
-        maxs = np.max(pts, axis=0)
-        mins = np.min(pts, axis=0)
-        dims = maxs - mins
-        mid = (maxs + mins) / 2.
+        stl = stl_io.load(fn)
         if copy_only:
-            pass
+            stl_io.write(new_fn, stl.vectors, stl.normals)
         else:
-            thing.mesh.vectors = (thing.mesh.vectors - mid) / dims + [0, 0, .5]
-        thing.mesh.save(new_fn)
+            mins, maxs = stl.bounds()
+            dims = maxs - mins
+            mid = (maxs + mins) / 2.
+            stl_io.write(new_fn, (stl.vectors - mid) / dims + [0, 0, .5])
     return os.path.split(new_fn)[1]
 
 #assimilate_stl(lib, 'junk', 'rattleCAD_road_20150823.stl');here
     
-db = sqlite3.connect(db_fn)
+db_connections = database.ConnectionManager()
+def connect(db_fn):
+    '''
+    Return the calling thread's connection to db_fn.
+    '''
+    return db_connections.connect(db_fn)
+    
+
+class ProxyDB:
+    def __init__(self, fn):
+        ### connection is opened lazily by the first query of each thread
+        self.fn = fn
+    def executemany(self, *args, **kw):
+        return connect(self.fn).executemany(*args, **kw)
+    
+    def execute(self, *args, **kw):
+        return connect(self.fn).execute(*args, **kw)
+
+    def commit(self, *args, **kw):
+        return connect(self.fn).commit(*args, **kw)
+
+    def rollback(self, *args, **kw):
+        return connect(self.fn).rollback(*args, **kw)
+
+    def data_version(self):
+        '''
+        Token that changes whenever this or any other connection commits to the file.
+        '''
+        db = connect(self.fn)
+        return (id(db), db.execute('PRAGMA data_version').fetchone()[0], db.total_changes)
+
+db = ProxyDB(db_fn) ### Main library database
 
 piecewise_table = Table("Piecewise",
                         Column("PartName", String()),
                         Column("Length", Integer()),
                         Column("Price", Float()))
-piecewise_table.create(db)
-try:
-    piecewise_table.create_index(db, ("PartName", "Length"), unique=True)
-except sqlite3.OperationalError:
-    pass
 part_table = Table('Part',
                    Column('Name',String(), UNIQUE=True),
                    Column('Wireframe', String()),
@@ -101,7 +128,82 @@ part_table = Table('Part',
                    Column('Interface_05', String()),
                    Column('Interface_06', String())
 )
-part_table.create(db)
+
+### FTS5 index kept in sync with Part by triggers.  rowid is the Part rowid.
+### Searches match and rank against it; without FTS5 they LIKE the same columns.
+part_search_columns = ('Name', 'Wireframe', 'URL', 'Color', 'Dims')
+def part_search_values(row):
+    return (f'{row}.Name', f'{row}.Wireframe', f'{row}.URL', f'{row}.Color',
+            f"{row}.Dim1 || 'x' || {row}.Dim2 || 'x' || {row}.Length")
+def part_search_insert(row):
+    return 'INSERT INTO PartSearch(rowid, %s) VALUES (%s.rowid, %s);' % (
+        ','.join(part_search_columns), row, ','.join(part_search_values(row)))
+part_search_sql = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS PartSearch USING fts5(%s, tokenize=\"unicode61 tokenchars '.'\")" % (
+        ','.join(part_search_columns)),
+    'CREATE TRIGGER IF NOT EXISTS PartSearchInsert AFTER INSERT ON Part BEGIN %s END' % part_search_insert('new'),
+    'CREATE TRIGGER IF NOT EXISTS PartSearchDelete AFTER DELETE ON Part BEGIN '
+    'DELETE FROM PartSearch WHERE rowid=old.rowid; END',
+    'CREATE TRIGGER IF NOT EXISTS PartSearchUpdate AFTER UPDATE ON Part BEGIN '
+    'DELETE FROM PartSearch WHERE rowid=old.rowid; %s END' % part_search_insert('new'),
+    'INSERT INTO PartSearch(rowid, %s) SELECT rowid, %s FROM Part' % (
+        ','.join(part_search_columns), ','.join(part_search_values('Part'))),
+]
+
+def has_fts5(db):
+    ### not every sqlite build has FTS5, and sqlite_compile_option_used may be left out too
+    try:
+        db.execute('CREATE VIRTUAL TABLE temp.fts5_probe USING fts5(x)')
+    except sqlite3.OperationalError:
+        return False
+    db.execute('DROP TABLE temp.fts5_probe')
+    return True
+
+def has_part_search(db, schema='main'):
+    return db.execute("SELECT 1 FROM %s.sqlite_master WHERE name='PartSearch'" % schema).fetchone() is not None
+
+def ensure_part_search(db):
+    '''
+    Create and fill the PartSearch index if it is missing and this sqlite
+    has FTS5.  It is not a numbered migration: a database opened without
+    FTS5 gets its index the first time a build with FTS5 opens it.
+    Returns True if the index exists.
+    '''
+    if has_part_search(db):
+        return True
+    if not has_fts5(db):
+        return False ### search still works, unranked
+    db.commit()
+    db.execute('BEGIN IMMEDIATE')
+    try:
+        ### re-check under the write lock, another connection may have built it
+        if not has_part_search(db):
+            for sql in part_search_sql:
+                db.execute(sql)
+        db.commit()
+    except:
+        db.rollback()
+        raise
+    return True
+
+### Parts.db schema history.  Append new steps, never edit applied ones.
+migrations = [
+    database.Migration(1, 'Part and Piecewise tables',
+                       piecewise_table.create,
+                       part_table.create,
+                       lambda db: piecewise_table.create_index(db, ("PartName", "Length"), unique=True)),
+    database.Migration(2, 'Covering indexes for price tables and asset lookups',
+                       lambda db: piecewise_table.create_index(db, ("PartName", "Length", "Price")),
+                       lambda db: part_table.create_index(db, ("Wireframe",), name="PartWireframe"),
+                       lambda db: part_table.create_index(db, ("STL_filename",), name="PartSTL_filename")),
+]
+
+def initialize_db(db):
+    '''
+    Bring a Parts.db up to date: apply the migrations, then the search index.
+    '''
+    database.migrate(db, migrations)
+    ensure_part_search(db)
 @util.cacheable
 def lookup_interface(name):
     if name not in interface_table:
@@ -111,22 +213,21 @@ def lookup_interface(name):
     direction = np.array(record[3:])
     return Interface(name, hotspot, direction)
 
-def load_piecewise(csv_fn):
+def load_piecewise(csv_fn, db=db):
     csv_file = open(csv_fn)
     data = list(csv.reader(csv_file))
     csv_file.close()
     header = data[0]
     data = data[1:]
     data = [l for l in data if len(l) == 3]
-    piecewise_table.insert(db, data)
+    return piecewise_table.insert(db, data)
 
 mydir = os.path.split(os.path.abspath(__file__))[0]
 piecewise_csv_fn = os.path.join(mydir, 'piecewise.csv')
-load_piecewise(piecewise_csv_fn)
 
 mydir = os.path.split(os.path.abspath(__file__))[0]
 csv_fn = os.path.join(mydir, 'parts.csv')
-def load_parts(csv_fn):
+def load_parts(csv_fn, db=db):
     csv_file = open(csv_fn)
     data = list(csv.reader(csv_file))
     csv_file.close()
@@ -142,13 +243,23 @@ def load_parts(csv_fn):
                 assert interface
                 # print('Interface:', interface.hotspot, interface.direction)
     
-    part_table.insert(db, data)
+    return part_table.insert(db, data)
+
+def seed_main_library(parts_csv_fn=csv_fn, piecewise_csv_fn=piecewise_csv_fn):
+    '''
+    One-time setup: create/upgrade Main/Parts.db and load the bundled csv
+    catalogs into it.  Existing rows are kept.
+    '''
+    initialize_db(db)
+    n_parts = load_parts(parts_csv_fn, db)
+    n_prices = load_piecewise(piecewise_csv_fn, db)
+    return n_parts, n_prices
 
 
 #print(part_table.select(db))
 
 def get(db, name):
-    record = part_table.select(db, where=f'Name="{name}"') ## name is unique
+    record = part_table.select(db, where=Eq('Name', name)) ## name is unique
     if len(record) == 0:
         raise ValueError(f"No item named {name}.")
     return record[0]
@@ -186,6 +297,8 @@ class Interface:
         '''
         if group is None:
             group = things.TheScene
+        if getattr(group, 'engagement', None) is not None:
+            return group.engagement.engaged(owner, self)
             
         p, d = self.get_pos_dir(owner)
         i = np.argmin(abs(d)) ### most orthongonal axis
@@ -214,28 +327,281 @@ class Interface:
         return False
 
 
-db_connections = {}
-def connect(db_fn):
-    if db_fn not in db_connections:
-        db = sqlite3.connect(db_fn)
-        db_connections[db_fn] = db
-    return db_connections[db_fn]
-    
+class Catalog:
+    '''
+    In-memory copy of a library's Part and Piecewise tables.
 
-class ProxyDB:
-    def __init__(self, fn):
-        connect(fn)
-        self.fn = fn
-    def executemany(self, *args, **kw):
-        return connect(self.fn).executemany(*args, **kw)
-    
-    def execute(self, sql):
-        return connect(self.fn).execute(sql)
+    Records are indexed by name and piecewise prices are kept as sorted
+    numpy arrays.  Every lookup compares the database data_version and
+    reloads only when something was committed since the last load.
+    '''
+    def __init__(self, db):
+        self.db = db
+        self.version = None
+        self.lock = threading.Lock()
+        self.state = ({}, {}) ### (records, price_tables), replaced whole, never mutated
+
+    def refresh(self):
+        '''
+        Return the current (records, price_tables), reloading them if the
+        database changed.  Callers read both from the one tuple.
+        '''
+        with self.lock:
+            version = self.db.data_version()
+            if version != self.version:
+                self.state = self.load()
+                self.version = version
+            return self.state
+
+    def load(self):
+        records = {r.Name: r for r in part_table.iter_select(self.db)}
+        rows = {}
+        for r in piecewise_table.iter_select(self.db, order_by=('PartName', 'Length')):
+            rows.setdefault(r.PartName, []).append((r.Length, r.Price))
+        price_tables = {}
+        for name, table in rows.items():
+            lengths, prices = np.array(table, dtype=float).T
+            lengths.setflags(write=False)
+            prices.setflags(write=False)
+            price_tables[name] = (lengths, prices)
+        return records, price_tables
+
+    def names(self):
+        records, price_tables = self.refresh()
+        return list(records)
+
+    def part_list(self):
+        records, price_tables = self.refresh()
+        return list(records.values())
+
+    def get_record(self, name):
+        records, price_tables = self.refresh()
+        if name not in records:
+            raise ValueError(f"No part named {name}.")
+        return records[name]
+
+    def price_table(self, name):
+        '''
+        Return (lengths, prices) sorted by length; empty arrays if name has none.
+        '''
+        records, price_tables = self.refresh()
+        return price_tables.get(name, (np.array([]), np.array([])))
+
+catalogs = {}
+def get_catalog(lib):
+    '''
+    Return the catalog shared by every Library object opened on lib's database.
+    '''
+    if lib.db_filename not in catalogs:
+        catalogs[lib.db_filename] = Catalog(lib.db)
+    return catalogs[lib.db_filename]
+
+search_filter_columns = {'len': 'Length',
+                         'length': 'Length',
+                         'dim1': 'Dim1',
+                         'dim2': 'Dim2',
+                         'x': 'Dim1',
+                         'y': 'Dim2',
+                         'price': 'Price'}
+search_filter_re = re.compile(r'^([a-z0-9_]+)(<=|>=|<|>|=)([-+]?\d*\.?\d+)$')
+
+def search_filter(column, op, value, schema='main'):
+    numeric = "typeof(Part.%s) IN ('integer', 'real')" % column
+    if column == 'Length':
+        ### cut-to-length parts match when any priced length satisfies op
+        piecewise = '%s.Piecewise' % schema
+        if op == '=':
+            tier = '(SELECT %%s(Length) FROM %s WHERE PartName=Part.Name)' % piecewise
+            priced = '? BETWEEN %s AND %s' % (tier % 'MIN', tier % 'MAX')
+        else:
+            priced = 'EXISTS (SELECT 1 FROM %s WHERE PartName=Part.Name AND Length%s?)' % (piecewise, op)
+        sql = 'CASE WHEN %s THEN Part.Length%s? ELSE %s END' % (numeric, op, priced)
+        return database.Predicate(sql, (value, value))
+    return database.Predicate('%s AND Part.%s%s?' % (numeric, column, op), (value,))
+
+def search_word(word):
+    ### word anywhere in the searched columns; the fallback without FTS5
+    text = " || ' ' || ".join("ifnull(%s, '')" % value for value in part_search_values('Part'))
+    pattern = '%%%s%%' % re.sub(r'([\\%_])', r'\\\1', word)
+    return database.Predicate("(%s) LIKE ? ESCAPE '\\'" % text, (pattern,))
+
+def parse_search(query, schema='main', indexed=True):
+    '''
+    Split a search such as '2020 black len>500' into an FTS5 match
+    expression (each word matched as a prefix of a token) and the filter
+    Predicates every result satisfies: numeric filters on len/length,
+    dim1/x, dim2/y and price.  With indexed=False there is no match
+    expression and each word becomes a substring filter instead.
+    '''
+    words = []
+    filters = []
+    for token in query.split():
+        match = search_filter_re.match(token.lower())
+        if match and match.group(1) in search_filter_columns:
+            key, op, value = match.groups()
+            filters.append(search_filter(search_filter_columns[key], op, float(value), schema))
+        elif indexed:
+            words.append('"%s"*' % token.replace('"', '""'))
+        else:
+            filters.append(search_word(token))
+    return ' '.join(words), filters
+
+def search_select(query, schema='main', indexed=True):
+    '''
+    Return (sql, params) selecting the Part columns of schema plus a Rank
+    column.  The words are matched through PartSearch and ranked by bm25
+    (lower is better); pass indexed=False for a library without the index
+    to match them as substrings instead, unranked (Rank 0).
+    '''
+    match, filters = parse_search(query, schema, indexed)
+    cols = ','.join('Part.%s' % col for col in part_table.colnames())
+    params = ()
+    if match:
+        sql = ('SELECT %s, bm25(PartSearch, 10.0, 2.0, 1.0, 1.0, 1.0) AS Rank '
+               'FROM %s.PartSearch JOIN %s.Part AS Part ON Part.rowid=PartSearch.rowid '
+               'WHERE PartSearch MATCH ?' % (cols, schema, schema))
+        params += (match,)
+    else:
+        sql = 'SELECT %s, 0.0 AS Rank FROM %s.Part AS Part WHERE 1' % (cols, schema)
+    for predicate in filters:
+        sql += ' AND (%s)' % predicate.sql
+        params += predicate.params
+    return sql, params
+
+def search_parts(db, query, limit=None):
+    '''
+    Return Part records matching query, best matches (by bm25, name hits
+    weighted highest) first.  Without words, or without a search index,
+    the matches are sorted by name.
+    '''
+    sql, params = search_select(query, indexed=has_part_search(db))
+    sql += ' ORDER BY Rank, Part.Name'
+    if limit is not None:
+        sql += ' LIMIT ?'
+        params += (limit,)
+    make = part_table.row_type()._make
+    return [make(row[:-1]) for row in db.execute(sql, params).fetchall()]
+
+class Federation:
+    '''
+    Read-only view of every library under root.  The Parts.db files are
+    ATTACHed to one in-memory connection per thread, so questions about all
+    libraries ("which libraries have part X?") cost a single UNION ALL query
+    instead of a Library object and connection per library.
+    '''
+    def __init__(self, root=part_libraries_dir):
+        self.root = root
+        self.connections = database.ConnectionManager()
+
+    def library_names(self):
+        '''
+        Names of the library directories holding a Parts.db, Main first.
+        '''
+        names = [os.path.basename(os.path.dirname(fn))
+                 for fn in glob.glob(os.path.join(self.root, '*', 'Parts.db'))]
+        names.sort(key=lambda name: (name != 'Main', name.lower()))
+        return names
+
+    def db_filename(self, name):
+        return os.path.join(self.root, name, 'Parts.db')
+
+    def attach(self, names):
+        '''
+        Make names (and only names) attached to this thread's connection;
+        return {library name: schema}.
+        '''
+        db = self.connections.connect(':memory:')
+        wanted = {os.path.realpath(self.db_filename(name)): name for name in names}
+        attached = {}
+        for seq, schema, fn in db.execute('PRAGMA database_list').fetchall():
+            if schema in ('main', 'temp'):
+                continue
+            if fn in wanted:
+                attached[wanted[fn]] = schema
+            else:
+                db.execute('DETACH DATABASE %s' % schema)
+        for fn, name in wanted.items():
+            if name not in attached:
+                schema = 'lib%d' % len(attached)
+                while schema in attached.values():
+                    schema += '_'
+                db.execute('ATTACH DATABASE ? AS %s' % schema, (fn,))
+                if (self.schema_version(db, schema) < max(m.version for m in migrations) or
+                    not has_part_search(db, schema)):
+                    ### written by an older version; upgrade through a normal connection
+                    initialize_db(ProxyDB(self.db_filename(name)))
+                attached[name] = schema
+        return attached
+
+    def schema_version(self, db, schema):
+        if not db.execute("SELECT 1 FROM %s.sqlite_master WHERE name='schema_version'" % schema).fetchone():
+            return 0
+        return db.execute('SELECT MAX(Version) FROM %s.schema_version' % schema).fetchone()[0] or 0
+
+    def union(self, select, params=(), names=None):
+        '''
+        Run select, with {schema} standing for each library's schema, against
+        the named libraries (default all) and return the rows with the
+        library name prepended.  select may instead be a callable returning
+        (sql, params) for a schema, when the query differs per library.
+        '''
+        if names is None:
+            names = self.library_names()
+        db = self.connections.connect(':memory:')
+        if hasattr(db, 'getlimit'):
+            limit = db.getlimit(sqlite3.SQLITE_LIMIT_ATTACHED)
+        else:
+            limit = 10 ### sqlite's default
+        out = []
+        for i in range(0, len(names), limit):
+            group = names[i:i + limit]
+            attached = self.attach(group)
+            selects = []
+            group_params = ()
+            for name in group:
+                if callable(select):
+                    sql, select_params = select(attached[name])
+                else:
+                    sql, select_params = select.format(schema=attached[name]), params
+                selects.append('SELECT ?, * FROM (%s)' % sql)
+                group_params += (name,) + tuple(select_params)
+            sql = ' UNION ALL '.join(selects)
+            out.extend(db.execute(sql, group_params).fetchall())
+        return out
+
+    def part_counts(self):
+        return dict(self.union('SELECT COUNT(*) FROM {schema}.Part'))
+
+    def find_part(self, name):
+        '''
+        Return the names of the libraries that have a part called name.
+        '''
+        return [lib for lib, _ in self.union('SELECT Name FROM {schema}.Part WHERE Name=?', (name,))]
+
+    def search(self, query, limit=None):
+        '''
+        Search every library; return (library name, Part record) pairs, best
+        matches first.  Ranks come from each library's own bm25 statistics.
+        '''
+        db = self.connections.connect(':memory:')
+        suffix = ' ORDER BY Rank, Part.Name'
+        if limit is not None:
+            suffix += ' LIMIT %d' % limit
+        def select(schema):
+            sql, params = search_select(query, schema, has_part_search(db, schema))
+            return sql + suffix, params
+        rows = self.union(select)
+        rows.sort(key=lambda row: (row[-1], row[1]))
+        if limit is not None:
+            rows = rows[:limit]
+        make = part_table.row_type()._make
+        return [(row[0], make(row[1:-1])) for row in rows]
+
+    def close(self):
+        self.connections.close()
+
+federation = Federation()
 
-    def commit(self, *args, **kw):
-        return connect(self.fn).commit(*args, **kw)
-    
-    
 class Library:
     def __init__(self, library_name):
         self.name = library_name
@@ -243,8 +609,9 @@ class Library:
         self.dir = os.path.join(part_libraries_dir, self.name)
         self.db_filename = os.path.join(self.dir, 'Parts.db')
         self.wireframe_dir = os.path.join(self.dir, 'Wireframes')
+        self.wireframe_pack = os.path.join(self.dir, 'Wireframes.pack')
         self.thumbnail_dir = os.path.join(self.dir, 'Thumbnails')
-        self.wireframes = {}
+        self.specs = {}
         self.stl_dir = os.path.join(self.dir, 'STL')
         if not os.path.exists(self.dir):
             os.mkdir(self.dir)
@@ -255,164 +622,271 @@ class Library:
             self.db = ProxyDB(self.db_filename)
             self.initialize_db()
             copied_part_name = '2020 Corner Two Way Silver'
+            Main = get_main_library()
             example = Main.get_part(copied_part_name)
             example.saveas(self, 'Example Part')
-            shutil.copyfile(os.path.join(Main.wireframe_dir, 'Cube.npy'),
-                            os.path.join(self.wireframe_dir, 'Cube.npy'))
-            shutil.copyfile(os.path.join(Main.wireframe_dir, 'Cylinder.npy'),
-                            os.path.join(self.wireframe_dir, 'Cylinder.npy'))
-            shutil.copyfile(os.path.join(Main.wireframe_dir, 'Cone.npy'),
-                            os.path.join(self.wireframe_dir, 'Cone.npy'))
-            shutil.copyfile(os.path.join(Main.wireframe_dir, 'Prism.npy'),
-                            os.path.join(self.wireframe_dir, 'Prism.npy'))
+            for npy in ('Cube.npy', 'Cylinder.npy', 'Cone.npy', 'Prism.npy'):
+                assets.link(os.path.join(Main.wireframe_dir, npy),
+                            os.path.join(self.wireframe_dir, npy))
 
         else:
             self.db = ProxyDB(self.db_filename)
+            self.initialize_db()
         
     def delete_part(self, name):
-        part_table.delete(self.db, where=f'Name="{name}"')
+        part_table.delete(self.db, where=Eq('Name', name))
         
     def initialize_db(self):
-        piecewise_table.create(self.db)
-        part_table.create(self.db)
-        piecewise_table.create_index(self.db, ("PartName", "Length"), unique=True)
+        initialize_db(self.db)
+
+    def get_catalog(self):
+        return get_catalog(self)
 
-    def get_names(self, where=''):
-        return [r.Name for r in self.part_list()]
+    def get_names(self, where=None):
+        if where is None:
+            return self.get_catalog().names()
+        return [r.Name for r in self.iter_parts(where=where, columns=('Name',))]
     
-    def part_list(self, where=None):
-        return part_table.select(self.db, where=where)
+    def part_list(self, where=None, columns=None):
+        if where is None and columns is None:
+            return self.get_catalog().part_list()
+        return part_table.select(self.db, where=where, columns=columns)
+
+    def search(self, query, limit=None):
+        return search_parts(self.db, query, limit)
+
+    def iter_parts(self, where=None, columns=None, batch_size=database.DEFAULT_BATCH_SIZE):
+        return part_table.iter_select(self.db, where=where, columns=columns, batch_size=batch_size)
+
+    def part_count(self, where=None):
+        return part_table.count(self.db, where=where)
 
     def get_part(self, part_name):
-        records = part_table.select(self.db, where=f'Name="{part_name}"')
-        if len(records) == 1:
-            out = Part(self, records[0])
-        elif len(records) > 1:
-            raise ValueError(f"More than one part named {part_name}.")
+        return Part(self, self.get_spec(part_name))
+
+    def get_spec(self, name_or_record):
+        '''
+        Return the PartSpec for a part name or record, shared until the
+        catalog reloads.
+        '''
+        if isinstance(name_or_record, str):
+            record = self.get_catalog().get_record(name_or_record)
         else:
-            raise ValueError(f"No part named {part_name}.")
-        return out
+            record = name_or_record
+        spec = self.specs.get(record.Name)
+        if spec is None or spec.record is not record:
+            spec = PartSpec(self, record)
+            self.specs[record.Name] = spec
+        return spec
     
     def get_wireframe_names(self):
+        pack = wireframes.current_pack(self.wireframe_pack, self.wireframe_dir)
+        if pack is not None:
+            return pack.names()
         out = []
-        for fn in glob.glob(os.path.join(self.wireframe_dir, '*.npy')):
+        for fn in wireframes.wireframe_files(self.wireframe_dir):
             name = os.path.split(fn)[1][:-4]
             out.append(name)
         out.sort()
         return out
 
     def get_wireframe(self, name):
-        if name not in self.wireframes:
-            self.wireframes[name] = np.load(os.path.join(self.wireframe_dir, name + '.npy'))
-        return self.wireframes[name]
+        ### read-only and shared across Library objects and PartSpecs
+        pack = wireframes.current_pack(self.wireframe_pack, self.wireframe_dir)
+        if pack is not None and name in pack:
+            return pack.get(name)
+        return wireframes.store.load(os.path.join(self.wireframe_dir, name + '.npy'))
+
+    def pack_wireframes(self):
+        '''
+        Write Wireframes.pack, a single memory mappable file holding every
+        wireframe.  It is used until a wireframe is added or removed.
+        '''
+        return wireframes.pack_directory(self.wireframe_dir, self.wireframe_pack)
     
     def insert(self, values):
         part_table.insert(self.db, values)
 
     def make_thumbnail(self, part):
-        #print('make_thumbnail()::')
-        #print('    ', part.name)
-        #print('    ', part.toscad())
-        f = open(alex_scad, 'w')
-        f.write(part.toscad())
-        f.close()
-        name = ''.join(part.name.split())
-        png = f'{part.lib.thumbnail_dir}/{name}.png'
-        #print('    ', png)
-        os.system(f"{openscad_path} {alex_scad} --imgsize=512,512 -o {png}")
-
-    def make_thumbnails(self):
-        import os
-        part_records = part_table.select(self.db)
-        #print('make_thumbnails()::')
-        for part_record in part_records:
-            #print('    ', part_record.Name)
-            part = Part(part_record.Name)
-            make_thumbnail(part)
-    #make_thumbnails();here
+        png = thumbnails.png_name(part.name)
+        thumbnails.render(part.toscad(), os.path.join(self.thumbnail_dir, png))
+        manifest = thumbnails.load_manifest(self.thumbnail_dir)
+        manifest[png] = self.thumbnail_hash(part)
+        thumbnails.save_manifest(self.thumbnail_dir, manifest)
+
+    def thumbnail_hash(self, part):
+        return thumbnails.content_hash(part.record, part.stl_fn, part.spec.wireframe)
+
+    def make_thumbnails(self, force=False, workers=None):
+        '''
+        Render thumbnails of every part whose record, STL or wireframe
+        changed since its last render, in parallel.
+        Returns (rendered, skipped, failed) as thumbnails.build does.
+        '''
+        jobs = []
+        for name in self.get_names():
+            part = self.get_part(name)
+            jobs.append((thumbnails.png_name(part.name), part.toscad(), self.thumbnail_hash(part)))
+        return thumbnails.build(self.thumbnail_dir, jobs, force=force, workers=workers)
         
-Main = Library('Main')
+def get_main_library():
+    '''
+    Return the Main library, opening it on first use.
+    '''
+    global Main
+    try:
+        return Main
+    except NameError:
+        Main = Library('Main')
+        return Main
+
+libraries = {}
+def get_library(name):
+    '''
+    Return the Library called name, opening it on first use.
+    '''
+    if name == 'Main':
+        return get_main_library()
+    if name not in libraries:
+        libraries[name] = Library(name)
+    return libraries[name]
+
+def __getattr__(name):
+    ### parts_db.Main stays available without opening the database at import
+    if name == 'Main':
+        return get_main_library()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+class PartSpec:
+    '''
+    Catalog data for one part of one library: record, price table, unit
+    wireframe and interfaces.  Treated as immutable and shared by every Part
+    placed from it, so a Part only carries its length, pos and orient.
+    '''
+    __slots__ = ('lib', 'name', 'record', 'price', 'lengths', 'prices', 'min_len', 'max_len',
+                 'dim1', 'dim2', 'fixed_length', 'wireframe', 'stl_fn', 'color', 'url', 'interfaces')
+
+    def __init__(self, lib, record):
+        self.lib = lib
+        self.name = record.Name
+        self.record = record
+        self.price = record.Price
+        if self.price == '{piecewise}':
+            self.lengths, self.prices = lib.get_catalog().price_table(self.name)
+            if len(self.lengths) == 0:
+                self.lengths = np.array([300., 5000.])
+                self.prices = np.array([0., 0.])
+                self.lengths.setflags(write=False)
+                self.prices.setflags(write=False)
+            self.min_len = np.min(self.lengths)
+            self.max_len = np.max(self.lengths)
+        else:
+            self.lengths = ()
+            self.prices = ()
+            self.min_len = self.max_len = None
+        self.dim1 = float(record.Dim1)
+        self.dim2 = float(record.Dim2)
+        self.fixed_length = record.Length != 'NA'
+        try:
+            self.wireframe = lib.get_wireframe(record.Wireframe)
+        except (KeyError, FileNotFoundError):
+            self.wireframe = lib.get_wireframe('Cube')
+        self.stl_fn = os.path.join(lib.stl_dir, record.STL_filename)
+        self.color = record.Color
+        self.url = record.URL
+        interfaces = []
+        for i in range(1, 7):
+            name = record[f'Interface_{i:02d}']
+            if name != 'NA':
+                interfaces.append(lookup_interface(name))
+        self.interfaces = tuple(interfaces)
+
+def spec_attribute(name):
+    return property(lambda self: getattr(self.spec, name))
 
 class Part(things.Thing):
+    lib = spec_attribute('lib')
+    name = spec_attribute('name')
+    record = spec_attribute('record')
+    price = spec_attribute('price')
+    lengths = spec_attribute('lengths')
+    prices = spec_attribute('prices')
+    min_len = spec_attribute('min_len')
+    max_len = spec_attribute('max_len')
+    dim1 = spec_attribute('dim1')
+    dim2 = spec_attribute('dim2')
+    stl_fn = spec_attribute('stl_fn')
+    color = spec_attribute('color')
+    url = spec_attribute('url')
+    interfaces = spec_attribute('interfaces')
+
     def price_function(self, x):
-        return interp1d(self.lengths, self.prices, float(x))
+        return float(pricing.interp(self.lengths, self.prices, x))
         
     def __init__(self, lib, name_or_record, length=1):
-        self.lib = lib
-        if type(name_or_record) == type(''):
-            name = name_or_record
-            records = part_table.select(lib.db, where=f'Name="{name}"')
-            assert len(records) == 1
-            record = records[0]
-            assert record
+        '''
+        name_or_record -- part name, catalog record or PartSpec
+        '''
+        things.Thing.__init__(self)
+        if isinstance(name_or_record, PartSpec):
+            self.spec = name_or_record
         else:
-            record = name_or_record
-            name = record.Name
-        if record:
-            things.Thing.__init__(self)
-            self.name = name
-            self.price = record.Price
-            if self.price == '{piecewise}':
-                result = piecewise_table.select(lib.db, where=f"PartName='{name}'")
-                if len(result) == 0:
-                    self.lengths = np.array([300, 5000])
-                    self.prices = np.array([0, 0])
-                else:
-                    self.lengths = np.array([(r.Length) for r in result])
-                    self.prices = np.array([(r.Price) for r in result])
-                
-                self.min_len = np.min(self.lengths)
-                self.max_len = np.max(self.lengths)
-            else:
-                self.lengths = []
-                self.prices = []
-                #self.price_function = lambda x: interp1d(self.lengths, self.prices, x)
-            self.dim1 = float(record.Dim1)
-            self.dim2 = float(record.Dim2)
-            if record.Length == 'NA':
-                self.length = float(length)
-            else:
-                self.length = float(record.Length)
-            try:
-                wf = self.lib.get_wireframe(record.Wireframe)
-            except KeyError:
-                wf = self.lib.get_wireframe.get('Cube')
-            #print('wf, self.dim1, self.dim2, self.length', wf, self.dim1, self.dim2, self.length)
-            self.wireframe = wf * [self.dim1, self.dim2, self.length]
-            self.stl_fn = os.path.join(lib.stl_dir, record.STL_filename)
-            self.color = record.Color
-            self.url = record.URL
-            self.record = record
-            
-            self.interfaces = []
-            for i in range(1, 7):
-                k = f'Interface_{i:02d}'
-                name = self.record[k]
-                if name != 'NA':
-                    interface = lookup_interface(name)
-                    self.interfaces.append(interface)
+            self.spec = lib.get_spec(name_or_record)
+        if self.spec.fixed_length:
+            self.length = float(self.record.Length)
+        else:
+            self.length = float(length)
+
+    def __getstate__(self):
+        ### catalog data is looked up again on load; the record covers parts since removed
+        state = things.Thing.__getstate__(self)
+        spec = state.pop('spec')
+        state['lib'] = spec.lib.name
+        state['record'] = spec.record
+        return state
+
+    def __setstate__(self, state):
+        state = dict(state)
+        lib = state.pop('lib')
+        record = state.pop('record')
+        if not isinstance(lib, str): ### saved before PartSpec, the whole Library was pickled
+            lib = lib.name
+        for key in PartSpec.__slots__: ### ... and so was the catalog data
+            state.pop(key, None)
+        if os.path.isfile(os.path.join(part_libraries_dir, lib, 'Parts.db')):
+            lib = get_library(lib)
+        else:
+            lib = get_main_library()
+        try:
+            self.spec = lib.get_spec(record.Name)
+        except ValueError:
+            self.spec = PartSpec(lib, record)
+        self.__dict__.update(state)
+
+    @property
+    def wireframe(self):
+        return wireframes.scaled.get(self.spec.wireframe, self.dim1, self.dim2, self.length)
+
     def saveas(self, tolib, name):
         wireframe = self.record.Wireframe
         values = self.get_db_values()
         values[0] = name
         stl_fn = values[2]
-        shutil.copyfile(os.path.join(self.lib.stl_dir, stl_fn),
-                        os.path.join(tolib.stl_dir, stl_fn))
-        shutil.copyfile(os.path.join(self.lib.wireframe_dir, wireframe + '.npy'),
-                        os.path.join(tolib.wireframe_dir, wireframe + '.npy'))
-        shutil.copyfile(os.path.join(self.lib.thumbnail_dir, 'unknown.png'),
-                        os.path.join(tolib.thumbnail_dir, 'unknown.png'))
-        from_thumbnail = f"{''.join(self.name.split())}.png"
-        to_thumbnail = f"{''.join(name.split())}.png"
-        shutil.copyfile(os.path.join(self.lib.thumbnail_dir, from_thumbnail),
-                        os.path.join(tolib.thumbnail_dir, to_thumbnail))
+        assets.link(os.path.join(self.lib.stl_dir, stl_fn),
+                    os.path.join(tolib.stl_dir, stl_fn))
+        assets.link(os.path.join(self.lib.wireframe_dir, wireframe + '.npy'),
+                    os.path.join(tolib.wireframe_dir, wireframe + '.npy'))
+        assets.link(os.path.join(self.lib.thumbnail_dir, 'unknown.png'),
+                    os.path.join(tolib.thumbnail_dir, 'unknown.png'))
+        assets.link(os.path.join(self.lib.thumbnail_dir, thumbnails.png_name(self.name)),
+                    os.path.join(tolib.thumbnail_dir, thumbnails.png_name(name)))
 
         tolib.insert([values])
         if self.price == '{piecewise}':
-            result = piecewise_table.select(self.lib.db, where=f"PartName='{self.name}'")
+            result = piecewise_table.select(self.lib.db, where=Eq('PartName', self.name), order_by='Length')
             if len(result) == 0:
                 raise ValueError('Expected example part to be complete!')
-            values = [(r.Name, r.Length, r.Price) for r in records]
+            values = [(r.PartName, r.Length, r.Price) for r in result]
             piecewise_table.insert(tolib.db, values)
         
     def get_db_values(self):
@@ -427,23 +901,38 @@ class Part(things.Thing):
                   self.dim2] + [face.name for face in self.interfaces] + ['NA' for i in range(6 - len(self.interfaces))]
         return values
     
-    def __rescale_wireframe(self):
-        self.wireframe = self.lib.get_wireframe(self.record.Wireframe) * [float(self.dim1),
-                                                                          float(self.dim2),
-                                                                          float(self.length)]
-        
     def set_length(self, length):
-        if self.record.Length == 'NA':
+        if not self.spec.fixed_length:
             things.Thing.set_length(self, length)
-            self.__rescale_wireframe()
         
-    def get_wireframe(self):
+    def shape_key(self):
+        return self.spec
+
+    def interface_frames(self):
+        '''
+        World hotspots (n, 3) and directions (n, 3) of the interfaces, as
+        Interface.get_pos_dir gives them; kept until the part moves.
+        '''
+        cache = self.__dict__.get('_interfaces')
+        if cache is None or cache[0] != self.version:
+            hotspots = np.array([interface.hotspot for interface in self.interfaces], dtype=float).reshape((-1, 3))
+            directions = np.array([interface.direction for interface in self.interfaces], dtype=float).reshape((-1, 3))
+            cache = (self.version, self.pos + hotspots @ self.orient.T, directions @ self.orient.T)
+            self.__dict__['_interfaces'] = cache
+        return cache[1], cache[2]
+
+    def world_wireframe(self):
         return self.wireframe @ self.orient.T + self.pos
 
+    def get_wireframe(self):
+        return self.world_geometry()[0]
+
     def get_verts(self):
-        wf = self.get_wireframe()
-        keep = np.where(np.logical_not(np.isnan(wf[:,0])))
-        return wf[keep]
+        return self.world_geometry()[1]
+
+    def get_boundingbox(self):
+        mins, maxs = self.world_geometry()[2]
+        return mins.copy(), maxs.copy()
     
     def render(self, view, selected=False):
         view.erase(self)
@@ -455,15 +944,16 @@ class Part(things.Thing):
             width = max([1, np.min([view.get_scale(), 1.5])])
         wireframe = self.get_wireframe()
         view.create_path(self, wireframe, color, width)
-        return ### interfaces are too slow to render on every render :-(
-        for interface in self.interfaces:
-            if not interface.engaged(self): ## too slow
-                p, d = interface.get_pos_dir(self)
-                r = int(abs(d[0] * 255))
-                g = int(abs(d[1] * 255))
-                b = int(abs(d[2] * 255))
-                color = f'#{r:02x}{g:02x}{b:02x}'
-                view.create_line(self, p, p + 5 * d, color, width)
+        scene = getattr(things, 'TheScene', None)
+        if scene is None or scene.index.owner(self) is None:
+            return
+        for interface, p, d in scene.engagement.open_interfaces(self): ### open interfaces, colored by direction
+            r = int(abs(d[0] * 255))
+            g = int(abs(d[1] * 255))
+            b = int(abs(d[2] * 255))
+            color = f'#{r:02x}{g:02x}{b:02x}'
+            view.create_line(self, p, p + 5 * d, color, width)
+        scene.render_engaged(view)
     
     def toscad(self):
         pos = self.pos
@@ -494,7 +984,7 @@ class Part(things.Thing):
         return '\n'.join(out)
 
     def dup(self):
-        out = Part(self.lib, self.name, self.length)
+        out = Part(self.lib, self.spec, self.length)
         out.translate(self.pos)
         out.orient = self.orient.copy()
         return out
@@ -504,8 +994,10 @@ class Part(things.Thing):
         else:
             out = self.price
         return out
-    def tobom(self):
-        return [f'{self.name},{self.dim1},{self.dim2},{self.length},${self.cost():.2f},{self.url}']
+    def tobom(self, cost=None):
+        if cost is None:
+            cost = self.cost()
+        return [f'{self.name},{self.dim1},{self.dim2},{self.length},${cost:.2f},{self.url}']
 
 imgs = [None]
 def url_shortener(url, max_len=40):
@@ -520,13 +1012,13 @@ def PartDialog(parent, select_cb, lib=None):
     import fnmatch
     
     if lib is None:
-        lib = Main
+        lib = get_main_library()
     PartDialog.lib = lib
     
     def get_parts():
-        parts = PartDialog.lib.part_list()
+        parts = PartDialog.lib.part_list(columns=part_table.colnames()[:9])
         if len(parts) > 0:
-            columns = list(parts[0].keys())[:9]
+            columns = list(parts[0].keys())
             data = [[getattr(line, name) for name in columns] for line in parts]
             names = [l[0] for l in data]
             idx = np.argsort(names)
@@ -548,6 +1040,10 @@ def PartDialog(parent, select_cb, lib=None):
     tl = tk.Toplevel(parent)
 
     url_col = 4
+    n_photo = 32
+    n_prefetch = 5
+    scad_delay_ms = 300
+    filter_delay_ms = 150
 
     def browseto(*args):
         part = item_clicked.part
@@ -557,27 +1053,61 @@ def PartDialog(parent, select_cb, lib=None):
                 url = url[1:-1]
             webbrowser.open_new(url)
     
+    def thumbnail_png(name):
+        png = os.path.join(PartDialog.lib.thumbnail_dir, thumbnails.png_name(name))
+        if not os.path.exists(png):
+            png = os.path.join(PartDialog.lib.thumbnail_dir, 'unknown.png')
+        return png
+
+    photos = OrderedDict() ## png -> (decoded image, PhotoImage), most recent last
+    def photo(png):
+        image = thumbnails.images.get(png)
+        entry = photos.get(png)
+        if entry is None or entry[0] is not image:
+            entry = (image, ImageTk.PhotoImage(image))
+            photos[png] = entry
+        photos.move_to_end(png)
+        while len(photos) > n_photo:
+            photos.popitem(last=False)
+        return entry[1]
+
+    def prefetch(name):
+        shown = lb.get(0, tk.END)
+        try:
+            i = shown.index(name)
+        except ValueError:
+            return
+        neighbours = []
+        for step in range(1, n_prefetch + 1):
+            neighbours.extend(shown[j] for j in (i + step, i - step) if 0 <= j < len(shown))
+        thumbnails.images.prefetch([thumbnail_png(n) for n in neighbours])
+
+    def write_scad(part):
+        item_clicked.after_id = None
+        f = open(alex_scad, 'w')
+        f.write(part.toscad())
+        f.close()
+
     def item_clicked(name):
         try:
             part = Part(PartDialog.lib, name)
         except ValueError:
             raise
             return
-        png = ''.join(name.split())
-        png = os.path.join(PartDialog.lib.thumbnail_dir, f'{png}.png')
-        if not os.path.exists(png):
-            png = os.path.join(PartDialog.lib.thumbnail_dir, 'unknown.png')
-        img = ImageTk.PhotoImage(Image.open(png))
+        img = photo(thumbnail_png(name))
 
         display.configure(image=img)
         display.image = img
         #url.configure(text=url_shortener(data[idx][url_col], max_len=50))
         url.configure(text=url_shortener(data[name][url_col], max_len=50))
         url.bind("<Button-1>", browseto)
-        f = open(alex_scad, 'w')
-        f.write(part.toscad())
-        f.close()
         item_clicked.part = part
+        ### scad preview is written once the selection settles
+        if item_clicked.after_id is not None:
+            tl.after_cancel(item_clicked.after_id)
+        item_clicked.after_id = tl.after(scad_delay_ms, write_scad, part)
+        prefetch(name)
+    item_clicked.after_id = None
     def cancel(*args):
         tl.destroy()
     def select():
@@ -623,23 +1153,34 @@ def PartDialog(parent, select_cb, lib=None):
     name_var = tk.StringVar()
     menubar = tk.Menu(tl)
     libmenu = tk.Menu(menubar, tearoff=0)
-    libmenu.add_command(label="Main", command=lambda *args: relist(Main))
-    for full_name in glob.glob(f'{part_libraries_dir}/*'):
-        if os.path.isdir(full_name):
-            if os.path.isfile(os.path.join(f'{full_name}/Parts.db')):
-                name = os.path.split(full_name)[1]
-                if name != 'Main':
-                    _lib = Library(name)
-                    libmenu.add_command(label=name, command=curry(relist, (_lib,)))
+    for name in federation.library_names():
+        ### libraries are only opened when chosen
+        libmenu.add_command(label=name, command=lambda name=name: relist(get_library(name)))
     def create_new_library():
         new_library_name = simpledialog.askstring("Input", "Library name:",
                                                   parent=tl)
         if new_library_name:
-            lib = Library(new_library_name)
+            lib = get_library(new_library_name)
             PartDialog.lib = lib
             relist(lib)
 
+    def search_all_libraries():
+        query = simpledialog.askstring("Search", "Search all libraries:", parent=tl)
+        if not query:
+            return
+        found = federation.search(query, limit=40)
+        if not found:
+            messagebox.showinfo("Search", f"No parts match {query}", parent=tl)
+            return
+        menu = tk.Menu(tl, tearoff=0)
+        for lib_name, record in found:
+            menu.add_command(label=f"{record.Name}  [{lib_name}]",
+                             command=lambda lib_name=lib_name, name=record.Name:
+                             relist(get_library(lib_name), name))
+        menu.tk_popup(tl.winfo_pointerx(), tl.winfo_pointery())
+
     libmenu.add_separator()
+    libmenu.add_command(label="Search All...", command=search_all_libraries)
     libmenu.add_command(label="New", command=lambda *args: create_new_library())
     menubar.add_cascade(label="Library", menu=libmenu)
     tl.config(menu=menubar)
@@ -654,14 +1195,9 @@ def PartDialog(parent, select_cb, lib=None):
     filter_entry = tk.Entry(filter_frame, textvariable=filter_var)
     filter_entry.pack(side='left', fill='x', expand=True)
     
-    def update_list(filter_pattern="*"):
-        """Update the listbox based on filter pattern."""
+    def update_list(filtered_names):
+        """Update the listbox with filtered names."""
         lb.delete(0, tk.END)
-        filtered_names = []
-        for name in all_names:
-            if fnmatch.fnmatch(name.lower(), filter_pattern.lower()):
-                filtered_names.append(name)
-        
         for i, name in enumerate(filtered_names):
             lb.insert(i, name)
         
@@ -670,15 +1206,24 @@ def PartDialog(parent, select_cb, lib=None):
             item_clicked(filtered_names[0])
     
     def on_filter_change(*args):
-        """Handle filter text changes."""
-        pattern = filter_var.get()
+        """Filter once typing pauses rather than on every keystroke."""
+        if on_filter_change.after_id is not None:
+            tl.after_cancel(on_filter_change.after_id)
+        on_filter_change.after_id = tl.after(filter_delay_ms, apply_filter)
+    on_filter_change.after_id = None
+
+    def apply_filter():
+        on_filter_change.after_id = None
+        pattern = filter_var.get().strip()
         if not pattern:
-            pattern = "*"
+            update_list(all_names)
+        elif '*' in pattern or '?' in pattern:
+            # Explicit wildcards: glob match on names
+            update_list([name for name in all_names
+                         if fnmatch.fnmatch(name.lower(), pattern.lower())])
         else:
-            # Auto-add wildcards unless user already included them
-            if '*' not in pattern and '?' not in pattern:
-                pattern = f"*{pattern}*"
-        update_list(pattern)
+            # Ranked full-text search, e.g. "2020 black len>500"
+            update_list([r.Name for r in PartDialog.lib.search(pattern)])
     
     filter_var.trace('w', on_filter_change)
 
@@ -734,7 +1279,7 @@ def validate_lib(*args):
 
 def validate_name(lib, label, var, entry, commit_button):
     name = var.get().strip()
-    matches = lib.part_list(where=f'name = "{name}"')
+    matches = lib.part_list(where=Eq('Name', name))
     if name == '':
         entry.config(bg="red")
         out = False
@@ -892,18 +1437,11 @@ def ask_color(label, entry):
         entry.config(bg=color)
 
 def get_library_names():
-    full_names = glob.glob(f'{part_libraries_dir}/*')
-    names = ['Main'] ## put main first!
-    for full_name in full_names:
-        if os.path.isdir(full_name):
-            name = os.path.split(full_name)[-1]
-            if name != 'Main':
-                if os.path.exists(os.path.join(full_name, 'Parts.db')):
-                    ### looks like a lib dir
-                    names.append(name)
-    return names
-
-def new_part_dialog(parent, lib=Main, name=None, onclose=None, copy=False):
+    return federation.library_names()
+
+def new_part_dialog(parent, lib=None, name=None, onclose=None, copy=False):
+    if lib is None:
+        lib = get_main_library()
     tl = tk.Toplevel(parent)
     
     dialog_parent = tk.Frame(tl)
@@ -978,8 +1516,8 @@ def new_part_dialog(parent, lib=Main, name=None, onclose=None, copy=False):
         if name:
             result = messagebox.askquestion("Overwrite", f"Delete {name}", icon='warning')
             if result == 'yes':
-                part_table.delete(lib.db, where=f'Name="{name}"')
-                piecewise_table.delete(lib.db, where=f'PartName="{name}"')
+                part_table.delete(lib.db, where=Eq('Name', name))
+                piecewise_table.delete(lib.db, where=Eq('PartName', name))
                 #print("Deleted")
         
     def commit_new_part():
@@ -1001,12 +1539,12 @@ def new_part_dialog(parent, lib=Main, name=None, onclose=None, copy=False):
         else:
             stl_fn = os.path.join(os.path.join(lib.stl_dir, values[2]))
             copy_only = True
-        to_lib = Library(lib_name)
-        prev_records = part_table.select(to_lib.db, where=f'Name="{values[0]}"')
+        to_lib = get_library(lib_name)
+        prev_records = part_table.select(to_lib.db, where=Eq('Name', values[0]))
         if prev_records:
             result = messagebox.askquestion("Overwrite", f"Overwrite {values[0]}", icon='warning')
             if result == 'yes':
-                part_table.delete(to_lib.db, where=f'Name="{values[0]}"')
+                part_table.delete(to_lib.db, where=Eq('Name', values[0]))
             else:      
                 return
         ### import stl file into library
@@ -1027,9 +1565,9 @@ def new_part_dialog(parent, lib=Main, name=None, onclose=None, copy=False):
             # Fallback to copying Cube wireframe if generation fails
             npy = os.path.join(to_lib.wireframe_dir, values[1] + '.npy')
             if not os.path.exists(npy):
-                cube_npy = os.path.join(Main.wireframe_dir, 'Cube.npy')
+                cube_npy = os.path.join(get_main_library().wireframe_dir, 'Cube.npy')
                 if os.path.exists(cube_npy):
-                    shutil.copyfile(cube_npy, npy)
+                    assets.link(cube_npy, npy)
                     print(f'Fallback: Using Cube wireframe')
             
         if price_var.get() == '{piecewise}':
@@ -1037,11 +1575,14 @@ def new_part_dialog(parent, lib=Main, name=None, onclose=None, copy=False):
             name = name_var.get()
             prices = [(name, l, p) for l, p in price_list]
 
-            piecewise_table.delete(to_lib.db, where=f'PartName="{name}"')
+            piecewise_table.delete(to_lib.db, where=Eq('PartName', name))
             piecewise_table.insert(to_lib.db, prices)
             
         part = Part(to_lib, name_var.get())
-        to_lib.make_thumbnail(part)
+        try:
+            to_lib.make_thumbnail(part)
+        except RuntimeError as e:
+            messagebox.showwarning("Thumbnail", str(e), parent=tl)
         close_new_part_dialog()
         
     commit_button = tk.Button(part_frame, text="Commit", command=commit_new_part)
@@ -1053,7 +1594,7 @@ def new_part_dialog(parent, lib=Main, name=None, onclose=None, copy=False):
     def close_new_part_dialog():
         if(onclose):
             lib_name = lib_var.get()
-            to_lib = Library(lib_name)
+            to_lib = get_library(lib_name)
             onclose(to_lib, name_var.get())
         tl.destroy()
         
@@ -1066,7 +1607,7 @@ def new_part_dialog(parent, lib=Main, name=None, onclose=None, copy=False):
     if constants.edit_main:
         lib_names.insert(0, 'Main')
     lib_var = tk.StringVar()
-    if lib == Main:
+    if lib.name == 'Main':
         lib_var.set("User")
     else:
         lib_var.set(lib.name)
@@ -1168,11 +1709,10 @@ def new_part_dialog(parent, lib=Main, name=None, onclose=None, copy=False):
             stl_fn = os.path.join(lib.stl_dir, stl_fn)
         else:
             pass
-        thing = things.STL(stl_fn)
-        # Use the STL class's calculated dimensions to ensure consistency
-        dim1_var.set(np.round(thing.dim1))
-        dim2_var.set(np.round(thing.dim2))
-        length_var.set(np.round(thing.length))
+        dim1, dim2, length = stl_io.dims(stl_fn) ### bounds only, same dims as things.STL
+        dim1_var.set(np.round(dim1))
+        dim2_var.set(np.round(dim2))
+        length_var.set(np.round(length))
         update_wireframe_preview()
         
     def update_wireframe_preview(*args):
@@ -1276,7 +1816,7 @@ def new_part_dialog(parent, lib=Main, name=None, onclose=None, copy=False):
 
     def populate_cb(event):
         name = name_var.get()
-        record = part_table.select(lib.db, where=f'Name="{name}"')
+        record = part_table.select(lib.db, where=Eq('Name', name))
         if len(record) > 0:
             record = record[0]
         else:
@@ -1286,7 +1826,7 @@ def new_part_dialog(parent, lib=Main, name=None, onclose=None, copy=False):
         stl_var.set(record.STL_filename)
         price_var.set(record.Price)
         if record.Price == '{piecewise}': ### from DB, should not have spaces
-           prices = piecewise_table.select(lib.db, where=f'PartName = "{record.Name}"')
+           prices = piecewise_table.select(lib.db, where=Eq('PartName', record.Name), order_by='Length')
            for i, price_record in enumerate(prices[:len(len_vars)]):
                len_vars[i].set(price_record.Length)
                cost_vars[i].set(price_record.Price)
@@ -1314,7 +1854,7 @@ def new_part_dialog(parent, lib=Main, name=None, onclose=None, copy=False):
             match = copy_matcher.search(name)
             if match:
                 name = match.group(1)
-            similar_names = [l.Name for l in part_table.select(lib.db, where=f'name like "{name} x___"')]
+            similar_names = [l.Name for l in part_table.select(lib.db, where=Like('Name', f'{name} x___'))]
             copy_num = len([n for n in similar_names if copy_matcher.search(n)]) + 1
             copy_name = f'{name} x{copy_num:03d}'
             name_var.set(copy_name)
@@ -1339,6 +1879,15 @@ def test_new_part_dialog():
 
     
 if __name__ == '__main__':
-    load_parts(csv_fn)
-    #test_part_select()
-    test_new_part_dialog()
+    if '--seed' in sys.argv:
+        n_parts, n_prices = seed_main_library()
+        print(f'Seeded {db_fn}: {n_parts} new parts, {n_prices} new piecewise prices')
+    elif '--pack' in sys.argv:
+        ### python -m packages.parts_db --pack [library ...]
+        for name in sys.argv[sys.argv.index('--pack') + 1:] or federation.library_names():
+            lib = get_library(name)
+            print(f'Packed {lib.pack_wireframes()} wireframes into {lib.wireframe_pack}')
+    else:
+        seed_main_library()
+        #test_part_select()
+        test_new_part_dialog()
@@ -0,0 +1,71 @@
+'''
+Batched pricing of parts.
+
+Cut-to-length parts are priced by piecewise linear interpolation of their
+Piecewise table (PartSpec.lengths/prices, compiled to read-only arrays by
+the catalog).  Pricing a scene groups its parts by PartSpec and prices each
+group with one np.interp call.
+
+Beyond the ends of a table:
+  'linear' -- continue the first/last segment (what interp1d always did)
+  'clamp'  -- hold the first/last price
+'''
+import numpy as np
+
+extrapolate_rules = ('linear', 'clamp')
+
+def interp(lengths, prices, x, extrapolate='linear'):
+    '''
+    Price x (a length or array of lengths) on the table (lengths, prices).
+    lengths must be increasing.
+    '''
+    if extrapolate not in extrapolate_rules:
+        raise ValueError(f"Unknown extrapolation rule {extrapolate!r}")
+    x = np.asarray(x, dtype=float)
+    y = np.interp(x, lengths, prices)
+    if extrapolate == 'linear' and len(lengths) > 1:
+        for end, (i, j) in ((x < lengths[0], (0, 1)), (x > lengths[-1], (-2, -1))):
+            if np.any(end):
+                dx = lengths[j] - lengths[i]
+                slope = (prices[j] - prices[i]) / dx if dx else 0.
+                y = np.where(end, prices[i] + (x - lengths[i]) * slope, y)
+    return y
+
+def leaves(things):
+    '''
+    Return the non-container things of things, descending into groups.
+    '''
+    out = []
+    for thing in things:
+        if thing.iscontainer():
+            out.extend(leaves(thing.things))
+        else:
+            out.append(thing)
+    return out
+
+def costs(things, extrapolate='linear'):
+    '''
+    Return an array with the cost of each thing of the flat sequence things.
+    Parts are batched per PartSpec, so each part type costs one np.interp
+    (or one assignment for fixed prices); other things are asked for cost().
+    '''
+    out = np.zeros(len(things))
+    batches = {}
+    for i, thing in enumerate(things):
+        spec = getattr(thing, 'spec', None)
+        if spec is None:
+            out[i] = thing.cost()
+        elif spec in batches:
+            batches[spec].append(i)
+        else:
+            batches[spec] = [i]
+    for spec, idx in batches.items():
+        if spec.price == '{piecewise}':
+            lengths = [things[i].length for i in idx]
+            out[idx] = interp(spec.lengths, spec.prices, lengths, extrapolate)
+        else:
+            out[idx] = spec.price
+    return out
+
+def total_cost(things, extrapolate='linear'):
+    return float(np.sum(costs(leaves(things), extrapolate)))
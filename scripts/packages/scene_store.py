@@ -0,0 +1,182 @@
+'''
+Optional columnar storage for the placement of scene things.
+
+A SceneStore keeps pos (N x 3), orient (N x 3 x 3) and length (N) of the
+things added to it in contiguous arrays, with a part type index (kind) into
+one entry per PartSpec.  Stored things read and write pos, orient and length
+through to their row (see things.stored), so nothing changes for them,
+while a group whose parts all live in one store is translated, rotated and
+measured with a few whole-array operations instead of a loop over members.
+
+    scene.use_store(SceneStore())
+'''
+import numpy as np
+
+import sys
+if '.' not in sys.path:
+    sys.path.append('.')
+from packages.things import versions
+
+class SceneStore:
+    def __init__(self, capacity=64):
+        self.pos = np.zeros((capacity, 3))
+        self.orient = np.tile(np.eye(3), (capacity, 1, 1))
+        self.length = np.full(capacity, np.nan) ### nan: thing has no length
+        self.kind = np.full(capacity, -1)       ### -1: not a part
+        self.version = np.zeros(capacity, int)  ### see Thing.version
+        self.things = [None] * capacity
+        self.free = list(range(capacity - 1, -1, -1))
+        self.kind_index = {} ### PartSpec -> kind
+        self.units = []      ### unit wireframe (nan rows dropped) per kind
+        self.kind_dims = np.zeros((0, 2))  ### dim1, dim2 per kind
+        self.kind_mean = np.zeros((0, 3))  ### mean unit vertex per kind
+        self.kind_count = np.zeros(0)      ### vertices per kind
+
+    def __len__(self):
+        return len(self.things) - len(self.free)
+
+    def grow(self):
+        n = len(self.things)
+        self.pos = np.concatenate([self.pos, np.zeros((n, 3))])
+        self.orient = np.concatenate([self.orient, np.tile(np.eye(3), (n, 1, 1))])
+        self.length = np.concatenate([self.length, np.full(n, np.nan)])
+        self.kind = np.concatenate([self.kind, np.full(n, -1)])
+        self.version = np.concatenate([self.version, np.zeros(n, int)])
+        self.things.extend([None] * n)
+        self.free.extend(range(2 * n - 1, n - 1, -1))
+
+    def kind_of(self, thing):
+        spec = getattr(thing, 'spec', None)
+        if spec is None:
+            return -1
+        kind = self.kind_index.get(spec)
+        if kind is None:
+            unit = np.asarray(spec.wireframe, dtype=float)
+            unit = unit[~np.isnan(unit[:, 0])]
+            kind = len(self.units)
+            self.kind_index[spec] = kind
+            self.units.append(unit)
+            self.kind_dims = np.vstack([self.kind_dims, [spec.dim1, spec.dim2]])
+            self.kind_mean = np.vstack([self.kind_mean, unit.mean(axis=0)])
+            self.kind_count = np.append(self.kind_count, len(unit))
+        return kind
+
+    def add(self, thing):
+        '''
+        Move the placement of thing (of each leaf, for groups) into the store.
+        '''
+        if thing.iscontainer():
+            for member in thing:
+                self.add(member)
+            return
+        if thing.scene_store is self:
+            return
+        if thing.scene_store is not None:
+            thing.scene_store.remove(thing)
+        if not self.free:
+            self.grow()
+        slot = self.free.pop()
+        ### kept as is, relative to thing.frame_parent if it has one
+        self.pos[slot] = thing.__dict__['pos']
+        self.orient[slot] = thing.__dict__['orient']
+        self.length[slot] = thing.__dict__.get('length', np.nan)
+        self.kind[slot] = self.kind_of(thing)
+        self.version[slot] = next(versions)
+        self.things[slot] = thing
+        for name in ('pos', 'orient', 'length'):
+            thing.__dict__.pop(name, None)
+        thing.scene_store = self
+        thing.slot = slot
+
+    def remove(self, thing):
+        '''
+        Give thing (each leaf, for groups) its own placement again.
+        '''
+        if thing.iscontainer():
+            for member in thing:
+                self.remove(member)
+            return
+        if thing.scene_store is not self:
+            return
+        slot = thing.slot
+        del thing.scene_store, thing.slot
+        thing.__dict__['pos'] = self.pos[slot].copy()
+        thing.__dict__['orient'] = self.orient[slot].copy()
+        if not np.isnan(self.length[slot]):
+            thing.__dict__['length'] = float(self.length[slot])
+        thing.__dict__['_version'] = next(versions)
+        self.things[slot] = None
+        self.kind[slot] = -1
+        self.free.append(slot)
+
+    def clear(self):
+        for thing in self.things:
+            if thing is not None:
+                self.remove(thing)
+
+    def slots(self, things):
+        '''
+        Slots of things, or None unless every one is a part in this store
+        placed in world space (not in a hierarchical group).
+        '''
+        if any(thing.scene_store is not self or thing.frame_parent is not None for thing in things):
+            return None
+        slots = np.fromiter((thing.slot for thing in things), int, len(things))
+        if np.any(self.kind[slots] < 0):
+            return None
+        return slots
+
+    def moved(self, slots):
+        self.version[slots] = next(versions)
+        moved = {}
+        for slot in slots:
+            thing = self.things[slot]
+            if thing.spatial_index is not None:
+                moved.setdefault(thing.spatial_index, []).append(thing)
+        for index, things in moved.items():
+            index.moved_many(things)
+
+    def translate(self, slots, v):
+        self.pos[slots] += v
+        self.moved(slots)
+
+    def rotate(self, slots, R, center):
+        center = np.array(center, dtype=float) ### may be a view of a row being moved
+        self.orient[slots] = R @ self.orient[slots]
+        self.pos[slots] = (self.pos[slots] - center) @ R.T + center
+        self.moved(slots)
+
+    def scales(self, slots):
+        return np.column_stack([self.kind_dims[self.kind[slots]], self.length[slots]])
+
+    def verts_mean(self, slots):
+        '''
+        Mean world vertex of the parts in slots, as np.mean of their get_verts().
+        '''
+        kinds = self.kind[slots]
+        local = self.kind_mean[kinds] * self.scales(slots)
+        world = np.einsum('nij,nj->ni', self.orient[slots], local) + self.pos[slots]
+        weights = self.kind_count[kinds]
+        return weights @ world / weights.sum()
+
+    def world_verts(self, slots):
+        '''
+        Yield (slots, verts) per part type: verts[i] are the world vertices
+        (nan rows dropped) of the part in slots[i].
+        '''
+        kinds = self.kind[slots]
+        for kind in np.unique(kinds):
+            sel = slots[kinds == kind]
+            local = self.units[kind] * self.scales(sel)[:, np.newaxis, :]
+            yield sel, local @ self.orient[sel].transpose(0, 2, 1) + self.pos[sel, np.newaxis, :]
+
+    def bounds(self, slots):
+        '''
+        Return (mins, maxs) of the world vertices of the parts in slots.
+        '''
+        mins = np.full(3, np.inf)
+        maxs = np.full(3, -np.inf)
+        for sel, verts in self.world_verts(slots):
+            mins = np.minimum(mins, verts.min(axis=(0, 1)))
+            maxs = np.maximum(maxs, verts.max(axis=(0, 1)))
+        return mins, maxs
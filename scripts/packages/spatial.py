@@ -0,0 +1,474 @@
+'''
+Spatial index over the members of a Scene.
+
+AABBTree is a dynamic bounding volume hierarchy: every key has a box
+enlarged by margin, so small moves do not touch the tree, and a key that
+leaves its enlarged box is taken out and put back in.  Queries walk only
+the branches whose boxes can match, so picking, rubber band selection and
+neighbour searches do not visit every part.
+
+SceneIndex keeps one entry per top-level scene member.  Things report moves
+(see things.stored) and their member's box is brought up to date lazily, on
+the next query.
+
+    scene.index.region(mins, maxs)         ### members whose boxes overlap
+    scene.index.ray(origin, direction)     ### members hit, nearest first
+    scene.index.nearest(point, k=1)
+    scene.index.pairs()                    ### members whose boxes overlap
+'''
+import heapq
+import itertools
+import math
+
+import numpy as np
+
+def area(lo, hi):
+    dx, dy, dz = hi[0] - lo[0], hi[1] - lo[1], hi[2] - lo[2]
+    return dx * dy + dy * dz + dz * dx
+
+def union(lo1, hi1, lo2, hi2):
+    return tuple(map(min, lo1, lo2)), tuple(map(max, hi1, hi2))
+
+def overlaps(lo1, hi1, lo2, hi2):
+    return all(a <= d and c <= b for a, b, c, d in zip(lo1, hi1, lo2, hi2))
+
+def contains(lo1, hi1, lo2, hi2):
+    return all(a <= c and d <= b for a, b, c, d in zip(lo1, hi1, lo2, hi2))
+
+def distance2(lo, hi, p):
+    ### squared distance from point p to box lo, hi
+    return sum(max(a - x, 0, x - b) ** 2 for a, b, x in zip(lo, hi, p))
+
+def ray_entry(lo, hi, origin, inverse, t_min, t_max):
+    ### slab test: where the ray enters box lo, hi, or None if it misses
+    for a, b, o, inv in zip(lo, hi, origin, inverse):
+        if inv is None:
+            if o < a or b < o:
+                return None
+            continue
+        t0 = (a - o) * inv
+        t1 = (b - o) * inv
+        if t0 > t1:
+            t0, t1 = t1, t0
+        t_min = max(t_min, t0)
+        t_max = min(t_max, t1)
+        if t_min > t_max:
+            return None
+    return t_min
+
+class AABBTree:
+    def __init__(self, margin=5.):
+        self.margin = margin
+        self.root = -1
+        self.lo = []
+        self.hi = []
+        self.left = []   ### -1 for leaves
+        self.right = []
+        self.parent = []
+        self.height = [] ### 0 for leaves
+        self.key = []    ### None for branches
+        self.free = []
+        self.leaves = {} ### key -> leaf node
+        self.boxes = {}  ### key -> (lo, hi) as given
+
+    def __len__(self):
+        return len(self.leaves)
+
+    def __contains__(self, key):
+        return key in self.leaves
+
+    def new_node(self, lo, hi, key=None):
+        if self.free:
+            node = self.free.pop()
+            self.lo[node], self.hi[node], self.key[node] = lo, hi, key
+            self.left[node] = self.right[node] = self.parent[node] = -1
+            self.height[node] = 0
+        else:
+            node = len(self.lo)
+            self.lo.append(lo)
+            self.hi.append(hi)
+            self.left.append(-1)
+            self.right.append(-1)
+            self.parent.append(-1)
+            self.height.append(0)
+            self.key.append(key)
+        return node
+
+    def free_node(self, node):
+        self.key[node] = None
+        self.free.append(node)
+
+    def fat(self, lo, hi):
+        m = self.margin
+        return tuple(x - m for x in lo), tuple(x + m for x in hi)
+
+    def insert(self, key, lo, hi):
+        if key in self.leaves:
+            self.remove(key)
+        lo, hi = tuple(map(float, lo)), tuple(map(float, hi))
+        self.boxes[key] = (lo, hi)
+        leaf = self.new_node(*self.fat(lo, hi), key)
+        self.leaves[key] = leaf
+        self.insert_leaf(leaf)
+
+    def remove(self, key):
+        leaf = self.leaves.pop(key)
+        del self.boxes[key]
+        self.remove_leaf(leaf)
+        self.free_node(leaf)
+
+    def update(self, key, lo, hi):
+        '''
+        Move key to box lo, hi (inserting it if new).  The tree is only
+        changed once the box leaves the enlarged one key has.
+        '''
+        leaf = self.leaves.get(key)
+        if leaf is None:
+            return self.insert(key, lo, hi)
+        lo, hi = tuple(map(float, lo)), tuple(map(float, hi))
+        self.boxes[key] = (lo, hi)
+        if contains(self.lo[leaf], self.hi[leaf], lo, hi):
+            return
+        self.remove_leaf(leaf)
+        self.lo[leaf], self.hi[leaf] = self.fat(lo, hi)
+        self.insert_leaf(leaf)
+
+    def insert_leaf(self, leaf):
+        self.parent[leaf] = -1
+        if self.root < 0:
+            self.root = leaf
+            return
+        lo, hi = self.lo[leaf], self.hi[leaf]
+        node = self.root
+        while self.left[node] >= 0:
+            ### descend where the box grows least
+            costs = []
+            for child in (self.left[node], self.right[node]):
+                clo, chi = self.lo[child], self.hi[child]
+                costs.append(area(*union(clo, chi, lo, hi)) - area(clo, chi))
+            node = self.left[node] if costs[0] <= costs[1] else self.right[node]
+        sibling = node
+        old_parent = self.parent[sibling]
+        branch = self.new_node(*union(self.lo[sibling], self.hi[sibling], lo, hi))
+        self.parent[branch] = old_parent
+        self.left[branch] = sibling
+        self.right[branch] = leaf
+        self.parent[sibling] = self.parent[leaf] = branch
+        if old_parent < 0:
+            self.root = branch
+        elif self.left[old_parent] == sibling:
+            self.left[old_parent] = branch
+        else:
+            self.right[old_parent] = branch
+        self.refit(branch)
+        if self.height[self.root] > 2 * math.log2(len(self.leaves)) + 8:
+            self.rebuild()
+
+    def remove_leaf(self, leaf):
+        if leaf == self.root:
+            self.root = -1
+            return
+        branch = self.parent[leaf]
+        sibling = self.left[branch] if self.right[branch] == leaf else self.right[branch]
+        grand = self.parent[branch]
+        self.parent[sibling] = grand
+        if grand < 0:
+            self.root = sibling
+        else:
+            if self.left[grand] == branch:
+                self.left[grand] = sibling
+            else:
+                self.right[grand] = sibling
+            self.refit(grand)
+        self.free_node(branch)
+
+    def fit(self, node):
+        l, r = self.left[node], self.right[node]
+        self.lo[node], self.hi[node] = union(self.lo[l], self.hi[l], self.lo[r], self.hi[r])
+        self.height[node] = 1 + max(self.height[l], self.height[r])
+
+    def refit(self, node):
+        ### bounds and heights from node up to the root, rebalancing on the way
+        while node >= 0:
+            node = self.balance(node)
+            self.fit(node)
+            node = self.parent[node]
+
+    def balance(self, a):
+        '''
+        If one child of a is two or more levels taller than the other, lift
+        it into a's place (an AVL rotation).  Returns the node now there.
+        '''
+        b, c = self.left[a], self.right[a]
+        if b < 0:
+            return a
+        skew = self.height[c] - self.height[b]
+        if skew > 1:
+            return self.lift(a, self.right)
+        if skew < -1:
+            return self.lift(a, self.left)
+        return a
+
+    def lift(self, a, side):
+        c = side[a]
+        f, g = self.left[c], self.right[c]
+        if self.height[f] < self.height[g]:
+            f, g = g, f
+        ### c takes a's place with children a and f; a keeps its other child and g
+        parent = self.parent[a]
+        self.parent[c] = parent
+        if parent < 0:
+            self.root = c
+        elif self.left[parent] == a:
+            self.left[parent] = c
+        else:
+            self.right[parent] = c
+        side[a] = g
+        self.parent[g] = a
+        self.left[c], self.right[c] = a, f
+        self.parent[a] = self.parent[f] = c
+        self.fit(a)
+        return c
+
+    def rebuild(self):
+        '''
+        Rebuild the whole tree top down (median splits); called when
+        insertion order has made it too deep.
+        '''
+        leaves = list(self.leaves.values())
+        in_use = set(leaves)
+        self.free = [node for node in range(len(self.lo)) if node not in in_use]
+        self.root = -1
+        if not leaves:
+            return
+        lo = np.array([self.lo[leaf] for leaf in leaves])
+        hi = np.array([self.hi[leaf] for leaf in leaves])
+        centers = (lo + hi) / 2
+        def build(idx):
+            if len(idx) == 1:
+                return leaves[idx[0]]
+            spread = np.ptp(centers[idx], axis=0)
+            order = idx[np.argsort(centers[idx, np.argmax(spread)], kind='stable')]
+            half = len(order) // 2
+            l, r = build(order[:half]), build(order[half:])
+            node = self.new_node(*union(self.lo[l], self.hi[l], self.lo[r], self.hi[r]))
+            self.left[node], self.right[node] = l, r
+            self.parent[l] = self.parent[r] = node
+            self.height[node] = 1 + max(self.height[l], self.height[r])
+            return node
+        self.root = build(np.arange(len(leaves)))
+        self.parent[self.root] = -1
+
+    def walk(self, test):
+        ### leaves whose enlarged box passes test(lo, hi), branches likewise
+        if self.root < 0:
+            return
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            if not test(self.lo[node], self.hi[node]):
+                continue
+            if self.left[node] < 0:
+                yield self.key[node]
+            else:
+                stack.append(self.left[node])
+                stack.append(self.right[node])
+
+    def region(self, lo, hi):
+        '''
+        Keys whose box overlaps lo, hi (touching counts).
+        '''
+        lo, hi = tuple(map(float, lo)), tuple(map(float, hi))
+        return [key for key in self.walk(lambda a, b: overlaps(a, b, lo, hi))
+                if overlaps(*self.boxes[key], lo, hi)]
+
+    def ray(self, origin, direction, radius=0., t_min=0., t_max=math.inf):
+        '''
+        Return [(t, key)], nearest first, for the keys whose box (grown by
+        radius) the ray origin + t * direction, t_min <= t <= t_max, meets.
+        '''
+        origin = tuple(map(float, origin))
+        inverse = tuple(None if d == 0 else 1 / float(d) for d in direction)
+        def grown(lo, hi):
+            return tuple(x - radius for x in lo), tuple(x + radius for x in hi)
+        def test(lo, hi):
+            return ray_entry(*grown(lo, hi), origin, inverse, t_min, t_max) is not None
+        out = []
+        for key in self.walk(test):
+            t = ray_entry(*grown(*self.boxes[key]), origin, inverse, t_min, t_max)
+            if t is not None:
+                out.append((t, key))
+        out.sort(key=lambda hit: hit[0])
+        return out
+
+    def projected(self, P, lo, hi):
+        '''
+        Keys whose box, mapped by x -> x @ P (P is 3 x k), overlaps the
+        k dimensional box lo, hi.
+        '''
+        P = np.asarray(P, dtype=float)
+        cols = [tuple(P[:, j]) for j in range(P.shape[1])]
+        lo, hi = tuple(map(float, lo)), tuple(map(float, hi))
+        def test(a, b):
+            for col, l, h in zip(cols, lo, hi):
+                center = sum((x + y) * c for x, y, c in zip(a, b, col)) / 2
+                reach = sum((y - x) * abs(c) for x, y, c in zip(a, b, col)) / 2
+                if center + reach < l or h < center - reach:
+                    return False
+            return True
+        return [key for key in self.walk(test) if test(*self.boxes[key])]
+
+    def nearest(self, point, k=1, exclude=()):
+        '''
+        Return [(distance, key)] for the k keys whose boxes are nearest point.
+        '''
+        point = tuple(map(float, point))
+        out = []
+        if self.root < 0:
+            return out
+        count = itertools.count() ### tie breaker, keys need not be comparable
+        heap = [(0., next(count), self.root, False)]
+        while heap and len(out) < k:
+            d2, _, node, exact = heapq.heappop(heap)
+            key = self.key[node]
+            if exact:
+                out.append((math.sqrt(d2), key))
+            elif self.left[node] < 0:
+                if key not in exclude:
+                    heapq.heappush(heap, (distance2(*self.boxes[key], point), next(count), node, True))
+            else:
+                for child in (self.left[node], self.right[node]):
+                    heapq.heappush(heap, (distance2(self.lo[child], self.hi[child], point),
+                                          next(count), child, False))
+        return out
+
+    def pairs(self, tolerance=0.):
+        '''
+        Every pair of keys whose boxes, grown by tolerance, overlap.
+        '''
+        out = []
+        for key, (lo, hi) in self.boxes.items():
+            leaf = self.leaves[key]
+            lo = tuple(x - tolerance for x in lo)
+            hi = tuple(x + tolerance for x in hi)
+            for other in self.region(lo, hi):
+                if self.leaves[other] > leaf:
+                    out.append((key, other))
+        return out
+
+class SceneIndex:
+    '''
+    AABBTree of the top-level members of a Scene.  Every thing inside a
+    member reports to it (thing.spatial_index), so a moved part marks its
+    member for an update before the next query.  Results are in scene
+    order.
+    '''
+    def __init__(self, margin=5.):
+        self.tree = AABBTree(margin)
+        self.owners = {} ### thing -> the member it is part of
+        self.order = {}  ### member -> when it was added
+        self.dirty = set()
+        self.serial = itertools.count()
+        self.watchers = [] ### told of every member refreshed or removed, see engagement
+
+    def __len__(self):
+        return len(self.order)
+
+    def add(self, member):
+        if member not in self.order:
+            self.order[member] = next(self.serial)
+        self.claim(member, member)
+        self.dirty.add(member)
+
+    def remove(self, member):
+        if member not in self.order:
+            return
+        self.release(member)
+        del self.order[member]
+        self.dirty.discard(member)
+        if member in self.tree:
+            self.tree.remove(member)
+        for watcher in self.watchers:
+            watcher.discard(member)
+
+    def clear(self):
+        for member in list(self.order):
+            self.remove(member)
+
+    def claim(self, thing, member):
+        thing.spatial_index = self
+        self.owners[thing] = member
+        if thing.iscontainer():
+            for sub in thing.things:
+                self.claim(sub, member)
+
+    def release(self, thing):
+        thing.__dict__.pop('spatial_index', None)
+        self.owners.pop(thing, None)
+        if thing.iscontainer():
+            for sub in thing.things:
+                self.release(sub)
+
+    def joined(self, thing, group):
+        ### thing was appended to group, which is in the scene
+        self.claim(thing, self.owners[group])
+        self.moved(group)
+
+    def left(self, thing, group):
+        self.release(thing)
+        self.moved(group)
+
+    def moved(self, thing):
+        member = self.owners.get(thing)
+        if member is not None:
+            self.dirty.add(member)
+
+    def moved_many(self, things):
+        ### one update for a batch moved together, e.g. by SceneStore
+        members = set(map(self.owners.get, things))
+        members.discard(None)
+        self.dirty.update(members)
+
+    def owner(self, thing):
+        '''
+        The top-level member thing is part of (None if not in the scene).
+        '''
+        return self.owners.get(thing)
+
+    def refresh(self):
+        for member in self.dirty:
+            if member.iscontainer() and len(member) == 0:
+                if member in self.tree:
+                    self.tree.remove(member)
+            else:
+                self.tree.update(member, *member.get_boundingbox())
+            for watcher in self.watchers:
+                watcher.update(member)
+        self.dirty.clear()
+
+    def in_order(self, members):
+        return sorted(members, key=self.order.__getitem__)
+
+    def region(self, mins, maxs):
+        self.refresh()
+        return self.in_order(self.tree.region(mins, maxs))
+
+    def ray(self, origin, direction, radius=0., t_min=0.):
+        '''
+        Members the ray meets, nearest first (t_min=-inf for a whole line).
+        '''
+        self.refresh()
+        return [member for t, member in self.tree.ray(origin, direction, radius, t_min)]
+
+    def projected(self, P, lo, hi):
+        self.refresh()
+        return self.in_order(self.tree.projected(P, lo, hi))
+
+    def nearest(self, point, k=1, exclude=()):
+        self.refresh()
+        return [member for d, member in self.tree.nearest(point, k, exclude)]
+
+    def pairs(self, tolerance=0.):
+        self.refresh()
+        pairs = [tuple(self.in_order(pair)) for pair in self.tree.pairs(tolerance)]
+        return sorted(pairs, key=lambda pair: (self.order[pair[0]], self.order[pair[1]]))
@@ -0,0 +1,242 @@
+'''
+Binary and ASCII STL files without loading whole meshes.
+
+Binary files are read in one go into a structured dtype, so vectors and
+normals are zero-copy read-only views of the facets, and nothing is read
+until they are touched.  The facets are owned, not mapped, so rewriting or
+truncating the file under a cached mesh cannot fault.  bounds() and
+chunks() stream a bounded number of triangles at a time, so scanning a
+multi-hundred-MB file does not hold it in memory.  ASCII files are parsed
+line by line.
+
+load() hands out one shared, read-only STLFile per (path, mtime, size) from
+the process-wide MeshCache, so duplicating a part or refreshing a view does
+not read the file again.
+'''
+import os
+import re
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+facet_dtype = np.dtype([('normals', '<f4', (3,)),
+                        ('vectors', '<f4', (3, 3)),
+                        ('attr', '<u2', (1,))])
+header_size = 84
+chunk_triangles = 2 ** 16
+number = rb'([-+0-9.eEnNaAiIfF]+)'
+ascii_vertex = re.compile(rb'^\s*vertex\s+' + rb'\s+'.join([number] * 3))
+ascii_normal = re.compile(rb'^\s*facet\s+normal\s+' + rb'\s+'.join([number] * 3))
+
+class STLFile:
+    def __init__(self, filename):
+        self.filename = filename
+        size = os.path.getsize(filename)
+        with open(filename, 'rb') as f:
+            head = f.read(header_size)
+        count = int(np.frombuffer(head[80:], '<u4')[0]) if len(head) == header_size else -1
+        self.binary = header_size + count * facet_dtype.itemsize == size
+        if not self.binary and not head.lstrip().startswith(b'solid'):
+            raise ValueError(f'{filename} is not an STL file')
+        self.count = count if self.binary else None
+        self._facets = None
+        self._bounds = None
+
+    def __len__(self):
+        if self.count is None:
+            self.count = len(self.facets)
+        return self.count
+
+    @property
+    def facets(self):
+        if self._facets is None:
+            if not self.binary:
+                self._facets = np.concatenate(list(self._ascii_chunks(chunk_triangles)) or
+                                              [np.zeros(0, facet_dtype)])
+            elif self.count == 0:
+                self._facets = np.zeros(0, facet_dtype)
+            else:
+                self._facets = self._read_facets(header_size, self.count)
+            self._facets.setflags(write=False)
+        return self._facets
+
+    @property
+    def vectors(self):
+        '(n, 3, 3) triangle corners, a read-only view of the facets'
+        return self.facets['vectors']
+
+    @property
+    def normals(self):
+        return self.facets['normals']
+
+    @property
+    def points(self):
+        '(n, 9) corners per triangle as numpy-stl has them, a read-only view of the facets'
+        return self.vectors.reshape((-1, 9))
+
+    def chunks(self, size=chunk_triangles):
+        '''
+        Yield the triangle corners size triangles at a time.
+        '''
+        if self._facets is not None:
+            vectors = self.vectors
+            for start in range(0, len(vectors), size):
+                yield vectors[start:start + size]
+        elif self.binary:
+            for start in range(0, self.count, size):
+                count = min(size, self.count - start)
+                yield self._read_facets(header_size + start * facet_dtype.itemsize, count)['vectors']
+        else:
+            for facets in self._ascii_chunks(size):
+                yield facets['vectors']
+
+    def _read_facets(self, offset, count):
+        facets = np.fromfile(self.filename, facet_dtype, count=count, offset=offset)
+        if len(facets) != count:
+            raise ValueError(f'{self.filename} was truncated while reading')
+        return facets
+
+    def _ascii_chunks(self, size):
+        normals = []
+        corners = []
+        def chunk():
+            facets = np.zeros(len(corners) // 3, facet_dtype)
+            facets['vectors'] = np.array(corners[:len(facets) * 3], float).reshape((-1, 3, 3))
+            if len(normals) >= len(facets):
+                facets['normals'] = np.array(normals[:len(facets)], float)
+            return facets
+        with open(self.filename, 'rb') as f:
+            for line in f:
+                match = ascii_vertex.match(line)
+                if match:
+                    corners.append(match.groups())
+                    if len(corners) == 3 * size:
+                        yield chunk()
+                        normals = normals[size:]
+                        corners = []
+                    continue
+                match = ascii_normal.match(line)
+                if match:
+                    normals.append(match.groups())
+        if len(corners) % 3:
+            raise ValueError(f'{self.filename}: facet with {len(corners) % 3} vertices')
+        if corners:
+            yield chunk()
+
+    def bounds(self):
+        '''
+        Return (mins, maxs) of all corners, streaming over the file once.
+        '''
+        if self._bounds is not None:
+            return self._bounds[0].copy(), self._bounds[1].copy()
+        mins = np.full(3, np.inf)
+        maxs = np.full(3, -np.inf)
+        for vectors in self.chunks():
+            if len(vectors):
+                pts = vectors.reshape((-1, 3))
+                mins = np.minimum(mins, pts.min(axis=0))
+                maxs = np.maximum(maxs, pts.max(axis=0))
+        if np.any(mins > maxs):
+            raise ValueError(f'{self.filename} has no triangles')
+        self._bounds = (mins, maxs)
+        return mins.copy(), maxs.copy()
+
+    def dims(self):
+        mins, maxs = self.bounds()
+        return maxs - mins
+
+    def close(self):
+        self._facets = None
+
+def read(filename):
+    '''
+    Open filename without the cache (for one-off files).
+    '''
+    return STLFile(filename)
+
+class MeshCache:
+    '''
+    Process-wide STLFiles keyed by (path, mtime, size); a rewritten file is
+    read again.  Each entry is charged its file size and least recently used
+    entries are dropped once the total passes max_bytes.  Dropped entries
+    stay valid for whoever still holds them.
+    '''
+    def __init__(self, max_bytes=256 * 2 ** 20):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+
+    def load(self, filename):
+        st = os.stat(filename)
+        key = (os.path.abspath(filename), st.st_mtime_ns, st.st_size)
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key]
+        stl = STLFile(filename)
+        with self.lock:
+            self.misses += 1
+            for old in [k for k in self.entries if k[0] == key[0] and k != key]: ### file was rewritten
+                del self.entries[old]
+                self.nbytes -= old[2]
+            if key not in self.entries:
+                self.entries[key] = stl
+                self.nbytes += key[2]
+            self.evict()
+            return self.entries[key]
+
+    def evict(self):
+        ### the newest entry is always kept, even if it alone exceeds the budget
+        while self.nbytes > self.max_bytes and len(self.entries) > 1:
+            key, stl = self.entries.popitem(last=False)
+            self.nbytes -= key[2]
+            self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.nbytes = 0
+
+    def stats(self):
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'entries': len(self.entries),
+                'nbytes': self.nbytes,
+                'max_bytes': self.max_bytes}
+
+meshes = MeshCache()
+
+def load(filename):
+    return meshes.load(filename)
+
+def bounds(filename):
+    return load(filename).bounds()
+
+def dims(filename):
+    return load(filename).dims()
+
+def write(filename, vectors, normals=None, header=b'AlexCAD'):
+    '''
+    Write triangles (n, 3, 3) as a binary STL.  Normals are computed from the
+    corners when not given.
+    '''
+    vectors = np.asarray(vectors, dtype=float).reshape((-1, 3, 3))
+    if normals is None:
+        normals = np.cross(vectors[:, 1] - vectors[:, 0], vectors[:, 2] - vectors[:, 0])
+        lengths = np.linalg.norm(normals, axis=1)[:, np.newaxis]
+        normals = np.divide(normals, lengths, out=np.zeros_like(normals), where=lengths > 0)
+    facets = np.zeros(len(vectors), facet_dtype)
+    facets['vectors'] = vectors
+    facets['normals'] = normals
+    with open(filename, 'wb') as f:
+        f.write(header[:80].ljust(80, b' '))
+        f.write(np.array([len(facets)], '<u4').tobytes())
+        facets.tofile(f)
+    return filename
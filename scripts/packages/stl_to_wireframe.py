@@ -3,11 +3,11 @@ import numpy as np
 from numpy import linalg as la
 import pylab as pl
 from mpl_toolkits.mplot3d import Axes3D
-from stl import mesh
 import sys
 if '.' not in sys.path:
     sys.path.append('.')
 from packages.constants import stl_dir, alex_dir
+from packages import stl_io
 DEG = np.pi / 180
 
 na = np.newaxis
@@ -274,8 +274,7 @@ def get_face(vectors, d, eps=eps):
 
 
 def from_stl(stl_fn):
-    stl = mesh.Mesh.from_file(stl_fn)
-    vectors = stl.vectors
+    vectors = stl_io.load(stl_fn).vectors
     #### normalize
     mx = np.amax(vectors.reshape((-1, 3)), axis=0)
     mn = np.amin(vectors.reshape((-1, 3)), axis=0)
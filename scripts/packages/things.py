@@ -1,10 +1,6 @@
 import os.path
+import itertools
 import numpy as np
-try:
-    from stl import mesh
-    STL_SUPPORTED = True
-except ImportError:
-    STL_SUPPORTED = False
 
 import sys
 if '.' not in sys.path:
@@ -13,16 +9,143 @@ from packages.constants import mm, DEG, alex_dir, alex_scad
 from packages import util
 from packages import wireframes
 from packages import quaternion
+from packages import pricing
+from packages import stl_io
+from packages import spatial
+from packages import engagement
+
+versions = itertools.count(1) ### a new number for every placement change, see Thing.version
+
+class stored:
+    '''
+    pos, orient or length of a thing: its row of a SceneStore while it is in
+    one (see scene_store), else an ordinary attribute.  Setting it gives the
+    thing a new version.  Inside a hierarchical Group, pos and orient are
+    kept relative to the group's frame and read and written in world space.
+    '''
+    def __init__(self, name):
+        self.name = name
+
+    def raw(self, thing):
+        ### as kept: relative to thing.frame_parent when it has one
+        store = thing.scene_store
+        if store is None:
+            try:
+                return thing.__dict__[self.name]
+            except KeyError:
+                raise AttributeError(self.name) from None
+        value = getattr(store, self.name)[thing.slot]
+        if self.name == 'length':
+            if np.isnan(value):
+                raise AttributeError(self.name)
+            return float(value)
+        return value
+
+    def __get__(self, thing, cls=None):
+        if thing is None:
+            return self
+        value = self.raw(thing)
+        parent = thing.frame_parent
+        if parent is None or self.name == 'length':
+            return value
+        R, t = parent.world_frame()
+        if self.name == 'pos':
+            return R @ value + t
+        return R @ value
+
+    def __set__(self, thing, value):
+        parent = thing.frame_parent
+        if parent is not None and self.name != 'length':
+            R, t = parent.world_frame()
+            if self.name == 'pos':
+                value = R.T @ (value - t)
+            else:
+                value = R.T @ value
+        store = thing.scene_store
+        if store is None:
+            thing.__dict__[self.name] = value
+            thing.__dict__['_version'] = next(versions)
+        else:
+            getattr(store, self.name)[thing.slot] = value
+            store.version[thing.slot] = next(versions)
+        if parent is not None:
+            parent.content_changed()
+        if thing.spatial_index is not None:
+            thing.spatial_index.moved(thing)
 
 class Thing:
     total = 0
     normal_color = 'black'
     select_color = 'red'
+    interfaces = ()
+    scene_store = None
+    slot = None
+    frame_parent = None ### the hierarchical Group this thing is placed in
+    frame = None        ### (R, t) of hierarchical groups, see Group.set_hierarchical
+    spatial_index = None ### the scene index this thing reports moves to
+    pos = stored('pos')
+    orient = stored('orient')
+    length = stored('length')
     def __init__(self):
         Thing.total += 1
         self.pos = np.array([0, 0, 0])
         self.orient = np.eye(3)
-        self.interfaces = []
+
+    def __getstate__(self):
+        ### a stored placement is saved as plain attributes
+        state = dict(self.__dict__)
+        for key in ('_world', '_version', '_frame_version', '_content_version', '_world_frame',
+                    '_frame_bounds', '_interfaces', 'spatial_index'):
+            state.pop(key, None)
+        if state.pop('scene_store', None) is not None:
+            del state['slot']
+            state['pos'] = Thing.pos.raw(self).copy()
+            state['orient'] = Thing.orient.raw(self).copy()
+            if hasattr(self, 'length'):
+                state['length'] = self.length
+        return state
+
+    @property
+    def version(self):
+        '''
+        Changes whenever pos, orient or length is assigned, the thing is
+        moved by its SceneStore or a hierarchical group it is in moves.
+        Edits in place (thing.pos[0] = x) go unnoticed: assign a new value
+        instead.
+        '''
+        if self.scene_store is None:
+            version = self.__dict__.get('_version', 0)
+        else:
+            ### a plain int: cache keys are compared as tuples
+            version = int(self.scene_store.version[self.slot])
+        if self.frame_parent is None:
+            return version
+        return (version, self.frame_parent.frame_version())
+
+    def shape_key(self):
+        ### what world_wireframe() depends on besides pos, orient and length
+        return None
+
+    def world_wireframe(self):
+        raise NotImplementedError('Abstract base class')
+
+    def world_geometry(self):
+        '''
+        Return (wireframe, verts, (mins, maxs)) in world space: wireframe as
+        world_wireframe() gives it, verts without its nan rows and their
+        bounds.  Arrays are read-only and computed again only once the
+        thing moves or changes shape.
+        '''
+        key = (self.version, self.shape_key())
+        cache = self.__dict__.get('_world')
+        if cache is None or cache[0] != key:
+            wireframe = self.world_wireframe()
+            wireframe.setflags(write=False)
+            verts = wireframe[~np.isnan(wireframe[:, 0])]
+            verts.setflags(write=False)
+            cache = (key, wireframe, verts, (verts.min(axis=0), verts.max(axis=0)))
+            self.__dict__['_world'] = cache
+        return cache[1:]
         
     def get_boundingbox(self):
         '''
@@ -57,6 +180,10 @@ class Thing:
         self.orient = util.get_right_rotation(roll, pitch, yaw) @ self.orient
         return self
 
+    def rotation_center(self):
+        ### the point rotate() leaves in place
+        return np.array(self.pos, dtype=float)
+
     def mirror(self, normal):
         return self
         self.orient = (np.eye(3) - 2 * np.outer(normal, normal)) @ self.orient
@@ -73,7 +200,7 @@ class Thing:
         raise NotImplementedError('Abstract base class')
     def toscad(self):
         raise NotImplementedError("Abstract Base Class")
-    def tobom(self):
+    def tobom(self, cost=None):
         raise NotImplementedError("Abstract Base Class")
     def get_orientation_angle_and_vec(self):
         #q = quaternion.from_rotation_matrix(self.orient) ## numpy-quaternion
@@ -83,8 +210,48 @@ class Thing:
         vec = q.vector ## pyquaternion
         return angle, vec
 
+def box(mins, maxs):
+    ### wireframe of the axis aligned box mins, maxs
+    n, x = mins, maxs
+    return np.array([[n[0], n[1], n[2]],
+                     [n[0], n[1], x[2]],
+                     [n[0], x[1], x[2]],
+                     [n[0], x[1], n[2]],
+                     [n[0], n[1], n[2]],
+                     [x[0], n[1], n[2]],
+                     [x[0], n[1], x[2]],
+                     [x[0], x[1], x[2]],
+                     [x[0], x[1], n[2]],
+                     [x[0], n[1], n[2]]])
+
+def rehome(thing, parent):
+    '''
+    Place thing relative to parent (a hierarchical Group, or None for world
+    space) without moving it.
+    '''
+    pos, orient = thing.pos, thing.orient
+    world = thing.world_frame() if thing.frame is not None else None
+    if world is None and thing.iscontainer():
+        ### members of a plain group are placed in the same frame it is
+        for member in thing.things:
+            rehome(member, parent)
+    thing.frame_parent = parent
+    thing.pos = pos
+    thing.orient = orient
+    if world is not None:
+        R, t = world
+        if parent is not None:
+            Rp, tp = parent.world_frame()
+            R, t = Rp.T @ R, Rp.T @ (t - tp)
+        thing.set_frame(R, t)
+
 class Group(Thing):
-    def __init__(self, things=None):
+    '''
+    A hierarchical group (see set_hierarchical) owns a frame (R, t) and keeps
+    its members relative to it: translate() and rotate() only change the
+    frame, and members' world placement is worked out when read.
+    '''
+    def __init__(self, things=None, hierarchical=False):
         Thing.__init__(self)
         if things is None:
             things = []
@@ -92,6 +259,8 @@ class Group(Thing):
         if len(things) > 0:
             self.pos = np.mean(self.get_verts(), axis=0)
             # self.pos[2] = np.min(self.get_verts[:,2])
+        if hierarchical:
+            self.set_hierarchical()
     def __len__(self):
         return len(self.things)
     
@@ -124,6 +293,10 @@ class Group(Thing):
         return out
     
     def get_wireframe(self):
+        return box(*self.get_boundingbox())
+
+    def members_bounds(self):
+        ### bounds of the members' world wireframes
         wfs = []
         n = 0
         for thing in self.things:
@@ -138,17 +311,7 @@ class Group(Thing):
         non_nan = np.logical_not(np.isnan(np.sum(out, axis=1)))
         x = np.max(out[non_nan], axis=0)
         n = np.min(out[non_nan], axis=0)
-        out = np.array([[n[0], n[1], n[2]],
-                        [n[0], n[1], x[2]],
-                        [n[0], x[1], x[2]],
-                        [n[0], x[1], n[2]],
-                        [n[0], n[1], n[2]],
-                        [x[0], n[1], n[2]],
-                        [x[0], n[1], x[2]],
-                        [x[0], x[1], x[2]],
-                        [x[0], x[1], n[2]],
-                        [x[0], n[1], n[2]]])
-        return out
+        return n, x
     
     def contains(self, thing):
         out = thing in self.things
@@ -164,37 +327,190 @@ class Group(Thing):
             for interface in thing.interfaces:
                 pass
             self.things.append(thing)
+            if self.frame is not None:
+                rehome(thing, self)
+                self.content_changed()
+            if self.spatial_index is not None:
+                self.spatial_index.joined(thing, self)
         thing.group = self
 
     def remove(self, thing):
         if thing in self.things:
             idx = self.things.index(thing)
             self.things.pop(idx)
+            if self.frame is not None:
+                rehome(thing, self.frame_parent)
+                self.content_changed()
+            if self.spatial_index is not None:
+                self.spatial_index.left(thing, self)
 
     def ungroup(self):
         out = self.things
         self.things = []
+        if self.frame is not None:
+            for thing in out:
+                rehome(thing, self.frame_parent)
+            self.content_changed()
+        if self.spatial_index is not None:
+            for thing in out:
+                self.spatial_index.left(thing, self)
         return out
 
+    def set_hierarchical(self, on=True):
+        '''
+        Switch hierarchical mode on or off.  Nothing moves: members are
+        re-expressed relative to the new frame (identity to start with) or
+        to the frame this group is itself placed in.
+        '''
+        if on == (self.frame is not None):
+            return self
+        if on:
+            if len(self) > 0:
+                self.pos = np.mean(self.get_verts(), axis=0)
+            self.set_frame(np.eye(3), np.zeros(3))
+            for thing in self.things:
+                rehome(thing, self)
+        else:
+            for thing in self.things:
+                rehome(thing, self.frame_parent)
+            self.set_frame(None)
+        self.content_changed()
+        return self
+
+    def set_frame(self, R, t=None):
+        '''
+        Place the members at (R, t) relative to frame_parent (or world space).
+        '''
+        self.frame = None if R is None else (R, t)
+        self.__dict__['_frame_version'] = next(versions)
+        if self.frame_parent is not None:
+            self.frame_parent.content_changed()
+        if self.spatial_index is not None:
+            self.spatial_index.moved(self)
+
+    def frame_version(self):
+        ### changes whenever this frame or one it is placed in moves
+        version = self.__dict__.get('_frame_version', 0)
+        if self.frame_parent is None:
+            return version
+        return (version, self.frame_parent.frame_version())
+
+    def world_frame(self):
+        '''
+        Return (R, t) taking coordinates relative to this frame to world
+        space, composed through frame_parent and cached until one moves.
+        '''
+        key = self.frame_version()
+        cache = self.__dict__.get('_world_frame')
+        if cache is None or cache[0] != key:
+            R, t = self.frame
+            if self.frame_parent is not None:
+                Rp, tp = self.frame_parent.world_frame()
+                R, t = Rp @ R, Rp @ t + tp
+            cache = (key, R, t)
+            self.__dict__['_world_frame'] = cache
+        return cache[1], cache[2]
+
+    def content_changed(self):
+        ### a member moved, came or went: frame_bounds() is out of date
+        self.__dict__['_content_version'] = next(versions)
+        if self.frame_parent is not None:
+            self.frame_parent.content_changed()
+
+    def frame_bounds(self):
+        '''
+        Bounds of the members relative to the frame; they do not change
+        when the group itself moves.
+        '''
+        key = self.__dict__.get('_content_version', 0)
+        cache = self.__dict__.get('_frame_bounds')
+        if cache is None or cache[0] != key:
+            R, t = self.world_frame()
+            corners = np.array(list(itertools.product(*zip(*self.members_bounds()))))
+            local = (corners - t) @ R
+            cache = (key, local.min(axis=0), local.max(axis=0))
+            self.__dict__['_frame_bounds'] = cache
+        return cache[1], cache[2]
+
+    def stored(self):
+        '''
+        Return (store, slots) if every leaf is a part in one SceneStore,
+        else (None, None).
+        '''
+        leaves = pricing.leaves(self.things)
+        store = leaves[0].scene_store if leaves else None
+        slots = None if store is None else store.slots(leaves)
+        if slots is None:
+            return None, None
+        return store, slots
+
+    def update_stored_pos(self, store):
+        ### as translate() leaves it: the mean vertex of every member group
+        for thing in self.things:
+            if thing.iscontainer() and len(thing) > 0:
+                thing.update_stored_pos(store)
+        self.pos = store.verts_mean(store.slots(pricing.leaves(self.things)))
+
     def translate(self, *args, **kw):
         if len(self) == 0:
-            pass
+            return self
+        if self.frame is not None:
+            return self.translate_frame(*args, **kw)
+        store, slots = self.stored()
+        if store is not None:
+            store.translate(slots, *args, **kw)
+            self.update_stored_pos(store)
         else:
             for thing in self.things:
                 thing.translate(*args, **kw)
             self.pos = np.mean(self.get_verts(), axis=0)
         return self
 
-    def rotate(self, *args, **kw):
-        if len(self.things) == 1:
-            center_of_rotation = self.things[0].pos
+    def translate_frame(self, v):
+        v = np.asarray(v, dtype=float)
+        self.pos = self.pos + v
+        R, t = self.frame
+        if self.frame_parent is not None:
+            v = self.frame_parent.world_frame()[0].T @ v
+        self.set_frame(R, t + v)
+        return self
+
+    def rotate_frame(self, Rw, c):
+        ### turn by Rw about world point c: as seen from frame_parent that is
+        ### x -> A x + b
+        if self.frame_parent is None:
+            Rp, tp = np.eye(3), np.zeros(3)
         else:
-            center_of_rotation = self.get_center()
-        c = center_of_rotation
+            Rp, tp = self.frame_parent.world_frame()
+        A = Rp.T @ Rw @ Rp
+        b = Rp.T @ (Rw @ (tp - c) + c - tp)
+        R, t = self.frame
+        self.pos = Rw @ (self.pos - c) + c
+        self.set_frame(A @ R, A @ t + b)
+
+    def rotation_center(self):
+        ### a lone part turns about its pos, anything else about its center
+        if len(self.things) == 1 and not self.things[0].iscontainer():
+            return np.array(self.things[0].pos, dtype=float)
+        return self.get_center()
+
+    def rotate(self, *args, **kw):
+        c = self.rotation_center()
         R = util.get_right_rotation(*args, **kw)
+        if self.frame is not None:
+            self.rotate_frame(R, c)
+            return
+        store, slots = self.stored()
+        if store is not None:
+            store.rotate(slots, R, c)
+            for thing in self.things:
+                if thing.iscontainer() and len(thing) > 0:
+                    thing.update_stored_pos(store)
+            return
         for thing in self.things:
+            ### each member turns about its own center, which is then moved
+            p0 = thing.rotation_center()
             thing.rotate(*args, **kw)
-            p0 = thing.pos.copy()
             p1 = R @ (p0 - c) + c
             thing.translate(p1 - p0)
 
@@ -202,9 +518,31 @@ class Group(Thing):
         out = Group()
         for thing in self.things:
             out.append(thing.dup())
+        if self.frame is not None:
+            out.set_hierarchical()
         return out
 
+    def get_boundingbox(self):
+        if self.frame is not None:
+            lo, hi = self.frame_bounds()
+            R, t = self.world_frame()
+            corners = np.array(list(itertools.product(*zip(lo, hi)))) @ R.T + t
+            return corners.min(axis=0), corners.max(axis=0)
+        store, slots = self.stored()
+        if store is not None:
+            return store.bounds(slots)
+        return self.members_bounds()
+
     def get_center(self):
+        if self.frame is not None:
+            if len(self) == 0:
+                return np.zeros(3)
+            mins, maxs = self.get_boundingbox()
+            return (maxs + mins) / 2
+        store, slots = self.stored()
+        if store is not None:
+            mins, maxs = store.bounds(slots)
+            return (maxs + mins) / 2
         verts = self.get_verts()
         if len(verts) > 0:
             ### return center of bounding box
@@ -230,16 +568,15 @@ class Group(Thing):
         out.append('}')
         return '\n'.join(out)
 
-    def tobom(self):
+    def tobom(self, cost=None):
+        ### price every part in one batch, then format
+        parts = pricing.leaves(self.things)
         lines = []
-        for thing in self.things:
-            lines.extend(thing.tobom())
+        for thing, part_cost in zip(parts, pricing.costs(parts)):
+            lines.extend(thing.tobom(part_cost))
         return lines
     def cost(self):
-        out = 0
-        for thing in self:
-            out += thing.cost()
-        return out
+        return pricing.total_cost(self.things)
 def Group__test__():
     g = Group()
     t = Thing()
@@ -254,12 +591,10 @@ class STL(Thing):
     select_color = 'salmon'
     def __init__(self, filename, cost=0, unit=mm):
         self.filename = filename
-        self.mesh = mesh.Mesh.from_file(self.filename)
-        self.vectors = self.mesh.vectors
-        self.points = self.mesh.points
+        self.mesh = stl_io.load(self.filename) ### shared with every STL of this file
+        self.vectors = self.mesh.vectors ### read-only, shared through the cache
         self.unit = unit
-        maxs = np.max(self.points.reshape((-1, 3)), axis=0)
-        mins = np.min(self.points.reshape((-1, 3)), axis=0)
+        mins, maxs = self.mesh.bounds()
         
         left = mins[0]
         right = maxs[0]
@@ -274,7 +609,7 @@ class STL(Thing):
         self.length = top - bottom
 
         #self.wireframe = wireframes.get('Cube')
-        self.wireframe = np.load(os.path.join(alex_dir, 'part_libraries', 'Main', 'Wireframes', 'Cube.npy'))
+        self.wireframe = wireframes.store.load(os.path.join(alex_dir, 'part_libraries', 'Main', 'Wireframes', 'Cube.npy'))
         d1 = right - left
         d2 = back - front
         length = top - bottom
@@ -302,12 +637,23 @@ class STL(Thing):
         out.append(f'  color([0, 1, 0])translate([{-off[0]}, {-off[1]}, {-off[2]}])import("{self.filename}");')
         return ''.join(out)
 
-    def get_wireframe(self):
-        if len(self.points) < 50:
+    @property
+    def points(self):
+        return self.mesh.points
+
+    def world_wireframe(self):
+        if len(self.mesh) < 50:
             out = self.points.reshape((-1, 3)) * [self.dim1, self.dim2, self.length] @ self.orient.T + self.pos
         else:
             out = self.wireframe * [self.dim1, self.dim2, self.length] @ self.orient.T + self.pos
         return out
+
+    def get_wireframe(self):
+        return self.world_geometry()[0]
+
+    def get_boundingbox(self):
+        mins, maxs = self.world_geometry()[2]
+        return mins.copy(), maxs.copy()
     
     def render(self, view, selected=False):
         view.erase(self)
@@ -319,6 +665,9 @@ class STL(Thing):
             width = max([1, np.min([view.get_scale(), 1.5])])
         wf = self.get_wireframe()
         view.create_path(self, wf, color, width)
+        scene = globals().get('TheScene')
+        if scene is not None and scene.index.owner(self) is not None:
+            scene.render_engaged(view)
     def get_verts(self):
         return self.get_wireframe()
 
@@ -338,13 +687,31 @@ class Scene(Group):### singleton
         self.selected = selected
         self.view.set_scene(self) ### allow view to access Scene
         self.export_cb = export_cb
+        self.parts_store = None
+        self.index = spatial.SceneIndex() ### see spatial
+        self.engagement = engagement.Engagement(self.index)
         TheScene = self ### reference to Scene singlton
+
+    def use_store(self, store):
+        '''
+        Keep the placement of scene parts in store (a scene_store.SceneStore),
+        or in the parts themselves again if store is None.
+        '''
+        if self.parts_store is not None:
+            self.parts_store.clear()
+        self.parts_store = store
+        if store is not None:
+            for thing in self:
+                store.add(thing)
         
     def delete_all(self):
         for thing in self:
             self.view.erase(thing)
             del thing
         self.things = []
+        self.index.clear()
+        if self.parts_store is not None:
+            self.parts_store.clear()
         
     def render(self, *args): ### ignore args, use self.view
         for thing in self:
@@ -353,8 +720,21 @@ class Scene(Group):### singleton
         for thing in self.selected:
             thing.render(self.view, selected=True)
 
+    def render_engaged(self, view):
+        '''
+        Redraw the parts whose interfaces a move, addition or removal opened
+        or closed (see engagement); the moved things redraw themselves.
+        '''
+        for thing in self.engagement.take_stale():
+            member = self.index.owner(thing)
+            if member is not None:
+                thing.render(view, selected=member in self.selected)
+
     def append(self, thing, select=False):
         Group.append(self, thing)
+        self.index.add(thing)
+        if self.parts_store is not None:
+            self.parts_store.add(thing)
         if select:
             self.selected.append(thing)
             selected=True
@@ -364,7 +744,11 @@ class Scene(Group):### singleton
         self.export()
     def remove(self, thing):
         Group.remove(self, thing)
+        self.index.remove(thing)
+        if self.parts_store is not None:
+            self.parts_store.remove(thing)
         self.view.erase(thing)
+        self.render_engaged(self.view)
         self.export()
     def ungroup(self):
         raise NotImplimented("Cannot ungroup Scene, remove items individually")
@@ -0,0 +1,234 @@
+'''
+Parallel, incremental OpenSCAD thumbnail rendering.
+
+Every render gets its own temporary .scad file, so jobs never share a
+scratch file, and the png is replaced rather than written in place.
+Thumbnails/thumbnails.json remembers a content hash (record, STL bytes
+and wireframe) per png; parts whose hash is unchanged are skipped.
+
+    python -m packages.thumbnails [library ...] [--force] [--jobs N]
+
+ImageCache keeps decoded thumbnails for the part dialog and can decode the
+neighbours of the current selection in the background.
+'''
+import argparse
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+if '.' not in sys.path:
+    sys.path.append('.')
+from packages.constants import openscad_path
+
+imgsize = (512, 512)
+manifest_name = 'thumbnails.json'
+
+def png_name(part_name):
+    return ''.join(part_name.split()) + '.png'
+
+def content_hash(record, stl_fn, wireframe):
+    '''
+    Digest of everything a thumbnail is drawn from.
+    '''
+    h = hashlib.sha256()
+    h.update(json.dumps([str(value) for value in record]).encode('utf-8'))
+    try:
+        with open(stl_fn, 'rb') as f:
+            for chunk in iter(lambda: f.read(2 ** 20), b''):
+                h.update(chunk)
+    except FileNotFoundError:
+        h.update(b'no stl')
+    h.update(wireframe.tobytes())
+    return h.hexdigest()
+
+def render(scad, png, openscad=None, size=imgsize):
+    '''
+    Render scad source to png with OpenSCAD using a private temp file.
+    Raises RuntimeError if OpenSCAD is missing or fails.
+    '''
+    openscad = openscad or openscad_path
+    if openscad is None:
+        raise RuntimeError('OpenSCAD not found; cannot render thumbnails')
+    fd, scad_fn = tempfile.mkstemp(suffix='.scad')
+    tmp_png = f'{os.path.splitext(png)[0]}.{os.getpid()}.{threading.get_ident()}.tmp.png'
+    try:
+        with os.fdopen(fd, 'w') as f:
+            f.write(scad)
+        result = subprocess.run([openscad, scad_fn, f'--imgsize={size[0]},{size[1]}', '-o', tmp_png],
+                                stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+        if result.returncode != 0:
+            raise RuntimeError(f'OpenSCAD failed on {png}:\n{result.stderr}')
+        os.replace(tmp_png, png) ### png may be linked to other libraries (see assets)
+    finally:
+        os.remove(scad_fn)
+        if os.path.exists(tmp_png):
+            os.remove(tmp_png)
+    return png
+
+def load_manifest(thumbnail_dir):
+    try:
+        with open(os.path.join(thumbnail_dir, manifest_name)) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+def save_manifest(thumbnail_dir, manifest):
+    fn = os.path.join(thumbnail_dir, manifest_name)
+    with open(fn + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent=1, sort_keys=True)
+    os.replace(fn + '.tmp', fn)
+
+def build(thumbnail_dir, jobs, force=False, workers=None, openscad=None, renderer=render):
+    '''
+    jobs -- iterable of (png name, scad source, content hash)
+
+    Render the jobs whose png is missing or whose hash changed, workers at a
+    time (default one per cpu; each OpenSCAD runs as its own process).
+    Returns (rendered, skipped, failed) where failed maps png name to error.
+    '''
+    manifest = load_manifest(thumbnail_dir)
+    todo = []
+    skipped = []
+    for png, scad, digest in jobs:
+        fn = os.path.join(thumbnail_dir, png)
+        if not force and manifest.get(png) == digest and os.path.exists(fn):
+            skipped.append(png)
+        else:
+            todo.append((png, scad, digest))
+    rendered = []
+    failed = {}
+    if todo:
+        with ThreadPoolExecutor(max_workers=workers or os.cpu_count()) as pool:
+            futures = {pool.submit(renderer, scad, os.path.join(thumbnail_dir, png), openscad): (png, digest)
+                       for png, scad, digest in todo}
+            try:
+                for future in as_completed(futures):
+                    png, digest = futures[future]
+                    try:
+                        future.result()
+                    except Exception as e:
+                        failed[png] = e
+                    else:
+                        manifest[png] = digest
+                        rendered.append(png)
+            finally:
+                save_manifest(thumbnail_dir, manifest)
+    return rendered, skipped, failed
+
+class ImageCache:
+    '''
+    Decoded thumbnails keyed by (path, mtime), so a re-rendered png is decoded
+    again.  Holds at most max_entries, least recently used first out.
+    prefetch() decodes in one background thread; a newer prefetch drops what
+    is left of the older one.  Images are shared: treat them as read-only.
+    '''
+    def __init__(self, max_entries=64):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+        self.generation = 0
+        self.pool = None
+
+    @staticmethod
+    def key(png):
+        return (os.path.abspath(png), os.stat(png).st_mtime_ns)
+
+    @staticmethod
+    def decode(png):
+        from PIL import Image
+        with Image.open(png) as image:
+            image.load()
+        return image
+
+    def lookup(self, key):
+        with self.lock:
+            image = self.entries.get(key)
+            if image is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+            return image
+
+    def get(self, png):
+        '''
+        Return the decoded image of png.  Raises OSError if it cannot be read.
+        '''
+        key = self.key(png)
+        image = self.lookup(key)
+        if image is None:
+            image = self.decode(png)
+            with self.lock:
+                self.misses += 1
+                self.entries[key] = image
+                self.entries.move_to_end(key)
+                while len(self.entries) > self.max_entries:
+                    self.entries.popitem(last=False)
+        return image
+
+    def prefetch(self, pngs):
+        '''
+        Decode pngs in the background, most wanted first.  Returns a future.
+        '''
+        with self.lock:
+            self.generation += 1
+            generation = self.generation
+            if self.pool is None:
+                self.pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix='thumbnails')
+        return self.pool.submit(self._prefetch, list(pngs)[:self.max_entries], generation)
+
+    def _prefetch(self, pngs, generation):
+        for png in pngs:
+            if generation != self.generation:
+                break
+            try:
+                self.get(png)
+            except OSError:
+                pass
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def close(self):
+        with self.lock:
+            self.generation += 1
+            pool, self.pool = self.pool, None
+        if pool is not None:
+            pool.shutdown(wait=True)
+
+    def stats(self):
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'entries': len(self.entries),
+                'max_entries': self.max_entries}
+
+images = ImageCache()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Render part library thumbnails with OpenSCAD.')
+    parser.add_argument('libraries', nargs='*', help='library names (default: all)')
+    parser.add_argument('-f', '--force', action='store_true', help='render unchanged parts too')
+    parser.add_argument('-j', '--jobs', type=int, default=None, help='parallel renders (default: cpus)')
+    args = parser.parse_args(argv)
+
+    from packages import parts_db
+    names = args.libraries or parts_db.federation.library_names()
+    status = 0
+    for name in names:
+        lib = parts_db.get_library(name)
+        rendered, skipped, failed = lib.make_thumbnails(force=args.force, workers=args.jobs)
+        print(f'{name}: {len(rendered)} rendered, {len(skipped)} unchanged, {len(failed)} failed')
+        for png, error in sorted(failed.items()):
+            print(f'  {png}: {error}', file=sys.stderr)
+            status = 1
+    return status
+
+if __name__ == '__main__':
+    sys.exit(main())
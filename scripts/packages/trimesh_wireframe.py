@@ -1,6 +1,20 @@
 import trimesh
 import numpy as np
 from numpy import linalg as la
+import sys
+if '.' not in sys.path:
+    sys.path.append('.')
+from packages import stl_io
+
+
+def load_mesh(stl_path):
+    '''
+    trimesh of stl_path built from the shared parsed STL (see stl_io.load),
+    merged as trimesh.load would.
+    '''
+    vertices = stl_io.load(stl_path).vectors.reshape((-1, 3)).astype(float)
+    faces = np.arange(len(vertices)).reshape((-1, 3))
+    return trimesh.Trimesh(vertices=vertices, faces=faces)
 
 
 def from_stl(stl_path, target_faces=1000, use_decimation=True):
@@ -23,7 +37,7 @@ def from_stl(stl_path, target_faces=1000, use_decimation=True):
         wireframe: nx3 numpy array with NaN separators between line segments
     """
     # Load mesh
-    mesh = trimesh.load(stl_path, force='mesh')
+    mesh = load_mesh(stl_path)
     
     # Decimate if mesh is too complex
     original_faces = len(mesh.faces)
@@ -143,7 +157,7 @@ def from_stl_simple(stl_path, max_faces=1000):
         wireframe: nx3 numpy array with NaN separators
     """
     # Load mesh
-    mesh = trimesh.load(stl_path, force='mesh')
+    mesh = load_mesh(stl_path)
     
     original_faces = len(mesh.faces)
     
@@ -14,7 +14,7 @@ from matplotlib.figure import Figure
 from mpl_toolkits.mplot3d import Axes3D
 from mpl_toolkits.mplot3d.art3d import Poly3DCollection
 import numpy as np
-from stl import mesh as stl_mesh
+from packages import stl_io
 
 
 class STLViewer3D(tk.Frame):
@@ -79,7 +79,7 @@ class STLViewer3D(tk.Frame):
         """
         try:
             # Load the STL file
-            self.current_mesh = stl_mesh.Mesh.from_file(filepath)
+            self.current_mesh = stl_io.read(filepath)
             
             # Clear the plot
             self.ax.clear()
@@ -118,10 +118,7 @@ class STLViewer3D(tk.Frame):
             
             # Calculate stats
             num_triangles = len(vectors)
-            bounds = self.current_mesh.points
-            size_x = bounds[:, 0].max() - bounds[:, 0].min()
-            size_y = bounds[:, 1].max() - bounds[:, 1].min()
-            size_z = bounds[:, 2].max() - bounds[:, 2].min()
+            size_x, size_y, size_z = self.current_mesh.dims()
             
             print(f"✓ STL loaded: {num_triangles} triangles")
             print(f"  Size: {size_x:.1f} x {size_y:.1f} x {size_z:.1f} mm")
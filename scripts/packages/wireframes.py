@@ -1,13 +1,15 @@
 import glob
+import json
 import os.path
+import struct
+import threading
+from collections import OrderedDict
 import numpy as np
 from numpy import cos, sin, pi
 import sys
 if '.' not in sys.path:
     sys.path.append('.')
 from packages.constants import npy_dir
-# Use new trimesh-based wireframe generation (much faster!)
-from packages.trimesh_wireframe import from_stl_simple as from_stl
 
 import sys
 if '.' not in sys.path:
@@ -15,6 +17,243 @@ if '.' not in sys.path:
 from packages import constants
 from packages import things
 
+def from_stl(stl_path, *args, **kw):
+    # Use new trimesh-based wireframe generation (much faster!)
+    # trimesh is slow to import, so load it on first use.
+    from packages.trimesh_wireframe import from_stl_simple
+    return from_stl_simple(stl_path, *args, **kw)
+
+class WireframeStore:
+    '''
+    Process-wide cache of wireframe .npy files keyed by (path, mtime), so
+    every Library object shares one copy and a rewritten file is reloaded.
+    Arrays are memory mapped read-only; least recently used entries are
+    dropped once their total size passes max_bytes.
+    '''
+    def __init__(self, max_bytes=64 * 2 ** 20):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.packs = {}
+        self.lock = threading.Lock()
+
+    def load(self, fn):
+        key = (os.path.abspath(fn), os.stat(fn).st_mtime_ns)
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return self.entries[key]
+        wireframe = np.load(fn, mmap_mode='r').view(np.ndarray)
+        with self.lock:
+            self.misses += 1
+            for old in [k for k in self.entries if k[0] == key[0]]: ### file was rewritten
+                self.nbytes -= self.entries.pop(old).nbytes
+            self.entries[key] = wireframe
+            self.nbytes += wireframe.nbytes
+            self.evict()
+        return wireframe
+
+    def evict(self):
+        ### the newest entry is always kept, even if it alone exceeds the budget
+        while self.nbytes > self.max_bytes and len(self.entries) > 1:
+            key, wireframe = self.entries.popitem(last=False)
+            self.nbytes -= wireframe.nbytes
+            self.evictions += 1
+
+    def load_pack(self, fn):
+        '''
+        Return the WireframePack in fn, opened once per (path, mtime).  Packs
+        are only memory mapped, so they do not count against max_bytes.
+        '''
+        key = (os.path.abspath(fn), os.stat(fn).st_mtime_ns)
+        with self.lock:
+            if key in self.packs:
+                self.hits += 1
+                return self.packs[key]
+        pack = WireframePack(fn)
+        with self.lock:
+            self.misses += 1
+            for old in [k for k in self.packs if k[0] == key[0]]:
+                del self.packs[old]
+            self.packs[key] = pack
+        return pack
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.packs.clear()
+            self.nbytes = 0
+
+    def stats(self):
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'entries': len(self.entries),
+                'packs': len(self.packs),
+                'nbytes': self.nbytes,
+                'max_bytes': self.max_bytes}
+
+store = WireframeStore()
+
+################################################################################
+## Packed wireframes: one file per library holding every wireframe.
+##
+##   8 bytes   pack_magic
+##   8 bytes   manifest length, little endian uint64
+##   manifest  utf-8 json: {"rows": n, "wireframes": {name: [start, stop]},
+##                          "stamp": packed directory's mtime in ns}
+##   padding   to a multiple of pack_align
+##   data      n x 3 little endian float64, wireframes back to back
+pack_magic = b'ALEXWFP1'
+pack_align = 64
+
+class WireframePack:
+    '''
+    Read-only view of a wireframe pack.  The header is read once; wireframes
+    are zero-copy slices of one memory map, one slice per name so callers
+    keyed on the array (ScaledWireframeCache) share it.
+    '''
+    def __init__(self, fn):
+        self.fn = fn
+        with open(fn, 'rb') as f:
+            magic, length = struct.unpack('<8sQ', f.read(16))
+            if magic != pack_magic:
+                raise ValueError(f'{fn} is not a wireframe pack')
+            manifest = json.loads(f.read(length).decode('utf-8'))
+        self.index = {name: tuple(span) for name, span in manifest['wireframes'].items()}
+        self.stamp = manifest.get('stamp')
+        self.views = {}
+        offset = -(-(16 + length) // pack_align) * pack_align
+        if manifest['rows']:
+            self.data = np.memmap(fn, dtype='<f8', mode='r', offset=offset,
+                                  shape=(manifest['rows'], 3)).view(np.ndarray)
+        else:
+            self.data = np.zeros((0, 3))
+            self.data.setflags(write=False)
+
+    def names(self):
+        return sorted(self.index)
+
+    def __contains__(self, name):
+        return name in self.index
+
+    def get(self, name):
+        view = self.views.get(name)
+        if view is None:
+            start, stop = self.index[name]
+            view = self.views.setdefault(name, self.data[start:stop])
+        return view
+
+def write_pack(fn, wireframes, stamp=None):
+    '''
+    Write the {name: n x 3 array} wireframes to a pack at fn.  The file is
+    replaced atomically so readers never see a partial pack.  stamp is kept
+    in the manifest for current_pack().
+    '''
+    index = {}
+    arrays = []
+    rows = 0
+    for name in sorted(wireframes):
+        wireframe = np.asarray(wireframes[name], dtype='<f8')
+        if wireframe.ndim != 2 or wireframe.shape[1] != 3:
+            raise ValueError(f'Wireframe {name} has shape {wireframe.shape}, expected (n, 3)')
+        index[name] = [rows, rows + len(wireframe)]
+        arrays.append(wireframe)
+        rows += len(wireframe)
+    manifest = json.dumps({'rows': rows, 'wireframes': index, 'stamp': stamp}).encode('utf-8')
+    header = pack_magic + struct.pack('<Q', len(manifest)) + manifest
+    header += b'\0' * (-len(header) % pack_align)
+    tmp = fn + '.tmp'
+    with open(tmp, 'wb') as f:
+        f.write(header)
+        for wireframe in arrays:
+            f.write(wireframe.tobytes())
+    os.replace(tmp, fn)
+
+def wireframe_files(wireframe_dir):
+    ### the .npy files of wireframe_dir, leaving out add_wf's scratch files
+    return [npy for npy in glob.glob(os.path.join(wireframe_dir, '*.npy'))
+            if not npy.endswith('.tmp.npy')]
+
+def directory_stamp(wireframe_dir):
+    ### changes whenever a wireframe is added, removed or replaced (add_wf never writes in place)
+    return os.stat(wireframe_dir).st_mtime_ns
+
+def pack_directory(wireframe_dir, fn):
+    '''
+    Pack every .npy in wireframe_dir into fn; return the number packed.
+    '''
+    stamp = directory_stamp(wireframe_dir) ### taken first: later changes make the pack stale
+    wireframes = {os.path.basename(npy)[:-4]: np.load(npy)
+                  for npy in wireframe_files(wireframe_dir)}
+    write_pack(fn, wireframes, stamp)
+    return len(wireframes)
+
+def current_pack(fn, wireframe_dir):
+    '''
+    Return the pack in fn, or None if there is none or wireframe_dir has
+    changed since it was packed: its mtime must equal the one recorded
+    before packing, rather than merely be older than the pack file, which a
+    change in the same clock tick as the write would also be.
+    '''
+    try:
+        pack = store.load_pack(fn)
+    except FileNotFoundError:
+        return None
+    try:
+        if directory_stamp(wireframe_dir) != pack.stamp:
+            return None
+    except FileNotFoundError:
+        pass ### a pack can stand in for the directory
+    return pack
+
+class ScaledWireframeCache:
+    '''
+    Interned local-space wireframes: unit wireframe scaled by
+    [dim1, dim2, length].  Parts with the same profile and length share one
+    read-only array.  Holds at most max_entries, least recently used first out.
+    '''
+    def __init__(self, max_entries=4096):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, unit, dim1, dim2, length):
+        key = (id(unit), float(dim1), float(dim2), float(length))
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and entry[0] is unit: ### ids are reused once unit is freed
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+        scaled = unit * key[1:]
+        scaled.setflags(write=False)
+        with self.lock:
+            self.misses += 1
+            self.entries[key] = (unit, scaled)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return scaled
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'entries': len(self.entries),
+                'max_entries': self.max_entries}
+
+scaled = ScaledWireframeCache()
+
 def path(pts):
     return np.array(pts)
 
@@ -160,7 +399,11 @@ def rename_wf(lib, old, new):
 def add_wf(lib, name, wf, force=False):
     npy = os.path.join(lib.wireframe_dir, name.title() + '.npy')
     print('wireframes.add_wf()::npy', npy)
-    np.save(npy, wf)
+    tmp = npy[:-4] + '.tmp.npy'
+    np.save(tmp, wf)
+    os.replace(tmp, npy) ### never write in place: npy may be linked to other libraries (see assets)
+    if os.path.exists(lib.wireframe_pack):
+        lib.pack_wireframes() ### an overwritten .npy would not make the pack stale
     
 def getlist_old():
     out = list(__wireframes.keys())
@@ -0,0 +1,21 @@
+"""
+Run the tests against a scratch copy of part_libraries, so opening, migrating
+and writing libraries never touches the files shipped in the repository.
+"""
+
+import os
+import shutil
+import tempfile
+from pathlib import Path
+
+project_root = Path(__file__).parent.parent
+scratch_dir = tempfile.mkdtemp()
+part_libraries_dir = os.path.join(scratch_dir, 'part_libraries')
+shutil.copytree(project_root / "part_libraries", part_libraries_dir,
+                ignore=shutil.ignore_patterns('*.db-wal', '*.db-shm', '.assets'))
+### read by packages.constants, so set before any test imports packages
+os.environ['ALEX_PART_LIBRARIES'] = part_libraries_dir
+
+
+def pytest_unconfigure(config):
+    shutil.rmtree(scratch_dir, ignore_errors=True)
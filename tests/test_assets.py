@@ -0,0 +1,99 @@
+"""
+Unit tests for the content-addressed asset store in packages.assets.
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+import numpy as np
+
+# Add the scripts directory to the path
+project_root = Path(__file__).parent.parent
+scripts_dir = project_root / "scripts"
+sys.path.insert(0, str(scripts_dir))
+
+from packages import assets
+from packages import wireframes
+
+
+class TestAssetStore(unittest.TestCase):
+    """Test linking, deduplication and garbage collection of assets."""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.store = assets.AssetStore(os.path.join(self.temp_dir, '.assets'))
+        for lib in ('A', 'B'):
+            os.mkdir(os.path.join(self.temp_dir, lib))
+            os.mkdir(os.path.join(self.temp_dir, lib, 'STL'))
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def path(self, *parts):
+        return os.path.join(self.temp_dir, *parts)
+
+    def write(self, fn, data):
+        with open(fn, 'wb') as f:
+            f.write(data)
+        return fn
+
+    def test_link_shares_storage(self):
+        """Test that a linked asset is the same file as its source and blob."""
+        src = self.write(self.path('A', 'STL', 'x.stl'), b'solid x')
+        dst = self.store.link(src, self.path('B', 'STL', 'x.stl'))
+        self.assertTrue(os.path.samefile(src, dst))
+        blob = self.store.blob_path(self.store.digest(src), '.stl')
+        self.assertTrue(os.path.samefile(blob, dst))
+        self.assertEqual(self.store.stats(), {'blobs': 1, 'bytes': 7, 'links': 2})
+        self.assertEqual(self.store.link(src, dst), dst)
+
+    def test_link_replaces_existing(self):
+        """Test that linking over an existing file replaces its content."""
+        src = self.write(self.path('A', 'STL', 'x.stl'), b'new')
+        dst = self.write(self.path('B', 'STL', 'x.stl'), b'old')
+        self.store.link(src, dst)
+        with open(dst, 'rb') as f:
+            self.assertEqual(f.read(), b'new')
+        self.assertEqual([fn for fn in os.listdir(self.path('B', 'STL'))], ['x.stl'])
+
+    def test_copy_without_hard_links(self):
+        """Test the copy fallback where hard links are not supported."""
+        src = self.write(self.path('A', 'STL', 'x.stl'), b'solid x')
+        with mock.patch('os.link', side_effect=OSError('not supported')):
+            dst = self.store.link(src, self.path('B', 'STL', 'x.stl'))
+        self.assertFalse(os.path.samefile(src, dst))
+        with open(dst, 'rb') as f:
+            self.assertEqual(f.read(), b'solid x')
+
+    def test_dedupe_and_gc(self):
+        """Test that copies become links and unused blobs are removed."""
+        a = self.write(self.path('A', 'STL', 'x.stl'), b'same')
+        b = self.write(self.path('B', 'STL', 'y.stl'), b'same')
+        c = self.write(self.path('B', 'STL', 'z.stl'), b'other')
+        files = list(assets.library_assets(self.temp_dir))
+        self.assertEqual(files, [a, b, c])
+        self.assertEqual(self.store.dedupe(files), 4)
+        self.assertTrue(os.path.samefile(a, b))
+        self.assertEqual(self.store.gc(), 0)
+        os.remove(c)
+        self.assertEqual(self.store.gc(), 1)
+        self.assertEqual(self.store.stats()['blobs'], 1)
+
+    def test_rewrite_does_not_touch_links(self):
+        """Test that saving a wireframe over a linked file leaves the others alone."""
+        lib = mock.Mock(wireframe_dir=self.path('A'), wireframe_pack=self.path('A', 'none.pack'))
+        npy = self.path('A', 'Cube.npy')
+        np.save(npy, np.zeros((4, 3)))
+        other = self.store.link(npy, self.path('B', 'Cube.npy'))
+        wireframes.add_wf(lib, 'Cube', np.ones((4, 3)))
+        self.assertEqual(np.load(npy).sum(), 12)
+        self.assertEqual(np.load(other).sum(), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,349 @@
+"""
+Unit tests for the sqlite table helpers in packages.database.
+"""
+
+import os
+import pickle
+import shutil
+import sqlite3
+import sys
+import tempfile
+import threading
+import unittest
+from unittest import mock
+from pathlib import Path
+
+# Add the scripts directory to the path
+project_root = Path(__file__).parent.parent
+scripts_dir = project_root / "scripts"
+sys.path.insert(0, str(scripts_dir))
+
+from packages.database import Table, Column, String, Integer, Float, Eq, In, Like, Range
+from packages.database import ConnectionManager, Migration, migrate, schema_version
+
+
+def make_tables(db):
+    part_table = Table('Part',
+                       Column('Name', String(), UNIQUE=True),
+                       Column('Price', Float()),
+                       Column('Color', String()))
+    piecewise_table = Table('Piecewise',
+                            Column('PartName', String()),
+                            Column('Length', Integer()),
+                            Column('Price', Float()))
+    part_table.create(db)
+    piecewise_table.create(db)
+    piecewise_table.create_index(db, ('PartName', 'Length'), unique=True)
+    return part_table, piecewise_table
+
+
+class TestInsertMany(unittest.TestCase):
+    """Test bulk inserts and conflict modes."""
+
+    def setUp(self):
+        self.db = sqlite3.connect(':memory:')
+        self.part_table, self.piecewise_table = make_tables(self.db)
+        self.part_table.insert_many(self.db, [('A', 1.0, 'red'), ('B', 2.0, 'blue')])
+
+    def tearDown(self):
+        self.db.close()
+
+    def test_insert_counts(self):
+        """Test that new rows are counted as inserted."""
+        result = self.part_table.insert_many(self.db, [('C', 3.0, 'green')])
+        self.assertEqual(result.inserted, 1)
+        self.assertEqual(self.part_table.count(self.db), 3)
+
+    def test_abort_rolls_back_batch(self):
+        """Test that the default mode raises and keeps the table unchanged."""
+        with self.assertRaises(sqlite3.IntegrityError):
+            self.part_table.insert_many(self.db, [('C', 3.0, 'green'), ('A', 9.0, 'red')])
+        self.assertEqual(self.part_table.count(self.db), 2)
+
+    def test_ignore(self):
+        """Test that conflicting rows are skipped and counted."""
+        result = self.part_table.insert_many(self.db, [('A', 9.0, 'red'), ('C', 3.0, 'green')],
+                                             on_conflict='ignore')
+        self.assertEqual((result.inserted, result.ignored), (1, 1))
+        self.assertEqual(self.part_table.select(self.db, where="Name='A'")[0].Price, 1.0)
+
+    def test_replace(self):
+        """Test that conflicting rows replace the stored ones."""
+        result = self.part_table.insert_many(self.db, [('A', 9.0, 'red'), ('C', 3.0, 'green')],
+                                             on_conflict='replace')
+        self.assertEqual((result.inserted, result.replaced), (1, 1))
+        self.assertEqual(self.part_table.select(self.db, where="Name='A'")[0].Price, 9.0)
+
+    def test_update_columns(self):
+        """Test that 'update' only overwrites the requested columns."""
+        result = self.part_table.insert_many(self.db, [('A', 9.0, 'black')],
+                                             on_conflict='update', update_columns=['Price'])
+        self.assertEqual((result.inserted, result.updated), (0, 1))
+        record = self.part_table.select(self.db, where="Name='A'")[0]
+        self.assertEqual(record.Price, 9.0)
+        self.assertEqual(record.Color, 'red')
+
+    def test_update_with_composite_key(self):
+        """Test 'update' on a table keyed by a multi-column unique index."""
+        self.piecewise_table.insert_many(self.db, [('A', 100, 1.0), ('A', 200, 2.0)])
+        result = self.piecewise_table.insert_many(self.db, [('A', 200, 5.0), ('A', 300, 6.0)],
+                                                  on_conflict='update',
+                                                  key=('PartName', 'Length'))
+        self.assertEqual((result.inserted, result.updated), (1, 1))
+        self.assertEqual(self.piecewise_table.count(self.db), 3)
+
+    def test_counts_without_scanning(self):
+        """Test that outcome counts come without counting the whole table."""
+        statements = []
+        self.db.set_trace_callback(statements.append)
+        rows = [(f'P{i}', float(i), 'red') for i in range(10)] + [('A', 5.0, 'red'), ('P0', 1.0, 'red')]
+        results = [self.part_table.insert_many(self.db, rows, on_conflict=mode, batch_size=5)
+                   for mode in ('ignore', 'replace', 'update')]
+        self.db.set_trace_callback(None)
+        self.assertEqual([(r.inserted, r.ignored, r.replaced, r.updated) for r in results],
+                         [(10, 2, 0, 0), (0, 0, 12, 0), (0, 0, 0, 12)])
+        self.assertEqual([sql for sql in statements if 'COUNT(*) FROM Part;' in sql or
+                          sql.endswith('COUNT(*) FROM Part')], [])
+        result = self.piecewise_table.insert_many(self.db, [('A', 100, 1.0), ('A', 100, 2.0), ('B', 100, 1.0)],
+                                                  on_conflict='replace', key=('PartName', 'Length'))
+        self.assertEqual((result.inserted, result.replaced), (2, 1))
+        result = self.piecewise_table.insert_many(self.db, [('A', 100, 3.0), ('A', 200, 1.0)],
+                                                  on_conflict='replace', key=('PartName', 'Length'))
+        self.assertEqual((result.inserted, result.replaced), (1, 1))
+
+    def test_update_counts_repeated_keys(self):
+        """Test that a key repeated within one 'update' batch is inserted once, then updated."""
+        result = self.part_table.insert_many(self.db, [('C', 3.0, 'green'), ('C', 4.0, 'green')],
+                                             on_conflict='update')
+        self.assertEqual((result.inserted, result.updated), (1, 1))
+        self.assertEqual(self.part_table.select(self.db, where="Name='C'")[0].Price, 4.0)
+
+    def test_replace_needs_one_unique_key(self):
+        """Test that 'replace' refuses tables where rows could be replaced through another key."""
+        self.part_table.create_index(self.db, ('Color',), unique=True)
+        self.assertEqual(self.part_table.unique_keys(self.db), [('Color',), ('Name',)])
+        with self.assertRaises(ValueError):
+            self.part_table.insert_many(self.db, [('C', 3.0, 'red')], on_conflict='replace')
+        self.assertEqual(self.part_table.count(self.db), 2)
+        result = self.part_table.insert_many(self.db, [('C', 3.0, 'red')], on_conflict='ignore')
+        self.assertEqual(result.ignored, 1)
+
+    def test_batches(self):
+        """Test that rows spanning several batches are all inserted."""
+        rows = [(f'P{i}', float(i), 'red') for i in range(25)]
+        result = self.part_table.insert_many(self.db, rows, batch_size=10)
+        self.assertEqual(result.inserted, 25)
+
+    def test_insert_is_backward_compatible(self):
+        """Test that insert() still ignores duplicates and returns the row count."""
+        self.assertEqual(self.part_table.insert(self.db, [('A', 1.0, 'red'), ('D', 4.0, 'red')]), 1)
+
+    def test_unknown_mode(self):
+        """Test that an unknown conflict mode raises ValueError."""
+        with self.assertRaises(ValueError):
+            self.part_table.insert_many(self.db, [('E', 1.0, 'red')], on_conflict='merge')
+
+
+class TestPredicates(unittest.TestCase):
+    """Test parameterized select/delete."""
+
+    def setUp(self):
+        self.db = sqlite3.connect(':memory:')
+        self.part_table, self.piecewise_table = make_tables(self.db)
+        self.part_table.insert_many(self.db, [('2020 Alex', 1.0, 'silver'),
+                                              ('2040 Alex', 2.0, 'silver'),
+                                              ('3030 "Quoted"', 3.0, 'black')])
+        self.piecewise_table.insert_many(self.db, [('2020 Alex', 500, 5.0),
+                                                   ('2020 Alex', 100, 1.0),
+                                                   ('2020 Alex', 300, 3.0)])
+
+    def tearDown(self):
+        self.db.close()
+
+    def names(self, where, **kw):
+        return [r.Name for r in self.part_table.select(self.db, where=where, **kw)]
+
+    def test_eq_with_quotes(self):
+        """Test that names containing quotes are matched safely."""
+        self.assertEqual(self.names(Eq('Name', '3030 "Quoted"')), ['3030 "Quoted"'])
+
+    def test_in(self):
+        """Test IN predicates, including an empty value list."""
+        self.assertEqual(sorted(self.names(In('Name', ['2020 Alex', '2040 Alex']))),
+                         ['2020 Alex', '2040 Alex'])
+        self.assertEqual(self.names(In('Name', [])), [])
+
+    def test_like_and_combination(self):
+        """Test LIKE combined with an equality predicate."""
+        where = Like('Name', '%Alex') & Eq('Price', 2.0)
+        self.assertEqual(self.names(where), ['2040 Alex'])
+
+    def test_range_order_limit(self):
+        """Test range filters with ORDER BY and LIMIT."""
+        records = self.piecewise_table.select(self.db, where=Range('Length', 200, None),
+                                              order_by='Length')
+        self.assertEqual([r.Length for r in records], [300, 500])
+        records = self.piecewise_table.select(self.db, where=Eq('PartName', '2020 Alex'),
+                                              order_by='Length', limit=1)
+        self.assertEqual([r.Length for r in records], [100])
+
+    def test_statement_reused(self):
+        """Test that lookups with different values share one sql text."""
+        self.names(Eq('Name', '2020 Alex'))
+        n = len(self.part_table.statements)
+        self.names(Eq('Name', '2040 Alex'))
+        self.assertEqual(len(self.part_table.statements), n)
+
+    def test_statement_cache_is_bounded(self):
+        """Test that In() lists of many lengths do not grow the cache without end."""
+        for n in range(1, 300):
+            self.names(In('Name', ['2020 Alex'] * n))
+        self.assertEqual(len(self.part_table.statements), Table.statement_cache_size)
+        self.names(Eq('Name', '2020 Alex'))
+        self.assertEqual(self.names(In('Name', ['2020 Alex'] * 299)), ['2020 Alex'])
+
+    def test_delete(self):
+        """Test parameterized delete returns the number of rows removed."""
+        self.assertEqual(self.piecewise_table.delete(self.db, Range('Length', None, 300)), 2)
+        self.assertEqual(self.piecewise_table.count(self.db), 1)
+
+
+class TestRows(unittest.TestCase):
+    """Test compact row objects and column projection."""
+
+    def setUp(self):
+        self.db = sqlite3.connect(':memory:')
+        self.part_table, self.piecewise_table = make_tables(self.db)
+        self.part_table.insert_many(self.db, [('2020 Alex', 1.0, 'silver')])
+
+    def tearDown(self):
+        self.db.close()
+
+    def test_attribute_and_key_access(self):
+        """Test that rows support record.Name, record['Name'] and keys()."""
+        record = self.part_table.select(self.db)[0]
+        self.assertEqual(record.Name, '2020 Alex')
+        self.assertEqual(record['Color'], 'silver')
+        self.assertEqual(list(record.keys()), ['Name', 'Price', 'Color'])
+        self.assertFalse(hasattr(record, '__dict__'))
+
+    def test_projection(self):
+        """Test that select(columns=...) only returns the requested columns."""
+        record = self.part_table.select(self.db, columns=('Name',))[0]
+        self.assertEqual(list(record.keys()), ['Name'])
+        self.assertEqual(record.Name, '2020 Alex')
+        with self.assertRaises(AttributeError):
+            record.Price
+
+    def test_row_type_is_shared(self):
+        """Test that one row class is generated per projection."""
+        self.assertIs(self.part_table.row_type(), self.part_table.row_type())
+        self.assertIsNot(self.part_table.row_type(), self.part_table.row_type(('Name',)))
+
+    def test_pickle(self):
+        """Test that generated row classes survive a pickle round trip."""
+        record = self.part_table.select(self.db)[0]
+        copy = pickle.loads(pickle.dumps(record))
+        self.assertEqual(copy, record)
+        self.assertIs(type(copy), type(record))
+
+    def test_iter_select_batches(self):
+        """Test that iter_select yields every row across fetchmany batches."""
+        self.part_table.insert_many(self.db, [(f'P{i:02d}', float(i), 'red') for i in range(25)])
+        records = self.part_table.iter_select(self.db, where=Like('Name', 'P%'),
+                                              order_by='Name', columns=('Name',), batch_size=7)
+        self.assertEqual([r.Name for r in records], [f'P{i:02d}' for i in range(25)])
+        self.assertEqual(self.part_table.count(self.db, where=Like('Name', 'P%')), 25)
+
+
+class TestConnectionManager(unittest.TestCase):
+    """Test per-thread connections and WAL journaling."""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.db_fn = os.path.join(self.temp_dir, 'Parts.db')
+        self.manager = ConnectionManager()
+        self.part_table, self.piecewise_table = make_tables(self.manager.connect(self.db_fn))
+
+    def tearDown(self):
+        self.manager.close()
+        shutil.rmtree(self.temp_dir)
+
+    def test_wal_enabled(self):
+        """Test that new connections use WAL journaling."""
+        mode = self.manager.connect(self.db_fn).execute('PRAGMA journal_mode').fetchone()[0]
+        self.assertEqual(mode.lower(), 'wal')
+
+    def test_read_only_directory_keeps_journal(self):
+        """Test that WAL is not switched on where its files cannot be made."""
+        fn = os.path.join(self.temp_dir, 'Other.db')
+        with mock.patch('os.access', return_value=False):
+            mode = self.manager.connect(fn).execute('PRAGMA journal_mode').fetchone()[0]
+        self.assertEqual(mode.lower(), 'delete')
+
+    def test_same_thread_reuses_connection(self):
+        """Test that a thread always gets the same connection."""
+        self.assertIs(self.manager.connect(self.db_fn), self.manager.connect(self.db_fn))
+
+    def test_threads_get_own_connections(self):
+        """Test that a worker thread can read while the main thread holds a write."""
+        writer = self.manager.connect(self.db_fn)
+        self.part_table.insert_many(writer, [('A', 1.0, 'red')])
+        writer.execute('BEGIN IMMEDIATE')
+        writer.execute("INSERT INTO Part VALUES ('B', 2.0, 'red')")
+        result = {}
+        def read():
+            reader = self.manager.connect(self.db_fn)
+            result['same'] = reader is writer
+            result['names'] = [r.Name for r in self.part_table.select(reader)]
+            self.manager.close()
+        thread = threading.Thread(target=read)
+        thread.start()
+        thread.join()
+        writer.commit()
+        self.assertFalse(result['same'])
+        self.assertEqual(result['names'], ['A'])
+
+
+class TestMigrations(unittest.TestCase):
+    """Test schema versioning and ordered migrations."""
+
+    def setUp(self):
+        self.db = sqlite3.connect(':memory:')
+        self.migrations = [
+            Migration(2, 'index', 'CREATE INDEX PartColor ON Part(Color)'),
+            Migration(1, 'tables', lambda db: make_tables(db)),
+        ]
+
+    def tearDown(self):
+        self.db.close()
+
+    def test_new_database_is_upgraded_in_order(self):
+        """Test that migrations run in version order on a fresh database."""
+        self.assertEqual(schema_version(self.db), 0)
+        self.assertEqual(migrate(self.db, self.migrations), [1, 2])
+        self.assertEqual(schema_version(self.db), 2)
+
+    def test_migrate_is_idempotent(self):
+        """Test that already applied migrations are skipped."""
+        migrate(self.db, self.migrations)
+        self.assertEqual(migrate(self.db, self.migrations), [])
+
+    def test_failed_migration_rolls_back(self):
+        """Test that a failing step leaves the previous version in place."""
+        migrate(self.db, self.migrations)
+        bad = Migration(3, 'bad', 'CREATE INDEX PartPrice ON Part(Price)', 'NOT SQL')
+        with self.assertRaises(sqlite3.OperationalError):
+            migrate(self.db, self.migrations + [bad])
+        self.assertEqual(schema_version(self.db), 2)
+        indexes = [r[0] for r in self.db.execute("SELECT name FROM sqlite_master WHERE type='index'")]
+        self.assertNotIn('PartPrice', indexes)
+
+    def test_duplicate_versions(self):
+        """Test that duplicate versions are rejected."""
+        with self.assertRaises(ValueError):
+            migrate(self.db, self.migrations + [Migration(2, 'again')])
+
+
+if __name__ == '__main__':
+    unittest.main()
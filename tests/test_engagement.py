@@ -0,0 +1,139 @@
+"""
+Unit tests for the interface engagement table in packages.engagement.
+"""
+
+import sys
+import unittest
+from pathlib import Path
+
+import numpy as np
+
+# Add the scripts directory to the path
+project_root = Path(__file__).parent.parent
+scripts_dir = project_root / "scripts"
+sys.path.insert(0, str(scripts_dir))
+
+from packages import engagement
+from packages import parts_db
+from packages import spatial
+
+
+class TestEngagement(unittest.TestCase):
+    """Test hashed engagement against a scan of the whole scene."""
+
+    def setUp(self):
+        self.lib = parts_db.get_main_library()
+        self.index = spatial.SceneIndex()
+        self.engine = engagement.Engagement(self.index)
+        self.bracket = parts_db.Part(self.lib, '2020 Corner Two Way Silver')
+        self.along_x = parts_db.Part(self.lib, '2020 HFS5', 100).rotate(0, 1, 0).translate([110, 0, 10])
+        self.below = parts_db.Part(self.lib, '2020 HFS5', 100).translate([0, 0, -100])
+        self.members = [self.bracket, self.along_x, self.below]
+        for member in self.members:
+            self.index.add(member)
+
+    def open_names(self, part):
+        return [interface.name for interface, p, d in self.engine.open_interfaces(part)]
+
+    def test_engaged_and_open(self):
+        """Test that flush parts on an interface line engage it."""
+        self.assertEqual(self.open_names(self.bracket), [])
+        self.along_x.translate([1, 0, 0])
+        self.assertEqual(self.open_names(self.bracket), ['2020+X'])
+        self.below.translate([0, 5, 0])
+        self.assertEqual(self.open_names(self.bracket), ['2020+X', '2020-Z'])
+        self.index.remove(self.below)
+        self.below.translate([0, -5, 0])
+        self.assertEqual(self.open_names(self.bracket), ['2020+X', '2020-Z'])
+        self.index.add(self.below)
+        self.assertEqual(self.open_names(self.bracket), ['2020+X'])
+
+    def test_disengage_marks_neighbours(self):
+        """Test that parts a move engages or leaves open are marked stale and checked again."""
+        far = parts_db.Part(self.lib, '2020 HFS5', 100).translate([1000, 1000, 1000])
+        self.index.add(far)
+        self.assertEqual(self.open_names(self.bracket), [])
+        self.engine.take_stale()
+        self.along_x.translate([1, 0, 0])
+        self.assertIn(self.bracket, self.engine.take_stale())
+        self.assertEqual(self.open_names(self.bracket), ['2020+X'])
+        self.along_x.translate([-1, 0, 0])
+        self.assertIn(self.bracket, self.engine.take_stale())
+        self.assertEqual(self.open_names(self.bracket), [])
+        self.index.remove(self.below)
+        self.assertIn(self.bracket, self.engine.take_stale())
+        self.assertEqual(self.open_names(self.bracket), ['2020-Z'])
+
+    def test_open_interfaces_cached(self):
+        """Test that open interfaces are kept until something moves near them."""
+        far = parts_db.Part(self.lib, '2020 HFS5', 100).translate([1000, 1000, 1000])
+        self.index.add(far)
+        found = self.engine.open_interfaces(self.bracket)
+        self.engine.take_stale()
+        far.translate([0, 0, 10])
+        self.assertNotIn(self.bracket, self.engine.take_stale())
+        self.assertIs(self.engine.open_interfaces(self.bracket), found)
+        self.bracket.translate([0, 0, 0])
+        self.assertIsNot(self.engine.open_interfaces(self.bracket), found)
+
+    def scan(self, owner, interface):
+        ### Interface.engaged over every member, with the hull's midpoint
+        ### taken from the projected wireframe's bounds
+        p, d = interface.get_pos_dir(owner)
+        i = np.argmin(abs(d))
+        u0 = np.zeros(3)
+        u0[i] = 1
+        u0 = u0 - (d @ u0) * d
+        u0 /= np.linalg.norm(u0)
+        U = np.column_stack([u0, np.cross(d, u0)])
+        owner_bb = np.hstack(owner.get_boundingbox())
+        for thing in self.members:
+            if thing is owner:
+                continue
+            wf2d = thing.get_verts() @ U
+            midpoint = (wf2d.max(axis=0) + wf2d.min(axis=0)) / 2
+            if np.linalg.norm(midpoint - p @ U) < .01:
+                if np.min(np.abs(np.roll(owner_bb, 3) - np.hstack(thing.get_boundingbox()))) < .01:
+                    return True
+        return False
+
+    def test_matches_scene_scan(self):
+        """Test that random layouts, before and after moves, match a scan of every member."""
+        rng = np.random.default_rng(3)
+        names = ['2020 HFS5', '2020 Corner Two Way Silver', '2020 Corner Three Way Silver']
+        for i in range(40):
+            part = parts_db.Part(self.lib, names[i % 3], 100)
+            part.rotate(*rng.integers(0, 4, 3))
+            part.translate(10 * rng.integers(-12, 13, 3))
+            self.members.append(part)
+            self.index.add(part)
+        checked = 0
+        for step in range(3):
+            for part in self.members:
+                expected = []
+                for interface in part.interfaces:
+                    engaged = self.scan(part, interface)
+                    self.assertEqual(self.engine.engaged(part, interface), engaged)
+                    checked += engaged
+                    if not engaged:
+                        expected.append(interface.name)
+                self.assertEqual(self.open_names(part), expected)
+            for part in rng.choice(self.members[3:], 10, replace=False):
+                part.translate(10 * rng.integers(-1, 2, 3))
+        self.assertGreater(checked, 0)
+
+    def test_interface_frames(self):
+        """Test that world hotspots follow the part."""
+        hotspots, directions = self.bracket.interface_frames()
+        self.assertIs(self.bracket.interface_frames()[0], hotspots)
+        self.bracket.rotate(0, 0, 1)
+        self.bracket.translate([5, 0, 0])
+        hotspots, directions = self.bracket.interface_frames()
+        for interface, p, d in zip(self.bracket.interfaces, hotspots, directions):
+            expected = interface.get_pos_dir(self.bracket)
+            np.testing.assert_allclose(p, expected[0], atol=1e-12)
+            np.testing.assert_allclose(d, expected[1], atol=1e-12)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -6,9 +6,11 @@ This module tests the json_export module functions.
 
 import json
 import os
+import sqlite3
 import sys
 import tempfile
 import unittest
+from unittest import mock
 from pathlib import Path
 
 # Add the scripts directory to the path
@@ -18,6 +20,7 @@ sys.path.insert(0, str(scripts_dir))
 
 from packages import parts_db
 from packages import json_export
+from packages.database import Like
 
 
 class TestJSONExport(unittest.TestCase):
@@ -450,6 +453,31 @@ class TestJSONImport(unittest.TestCase):
         self.assertIsNotNone(imported_part, "Should find imported part")
         self.assertEqual(float(imported_part.Price), 20.0)
     
+    def test_import_many_piecewise_parts(self):
+        """Test that re-importing more piecewise parts than sqlite takes parameters works."""
+        part = dict(self.test_data["parts"][0], price="piecewise",
+                    piecewise_pricing=[{"length_mm": 100, "price": 1.0},
+                                       {"length_mm": 1000, "price": 5.0}])
+        self.test_data["parts"] = [dict(part, name=f"Piece {i}") for i in range(1200)]
+        with open(self.test_json_path, 'w') as f:
+            json.dump(self.test_data, f)
+        for i in range(2):
+            count = json_export.import_library_from_json(
+                self.test_json_path, self.test_lib, overwrite=True
+            )
+            self.assertEqual(count, 1200)
+        self.assertEqual(parts_db.piecewise_table.count(
+            self.test_lib.db, where=Like('PartName', 'Piece %')), 2400)
+
+    def test_import_is_one_transaction(self):
+        """Test that a failed import leaves the library unchanged."""
+        names = self.test_lib.get_names()
+        with mock.patch.object(parts_db.piecewise_table, 'insert_many',
+                               side_effect=sqlite3.OperationalError('disk I/O error')):
+            with self.assertRaises(sqlite3.OperationalError):
+                json_export.import_library_from_json(self.test_json_path, self.test_lib)
+        self.assertEqual(self.test_lib.get_names(), names)
+
     def test_import_invalid_json_raises_error(self):
         """Test that importing invalid JSON raises error."""
         invalid_json_path = os.path.join(self.temp_dir, "invalid.json")
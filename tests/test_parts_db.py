@@ -0,0 +1,295 @@
+"""
+Unit tests for the parts database layer in packages.parts_db.
+"""
+
+import os
+import pickle
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import unittest
+from unittest import mock
+from pathlib import Path
+
+# Add the scripts directory to the path
+project_root = Path(__file__).parent.parent
+scripts_dir = project_root / "scripts"
+sys.path.insert(0, str(scripts_dir))
+
+from packages import database
+from packages import parts_db
+
+
+def part_row(name, price=1.0):
+    return [name, 'Cube', 'CornerTwoWay.stl', price, 'http://example.com', 'silver',
+            'NA', 20, 20] + ['NA'] * 6
+
+
+class TestCatalog(unittest.TestCase):
+    """Test the in-memory part catalog and its invalidation."""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.db_fn = os.path.join(self.temp_dir, 'Parts.db')
+        self.db = parts_db.ProxyDB(self.db_fn)
+        database.migrate(self.db, parts_db.migrations)
+        parts_db.part_table.insert_many(self.db, [part_row('A'), part_row('B', '{piecewise}')])
+        parts_db.piecewise_table.insert_many(self.db, [('B', 500, 5.0), ('B', 100, 1.0)])
+        self.catalog = parts_db.Catalog(self.db)
+
+    def tearDown(self):
+        parts_db.db_connections.close(self.db_fn)
+        shutil.rmtree(self.temp_dir)
+
+    def test_lookup(self):
+        """Test records and price tables are served by name."""
+        self.assertEqual(self.catalog.names(), ['A', 'B'])
+        self.assertEqual(self.catalog.get_record('A').Color, 'silver')
+        lengths, prices = self.catalog.price_table('B')
+        self.assertEqual(list(lengths), [100, 500])
+        self.assertEqual(list(prices), [1.0, 5.0])
+        self.assertEqual(len(self.catalog.price_table('A')[0]), 0)
+
+    def test_missing_part(self):
+        """Test that unknown names raise ValueError."""
+        with self.assertRaises(ValueError):
+            self.catalog.get_record('Nope')
+
+    def test_no_reload_without_changes(self):
+        """Test that lookups do not reload an unchanged database."""
+        self.catalog.names()
+        state = self.catalog.state
+        self.catalog.get_record('A')
+        self.assertIs(self.catalog.state, state)
+
+    def test_reload_publishes_new_state(self):
+        """Test that a reload replaces records and price tables together, leaving the old pair intact."""
+        old_records, old_prices = self.catalog.refresh()
+        parts_db.piecewise_table.delete(self.db, database.Eq('PartName', 'B'))
+        parts_db.part_table.delete(self.db, database.Eq('Name', 'B'))
+        records, prices = self.catalog.refresh()
+        self.assertEqual((list(records), list(prices)), (['A'], []))
+        self.assertEqual((list(old_records), list(old_prices)), (['A', 'B'], ['B']))
+
+    def test_own_writes_invalidate(self):
+        """Test that writes through the same connection are picked up."""
+        self.catalog.names()
+        parts_db.part_table.insert_many(self.db, [part_row('C')])
+        self.assertIn('C', self.catalog.names())
+
+    def test_other_connection_writes_invalidate(self):
+        """Test that commits from another connection are picked up."""
+        self.catalog.names()
+        other = sqlite3.connect(self.db_fn)
+        parts_db.part_table.delete(other, database.Eq('Name', 'A'))
+        other.close()
+        self.assertEqual(self.catalog.names(), ['B'])
+
+
+class TestSearch(unittest.TestCase):
+    """Test the full-text part search and its numeric filters."""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.db_fn = os.path.join(self.temp_dir, 'Parts.db')
+        self.db = parts_db.ProxyDB(self.db_fn)
+        parts_db.initialize_db(self.db)
+        rows = [part_row('2020 Corner Black'), part_row('2020 Alex', '{piecewise}'),
+                part_row('3030 Plate', 3.0), part_row('Black 2020 "Quoted"', 0.5)]
+        rows[2][7] = 30
+        parts_db.part_table.insert_many(self.db, rows)
+        parts_db.piecewise_table.insert_many(self.db, [('2020 Alex', 100, 1.0),
+                                                       ('2020 Alex', 1000, 8.0)])
+
+    def tearDown(self):
+        parts_db.db_connections.close(self.db_fn)
+        shutil.rmtree(self.temp_dir)
+
+    def names(self, query, **kw):
+        return [r.Name for r in parts_db.search_parts(self.db, query, **kw)]
+
+    def test_prefix_match(self):
+        """Test that each word matches as a prefix and all words must match."""
+        self.assertEqual(sorted(self.names('corn')), ['2020 Corner Black'])
+        self.assertEqual(sorted(self.names('2020 bla')), ['2020 Corner Black', 'Black 2020 "Quoted"'])
+
+    def test_token_prefixes_only(self):
+        """Test that words match the start of indexed tokens, not their middle."""
+        parts_db.part_table.insert_many(self.db, [part_row('2020HFS5'), part_row('HFS 3030')])
+        self.assertEqual(self.names('HFS'), ['HFS 3030'])
+        self.assertEqual(self.names('2020hf'), ['2020HFS5'])
+        self.assertEqual(self.names('orne'), [])
+        self.assertEqual(self.names('100%'), [])
+
+    def test_without_fts5(self):
+        """Test that a sqlite without FTS5 searches substrings, and gets the index later."""
+        db_fn = os.path.join(self.temp_dir, 'Plain.db')
+        db = parts_db.ProxyDB(db_fn)
+        with mock.patch.object(parts_db, 'has_fts5', return_value=False):
+            parts_db.initialize_db(db)
+        self.assertFalse(parts_db.has_part_search(db))
+        self.assertEqual(database.schema_version(db), 2)
+        parts_db.part_table.insert_many(db, [part_row('2020 Corner Black'), part_row('2020HFS5')])
+        self.assertEqual([r.Name for r in parts_db.search_parts(db, 'hfs')], ['2020HFS5'])
+        self.assertEqual(len(parts_db.search_parts(db, '2020')), 2)
+        parts_db.initialize_db(db)
+        self.assertTrue(parts_db.has_part_search(db))
+        self.assertEqual([r.Name for r in parts_db.search_parts(db, 'hfs')], [])
+        self.assertEqual([r.Name for r in parts_db.search_parts(db, 'corn')], ['2020 Corner Black'])
+        parts_db.db_connections.close(db_fn)
+
+    def test_name_hits_rank_first(self):
+        """Test that words in the name outrank words in other columns."""
+        self.assertEqual(self.names('silver 3030'), ['3030 Plate'])
+        self.assertEqual(self.names('black')[0:2], ['2020 Corner Black', 'Black 2020 "Quoted"'])
+        self.assertEqual(self.names('2020', limit=1), self.names('2020')[:1])
+
+    def test_filters(self):
+        """Test numeric filters on dims, price and priced lengths."""
+        self.assertEqual(self.names('x>25'), ['3030 Plate'])
+        self.assertEqual(self.names('price<1'), ['Black 2020 "Quoted"'])
+        self.assertEqual(self.names('2020 len>500'), ['2020 Alex'])
+        self.assertEqual(self.names('len=400'), ['2020 Alex'])
+        self.assertEqual(self.names('len=2000'), [])
+
+    def test_quotes(self):
+        """Test that quotes in a query are matched literally."""
+        self.assertEqual(self.names('"quoted"'), ['Black 2020 "Quoted"'])
+        self.assertEqual(self.names('a"b'), [])
+
+    def test_index_follows_writes(self):
+        """Test that replace and delete keep the index in sync with Part."""
+        red = part_row('3030 Plate', 3.0)
+        red[5] = 'red'
+        for i in range(2):
+            parts_db.part_table.insert_many(self.db, [red], on_conflict='replace')
+        self.assertEqual(self.names('red'), ['3030 Plate'])
+        self.assertEqual(self.names('3030'), ['3030 Plate'])
+        parts_db.part_table.delete(self.db, database.Eq('Name', '3030 Plate'))
+        self.assertEqual(self.names('3030'), [])
+        count = self.db.execute('SELECT COUNT(*) FROM PartSearch').fetchone()[0]
+        self.assertEqual(count, 3)
+
+
+class TestFederation(unittest.TestCase):
+    """Test queries spanning every library database."""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.db_fns = []
+        for name, rows, version in [('Main', [part_row('2020 Alex'), part_row('Cube')], None),
+                                    ('Zed', [part_row('Cube', 2.0)], None),
+                                    ('old', [part_row('Black Cube')], 1)]:
+            os.mkdir(os.path.join(self.temp_dir, name))
+            db_fn = os.path.join(self.temp_dir, name, 'Parts.db')
+            db = parts_db.ProxyDB(db_fn)
+            if version is None:
+                parts_db.initialize_db(db)
+            else:
+                database.migrate(db, [m for m in parts_db.migrations if m.version <= version])
+            parts_db.part_table.insert_many(db, rows)
+            self.db_fns.append(db_fn)
+        os.mkdir(os.path.join(self.temp_dir, 'not_a_library'))
+        self.federation = parts_db.Federation(self.temp_dir)
+
+    def tearDown(self):
+        self.federation.close()
+        for db_fn in self.db_fns:
+            parts_db.db_connections.close(db_fn)
+        shutil.rmtree(self.temp_dir)
+
+    def test_library_names(self):
+        """Test that only directories with a Parts.db are listed, Main first."""
+        self.assertEqual(self.federation.library_names(), ['Main', 'old', 'Zed'])
+
+    def test_part_counts(self):
+        """Test that every library is counted in one query."""
+        self.assertEqual(self.federation.part_counts(), {'Main': 2, 'old': 1, 'Zed': 1})
+
+    def test_find_part(self):
+        """Test finding the libraries that hold a part."""
+        self.assertEqual(self.federation.find_part('Cube'), ['Main', 'Zed'])
+        self.assertEqual(self.federation.find_part('Nope'), [])
+
+    def test_search_upgrades_old_libraries(self):
+        """Test that search spans libraries, including ones without a search index."""
+        found = [(lib, r.Name) for lib, r in self.federation.search('cube')]
+        self.assertEqual(sorted(found), [('Main', '2020 Alex'), ('Main', 'Cube'),
+                                         ('Zed', 'Cube'), ('old', 'Black Cube')])
+        self.assertEqual(found[-1], ('Main', '2020 Alex')) ## wireframe hit ranks last
+        self.assertEqual(len(self.federation.search('cube', limit=2)), 2)
+        self.assertEqual(self.federation.search('cube price>1')[0][0], 'Zed')
+
+    def test_sees_new_writes(self):
+        """Test that writes to a library show up without reattaching."""
+        self.federation.part_counts()
+        parts_db.part_table.insert_many(parts_db.ProxyDB(self.db_fns[1]), [part_row('Cone')])
+        self.assertEqual(self.federation.find_part('Cone'), ['Zed'])
+
+
+class TestPartSpec(unittest.TestCase):
+    """Test that Parts share their catalog data."""
+
+    def setUp(self):
+        self.lib = parts_db.get_main_library()
+
+    def test_parts_share_spec(self):
+        """Test that parts of one name share a read-only spec."""
+        a = self.lib.get_part('2020 HFS5')
+        b = parts_db.Part(self.lib, '2020 HFS5', 300)
+        self.assertIs(a.spec, b.spec)
+        self.assertFalse(a.spec.wireframe.flags.writeable)
+        self.assertEqual(set(vars(b)), {'spec', 'length', 'pos', 'orient', '_version'})
+        self.assertEqual(b.wireframe.shape, a.spec.wireframe.shape)
+
+    def test_dup(self):
+        """Test that dup() copies placement and shares the spec."""
+        part = self.lib.get_part('2020 HFS5')
+        part.set_length(250)
+        part.translate([1, 2, 3])
+        dup = part.dup()
+        self.assertIs(dup.spec, part.spec)
+        self.assertEqual(dup.length, 250)
+        dup.translate([1, 0, 0])
+        self.assertEqual(list(part.pos), [1, 2, 3])
+        self.assertEqual(dup.cost(), part.cost())
+
+    def test_pickle(self):
+        """Test that pickled parts only carry their placement and record."""
+        part = self.lib.get_part('2020 HFS5')
+        part.set_length(250)
+        copy = pickle.loads(pickle.dumps(part))
+        self.assertIs(copy.spec, part.spec)
+        self.assertEqual(copy.length, 250)
+
+    def test_load_old_design(self):
+        """Test that designs saved before PartSpec still load."""
+        with open(scripts_dir / 'cube.xcad', 'rb') as f:
+            group = pickle.load(f)[0]
+        part = group.things[0]
+        self.assertEqual(part.name, '2020 HFS5')
+        self.assertIs(part.spec, self.lib.get_spec('2020 HFS5'))
+        self.assertEqual(set(vars(part)), {'spec', 'length', 'pos', 'orient', 'group'})
+
+
+class TestStartup(unittest.TestCase):
+    """Test that importing parts_db has no side effects."""
+
+    def test_import_opens_nothing(self):
+        """Test that import neither connects nor opens the Main library."""
+        code = ("from packages import parts_db; "
+                "print(len(parts_db.db_connections.connections()), 'Main' in vars(parts_db))")
+        out = subprocess.run([sys.executable, '-c', code], cwd=scripts_dir,
+                             capture_output=True, text=True, check=True).stdout
+        self.assertEqual(out.split(), ['0', 'False'])
+
+    def test_main_is_opened_on_demand(self):
+        """Test that parts_db.Main and get_main_library() return one object."""
+        self.assertIs(parts_db.Main, parts_db.get_main_library())
+        self.assertEqual(parts_db.Main.name, 'Main')
+
+
+if __name__ == '__main__':
+    unittest.main()
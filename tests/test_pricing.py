@@ -0,0 +1,74 @@
+"""
+Unit tests for batched part pricing in packages.pricing.
+"""
+
+import sys
+import unittest
+from pathlib import Path
+
+import numpy as np
+
+# Add the scripts directory to the path
+project_root = Path(__file__).parent.parent
+scripts_dir = project_root / "scripts"
+sys.path.insert(0, str(scripts_dir))
+
+from packages import pricing
+from packages import parts_db
+from packages import things
+from packages.interpolate import interp1d
+
+
+class TestInterp(unittest.TestCase):
+    """Test piecewise linear pricing of lengths."""
+
+    lengths = np.array([50., 299., 300., 4000.])
+    prices = np.array([3., 3., 2.5, 30.])
+
+    def test_matches_interp1d(self):
+        """Test agreement with the scalar interpolator, inside and beyond the table."""
+        x = [10, 50, 100, 299, 299.5, 300, 1234, 4000, 5000]
+        expected = [interp1d(self.lengths, self.prices, float(v)) for v in x]
+        np.testing.assert_allclose(pricing.interp(self.lengths, self.prices, x), expected)
+
+    def test_clamp(self):
+        """Test that 'clamp' holds the end prices."""
+        y = pricing.interp(self.lengths, self.prices, [10, 5000], extrapolate='clamp')
+        self.assertEqual(list(y), [3., 30.])
+
+    def test_single_point_table(self):
+        """Test that a one row table prices every length the same."""
+        self.assertEqual(float(pricing.interp([100.], [2.], 500)), 2.)
+
+    def test_unknown_rule(self):
+        """Test that an unknown extrapolation rule raises ValueError."""
+        with self.assertRaises(ValueError):
+            pricing.interp(self.lengths, self.prices, 100, extrapolate='cubic')
+
+
+class TestSceneCost(unittest.TestCase):
+    """Test batched costs of groups of parts."""
+
+    def setUp(self):
+        lib = parts_db.get_main_library()
+        self.parts = [parts_db.Part(lib, '2020 HFS5', length) for length in (100, 250, 1000)]
+        self.parts.append(lib.get_part('2020 Corner Two Way Silver'))
+        self.group = things.Group(self.parts[:2] + [things.Group(self.parts[2:])])
+
+    def test_costs_match_parts(self):
+        """Test that batched costs equal each part's own cost()."""
+        leaves = pricing.leaves(self.group.things)
+        self.assertEqual(leaves, self.parts)
+        np.testing.assert_allclose(pricing.costs(leaves), [part.cost() for part in self.parts])
+
+    def test_group_cost_and_bom(self):
+        """Test nested group totals and that the BOM uses the same prices."""
+        total = sum(part.cost() for part in self.parts)
+        self.assertAlmostEqual(self.group.cost(), total)
+        bom = self.group.tobom()
+        self.assertEqual(len(bom), 4)
+        self.assertEqual(bom[0], self.parts[0].tobom()[0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,278 @@
+"""
+Unit tests for the columnar scene store in packages.scene_store.
+"""
+
+import pickle
+import sys
+import unittest
+from unittest import mock
+from pathlib import Path
+
+import numpy as np
+
+# Add the scripts directory to the path
+project_root = Path(__file__).parent.parent
+scripts_dir = project_root / "scripts"
+sys.path.insert(0, str(scripts_dir))
+
+from packages import parts_db
+from packages import pricing
+from packages import spatial
+from packages import things
+from packages.scene_store import SceneStore
+
+
+def make_parts():
+    lib = parts_db.get_main_library()
+    parts = []
+    for i, name in enumerate(['2020 HFS5', '2020 HFS5', '2020 Corner Two Way Silver', '2020 HFS5']):
+        part = parts_db.Part(lib, name, 100 + 50 * i)
+        part.translate([10 * i, -5 * i, 3 * i])
+        part.rotate(i, 0, 1)
+        parts.append(part)
+    return parts
+
+
+class TestSceneStore(unittest.TestCase):
+    """Test that stored groups move exactly like plain ones."""
+
+    def make_group(self):
+        parts = make_parts()
+        return things.Group(parts[:2] + [things.Group(parts[2:])])
+
+    def assertSamePlacement(self, a, b):
+        for x, y in zip(pricing.leaves(a.things), pricing.leaves(b.things)):
+            np.testing.assert_allclose(x.pos, y.pos, atol=1e-9)
+            np.testing.assert_allclose(x.orient, y.orient, atol=1e-12)
+        np.testing.assert_allclose(a.pos, b.pos)
+        np.testing.assert_allclose(a.things[2].pos, b.things[2].pos)
+
+    def test_translate_and_rotate(self):
+        """Test vectorized moves against the per member loop."""
+        plain = self.make_group()
+        group = self.make_group()
+        store = SceneStore(capacity=2)
+        store.add(group)
+        self.assertEqual(len(store), 4)
+        self.assertIs(group.stored()[0], store)
+        for g in (plain, group):
+            g.translate([1, 2, 3])
+            g.rotate(0, 0, 1)
+            g.rotate(1, 0, 0)
+            g.translate([-4, 0, 7])
+        self.assertSamePlacement(group, plain)
+        for a, b in zip(group.get_boundingbox(), plain.get_boundingbox()):
+            np.testing.assert_allclose(a, b)
+        np.testing.assert_allclose(group.get_center(), plain.get_center())
+
+    def test_views_and_detach(self):
+        """Test that parts read and write their row and keep it when removed."""
+        group = self.make_group()
+        part = group.things[0]
+        store = SceneStore()
+        store.add(group)
+        part.translate([1, 0, 0])
+        part.set_length(321)
+        self.assertEqual(store.length[part.slot], 321)
+        np.testing.assert_array_equal(part.pos, store.pos[part.slot])
+        pos = part.pos.copy()
+        store.remove(group)
+        self.assertEqual(len(store), 0)
+        self.assertIsNone(part.scene_store)
+        np.testing.assert_array_equal(part.pos, pos)
+        self.assertEqual(part.length, 321)
+        self.assertFalse(hasattr(things.Group(), 'length'))
+
+    def test_moves_reach_index_in_one_batch(self):
+        """Test that a stored move tells the scene index about all its parts at once."""
+        group = self.make_group()
+        SceneStore().add(group)
+        index = spatial.SceneIndex()
+        index.add(group)
+        index.refresh()
+        with mock.patch.object(index, 'moved_many', wraps=index.moved_many) as moved_many:
+            group.translate([0, 0, 1000])
+        moved_many.assert_called_once()
+        self.assertEqual(len(moved_many.call_args[0][0]), 4)
+        self.assertEqual(index.region([-1000, -1000, 900], [1000, 1000, 1100]), [group])
+
+    def test_pickle(self):
+        """Test that stored parts pickle their placement as plain attributes."""
+        group = self.make_group()
+        SceneStore().add(group)
+        copy = pickle.loads(pickle.dumps(group))
+        self.assertIsNone(copy.things[0].scene_store)
+        self.assertSamePlacement(copy, group)
+
+
+class TestWorldGeometry(unittest.TestCase):
+    """Test caching of world space wireframes, verts and bounds."""
+
+    def setUp(self):
+        self.part = parts_db.Part(parts_db.get_main_library(), '2020 HFS5', 200)
+        self.part.translate([5, 6, 7])
+
+    def expected(self):
+        wf = self.part.wireframe @ self.part.orient.T + self.part.pos
+        return wf, wf[~np.isnan(wf[:, 0])]
+
+    def test_cached_until_moved(self):
+        """Test that unchanged parts return the same arrays."""
+        wf = self.part.get_wireframe()
+        self.assertIs(self.part.get_wireframe(), wf)
+        self.assertIs(self.part.get_verts(), self.part.get_verts())
+        self.assertFalse(wf.flags.writeable)
+        expected_wf, expected_verts = self.expected()
+        np.testing.assert_array_equal(wf, expected_wf)
+        mins, maxs = self.part.get_boundingbox()
+        np.testing.assert_array_equal(mins, expected_verts.min(axis=0))
+        np.testing.assert_array_equal(maxs, expected_verts.max(axis=0))
+
+    def test_invalidation(self):
+        """Test that translate, rotate, set_length and store moves refresh the cache."""
+        moves = [lambda: self.part.translate([1, 0, 0]),
+                 lambda: self.part.rotate(0, 1, 0),
+                 lambda: self.part.set_length(321)]
+        for move in moves:
+            wf = self.part.get_wireframe()
+            move()
+            self.assertIsNot(self.part.get_wireframe(), wf)
+            np.testing.assert_array_equal(self.part.get_wireframe(), self.expected()[0])
+        group = things.Group([self.part, parts_db.Part(self.part.lib, '2020 HFS5', 100)])
+        SceneStore().add(group)
+        verts = self.part.get_verts()
+        group.translate([0, 0, 10])
+        np.testing.assert_array_equal(self.part.get_verts(), verts + [0, 0, 10])
+
+
+
+class TestHierarchicalGroup(unittest.TestCase):
+    """Test groups that keep their members relative to a frame."""
+
+    def moves(self, group):
+        group.translate([1, 2, 3])
+        group.rotate(0, 0, 1)
+        group.rotate(1, 0, 0)
+        group.translate([-4, 0, 7])
+
+    def assertSameLeaves(self, a, b):
+        for x, y in zip(pricing.leaves(a), pricing.leaves(b)):
+            np.testing.assert_allclose(x.pos, y.pos, atol=1e-9)
+            np.testing.assert_allclose(x.orient, y.orient, atol=1e-12)
+            np.testing.assert_allclose(x.get_verts(), y.get_verts(), atol=1e-9)
+
+    def test_moves_only_change_frame(self):
+        """Test that a hierarchical group moves its parts like a plain one."""
+        plain = things.Group(make_parts())
+        group = things.Group(make_parts(), hierarchical=True)
+        raw = [part.__dict__['pos'] for part in group]
+        self.moves(plain)
+        self.moves(group)
+        self.assertTrue(all(part.__dict__['pos'] is pos for part, pos in zip(group, raw)))
+        self.assertSameLeaves(group.things, plain.things)
+        for a, b in zip(group.get_boundingbox(), plain.get_boundingbox()):
+            np.testing.assert_allclose(a, b, atol=1e-9)
+
+    def test_single_member_group(self):
+        """Test that a group holding one group turns it about its center in either mode."""
+        flat = things.Group(make_parts())
+        plain = things.Group([things.Group(make_parts()).dup()])
+        group = things.Group([things.Group(make_parts()).dup().set_hierarchical()])
+        inner = group.things[0]
+        np.testing.assert_allclose(inner.pos, np.mean(inner.get_verts(), axis=0), atol=1e-9)
+        for thing in (flat, plain, group):
+            self.moves(thing)
+        self.assertSameLeaves(plain.things, flat.things)
+        self.assertSameLeaves(group.things, flat.things)
+        np.testing.assert_allclose(inner.pos, np.mean(inner.get_verts(), axis=0), atol=1e-9)
+
+    def test_nested(self):
+        """Test that nested frames compose and member edits update the bounds."""
+        parts = make_parts()
+        inner = things.Group(parts[2:], hierarchical=True)
+        outer = things.Group(parts[:2] + [inner], hierarchical=True)
+        flat = things.Group(make_parts(), hierarchical=True)
+        self.moves(outer)
+        self.moves(flat)
+        verts = parts[3].get_verts()
+        inner.translate([0, 0, 10])
+        self.assertIsNot(parts[3].get_verts(), verts)
+        for part in flat.things[2:]:
+            part.translate([0, 0, 10])
+        self.assertSameLeaves(outer.things, flat.things)
+        for a, b in zip(outer.get_boundingbox(), outer.members_bounds()):
+            np.testing.assert_allclose(a, b, atol=1e-9)
+
+    def test_dup_pickle_and_ungroup(self):
+        """Test that copies and released members keep their world placement."""
+        group = things.Group(make_parts()[:2] + [things.Group(make_parts()[2:])],
+                             hierarchical=True)
+        self.moves(group)
+        expected = things.Group([part.dup() for part in pricing.leaves(group.things)])
+        self.assertSameLeaves(group.dup().things, expected.things)
+        self.assertSameLeaves(pickle.loads(pickle.dumps(group)).things, expected.things)
+        group.get_boundingbox()
+        for thing in [group] + pricing.leaves(group.things):
+            state = thing.__getstate__()
+            for key in ('_world', '_version', '_frame_version', '_content_version',
+                        '_world_frame', '_frame_bounds'):
+                self.assertNotIn(key, state)
+        group.set_hierarchical(False)
+        self.assertIsNone(group.frame)
+        self.assertSameLeaves(group.things, expected.things)
+        group.set_hierarchical(True)
+        group.translate([1, 1, 1])
+        expected.translate([1, 1, 1])
+        members = group.ungroup()
+        self.assertTrue(all(thing.frame_parent is None for thing in pricing.leaves(members)))
+        self.assertSameLeaves(members, expected.things)
+
+    def test_scene_store(self):
+        """Test that stored members are kept relative to the frame."""
+        plain = things.Group(make_parts())
+        group = things.Group(make_parts(), hierarchical=True)
+        store = SceneStore()
+        store.add(group)
+        self.assertEqual(group.stored(), (None, None))
+        self.moves(plain)
+        self.moves(group)
+        self.assertSameLeaves(group.things, plain.things)
+        store.clear()
+        self.assertSameLeaves(group.things, plain.things)
+
+    def test_stored_parts_render(self):
+        """Test that stored parts drawn before and after grouping follow the frame."""
+        class View:
+            def __init__(self):
+                self.paths = {}
+            def erase(self, thing):
+                pass
+            def get_scale(self):
+                return 1
+            def create_path(self, thing, path, color, width):
+                self.paths[thing] = path
+            def create_line(self, thing, p0, p1, color, width):
+                pass
+        parts = make_parts()
+        plain = things.Group(make_parts())
+        store = SceneStore()
+        for part in parts:
+            store.add(part)
+        view = View()
+        for part in parts:
+            part.render(view)
+        group = things.Group(parts, hierarchical=True)
+        self.assertIsInstance(parts[0].version[0], int)
+        self.moves(group)
+        self.moves(plain)
+        group.render(view)
+        for part, expected in zip(parts, plain.things):
+            np.testing.assert_allclose(view.paths[part], expected.get_wireframe(), atol=1e-9)
+        group.ungroup()
+        for part in parts:
+            part.render(view)
+        self.assertSameLeaves(parts, plain.things)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,158 @@
+"""
+Unit tests for the spatial index in packages.spatial.
+"""
+
+import math
+import sys
+import unittest
+from pathlib import Path
+
+import numpy as np
+
+# Add the scripts directory to the path
+project_root = Path(__file__).parent.parent
+scripts_dir = project_root / "scripts"
+sys.path.insert(0, str(scripts_dir))
+
+from packages import parts_db
+from packages import spatial
+from packages import things
+
+
+class TestAABBTree(unittest.TestCase):
+    """Test tree queries against brute force over random boxes."""
+
+    def setUp(self):
+        rng = np.random.default_rng(7)
+        self.rng = rng
+        self.tree = spatial.AABBTree(margin=2.)
+        self.boxes = {}
+        for key in range(300):
+            self.put(key)
+
+    def put(self, key):
+        lo = self.rng.uniform(0, 500, 3)
+        hi = lo + self.rng.uniform(0, 40, 3)
+        self.boxes[key] = (lo, hi)
+        self.tree.update(key, lo, hi)
+
+    def brute_region(self, lo, hi):
+        return sorted(key for key, (a, b) in self.boxes.items()
+                      if np.all(a <= hi) and np.all(lo <= b))
+
+    def test_region_after_moves(self):
+        """Test region queries while boxes move, come and go."""
+        for key in range(0, 300, 3):
+            self.put(key)
+        for key in range(1, 300, 7):
+            self.tree.remove(key)
+            del self.boxes[key]
+        self.assertEqual(len(self.tree), len(self.boxes))
+        self.assertLessEqual(self.tree.height[self.tree.root], 2 * math.log2(len(self.tree)) + 8)
+        for i in range(20):
+            lo = self.rng.uniform(0, 450, 3)
+            hi = lo + 60
+            self.assertEqual(sorted(self.tree.region(lo, hi)), self.brute_region(lo, hi))
+
+    def test_sorted_insertion_stays_shallow(self):
+        """Test that keys inserted in order do not make a list of the tree."""
+        tree = spatial.AABBTree(margin=0)
+        for i in range(2000):
+            tree.insert(i, [i, 0, 0], [i + 1, 1, 1])
+        self.assertLessEqual(tree.height[tree.root], 2 * math.log2(2000) + 8)
+        self.assertEqual(sorted(tree.region([10.5, 0, 0], [12.5, 1, 1])), [10, 11, 12])
+
+    def test_ray(self):
+        """Test that ray hits are the boxes the ray meets, nearest first."""
+        origin = np.array([-10., 250., 250.])
+        direction = np.array([1., .1, -.05])
+        hits = self.tree.ray(origin, direction, radius=1.)
+        expected = []
+        for key, (lo, hi) in self.boxes.items():
+            t = spatial.ray_entry(tuple(lo - 1), tuple(hi + 1), tuple(origin),
+                                  tuple(1 / direction), 0, math.inf)
+            if t is not None:
+                expected.append(key)
+        self.assertEqual(sorted(key for t, key in hits), sorted(expected))
+        self.assertEqual([t for t, key in hits], sorted(t for t, key in hits))
+        behind = self.tree.ray(origin + 1000 * direction, direction)
+        line = self.tree.ray(origin + 1000 * direction, direction, t_min=-math.inf)
+        self.assertEqual(behind, [])
+        self.assertEqual(len(line), len(self.tree.ray(origin, direction)))
+
+    def test_nearest_and_pairs(self):
+        """Test nearest boxes and overlapping pairs."""
+        point = np.array([250., 250., 250.])
+        dist = {key: np.linalg.norm(np.maximum(0, np.maximum(lo - point, point - hi)))
+                for key, (lo, hi) in self.boxes.items()}
+        nearest = self.tree.nearest(point, k=5)
+        np.testing.assert_allclose([d for d, key in nearest], sorted(dist.values())[:5])
+        keys = sorted(self.boxes)
+        lo = np.array([self.boxes[key][0] for key in keys])
+        hi = np.array([self.boxes[key][1] for key in keys])
+        hit = np.all((lo[:, None] <= hi[None]) & (lo[None] <= hi[:, None]), axis=2)
+        expected = {(keys[i], keys[j]) for i, j in zip(*np.nonzero(hit)) if i < j}
+        self.assertEqual({tuple(sorted(pair)) for pair in self.tree.pairs()}, expected)
+
+    def test_projected(self):
+        """Test queries through a projection to 2d."""
+        P = np.array([[1, 0], [0, 1], [-.7, -.7]]) / np.sqrt([[1.49, 1.49]])
+        lo, hi = np.array([50., 50.]), np.array([150., 120.])
+        expected = []
+        for key, (a, b) in self.boxes.items():
+            corners = np.array(np.meshgrid(*zip(a, b))).reshape(3, -1).T @ P
+            if np.all(corners.min(axis=0) <= hi) and np.all(lo <= corners.max(axis=0)):
+                expected.append(key)
+        self.assertEqual(sorted(self.tree.projected(P, lo, hi)), sorted(expected))
+
+
+class TestSceneIndex(unittest.TestCase):
+    """Test that the index follows moves of scene members."""
+
+    def setUp(self):
+        lib = parts_db.get_main_library()
+        self.parts = [parts_db.Part(lib, '2020 HFS5', 100).translate([200 * i, 0, 0])
+                      for i in range(6)]
+        self.group = things.Group(self.parts[4:])
+        self.index = spatial.SceneIndex()
+        for member in self.parts[:4] + [self.group]:
+            self.index.add(member)
+
+    def test_moves_are_seen(self):
+        """Test that translated parts and groups are found where they went."""
+        self.assertEqual(self.index.region([790, -50, -50], [810, 50, 50]), [self.group])
+        self.assertEqual(self.index.owner(self.parts[5]), self.group)
+        self.parts[0].translate([0, 500, 0])
+        self.group.translate([0, 0, 1000])
+        self.assertEqual(self.index.region([790, -50, -50], [810, 50, 50]), [])
+        self.assertEqual(self.index.region([-50, 450, -50], [50, 550, 500]), [self.parts[0]])
+        self.assertEqual(self.index.nearest([1000, 0, 1050]), [self.group])
+        self.assertEqual(self.index.ray([-100, 10, 1050], [1, 0, 0]), [self.group])
+
+    def test_moved_many(self):
+        """Test that a batch of moves marks each owner once and ignores strangers."""
+        self.index.refresh()
+        stranger = parts_db.Part(parts_db.get_main_library(), '2020 HFS5', 100)
+        self.index.moved_many([self.parts[0], self.parts[5], self.parts[4], stranger])
+        self.assertEqual(self.index.dirty, {self.parts[0], self.group})
+        self.index.refresh()
+        self.assertEqual(self.index.dirty, set())
+
+    def test_membership(self):
+        """Test that group edits and removal update owners and boxes."""
+        self.index.remove(self.parts[3])
+        self.group.append(self.parts[3])
+        self.index.add(self.group)
+        self.assertEqual(self.index.owner(self.parts[3]), self.group)
+        self.assertEqual(self.index.region([590, -50, -50], [610, 50, 50]), [self.group])
+        self.group.remove(self.parts[3])
+        self.assertIsNone(self.parts[3].spatial_index)
+        self.assertEqual(self.index.region([590, -50, -50], [610, 50, 50]), [])
+        self.assertEqual(self.index.pairs(tolerance=200), [(self.parts[0], self.parts[1]),
+                                                           (self.parts[1], self.parts[2])])
+        self.index.clear()
+        self.assertEqual((len(self.index), self.parts[0].spatial_index), (0, None))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,159 @@
+"""
+Unit tests for the memory mapped STL reader in packages.stl_io.
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+import numpy as np
+
+# Add the scripts directory to the path
+project_root = Path(__file__).parent.parent
+scripts_dir = project_root / "scripts"
+sys.path.insert(0, str(scripts_dir))
+
+from packages import stl_io
+from packages import things
+
+main_stl = str(project_root / "part_libraries" / "Main" / "STL" / "2020 Alex.stl")
+
+
+class TestSTLFile(unittest.TestCase):
+    """Test reading, streaming and writing STL files."""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        rng = np.random.default_rng(0)
+        self.vectors = rng.uniform(-5, 5, (100, 3, 3)).astype(np.float32)
+        self.binary = stl_io.write(os.path.join(self.temp_dir, 'b.stl'), self.vectors)
+        self.ascii = os.path.join(self.temp_dir, 'a.stl')
+        with open(self.ascii, 'w') as f:
+            f.write('solid test\n')
+            for tri in self.vectors:
+                f.write('  facet normal 0 0 1\n    outer loop\n')
+                for v in tri:
+                    f.write(f'      vertex {v[0]!r} {v[1]!r} {v[2]!r}\n')
+                f.write('    endloop\n  endfacet\n')
+            f.write('endsolid test\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_binary(self):
+        """Test that binary triangles are read-only views of the facets."""
+        stl = stl_io.read(self.binary)
+        self.assertTrue(stl.binary)
+        self.assertEqual(len(stl), 100)
+        np.testing.assert_array_equal(stl.vectors, self.vectors)
+        self.assertFalse(stl.vectors.flags.writeable)
+        self.assertTrue(np.shares_memory(stl.vectors, stl.facets))
+        np.testing.assert_allclose(np.linalg.norm(stl.normals, axis=1), 1, rtol=1e-5)
+
+    def test_facets_not_mapped(self):
+        """Test that loaded facets own their memory and survive the file being rewritten."""
+        stl = stl_io.read(self.binary)
+        self.assertTrue(stl.facets.flags.owndata)
+        stl_io.write(self.binary, self.vectors[:10] + 1)
+        np.testing.assert_array_equal(stl.vectors, self.vectors)
+
+    def test_ascii(self):
+        """Test that ASCII files give the same triangles as binary ones."""
+        stl = stl_io.read(self.ascii)
+        self.assertFalse(stl.binary)
+        self.assertEqual(len(stl), 100)
+        np.testing.assert_array_equal(stl.vectors, self.vectors)
+        self.assertEqual(list(stl.normals[0]), [0, 0, 1])
+
+    def test_chunked_bounds(self):
+        """Test that streamed bounds match bounds of the whole mesh."""
+        pts = self.vectors.reshape((-1, 3))
+        for fn in (self.binary, self.ascii):
+            stl = stl_io.read(fn)
+            self.assertEqual([len(c) for c in stl.chunks(30)], [30, 30, 30, 10])
+            mins, maxs = stl.bounds()
+            np.testing.assert_array_equal(mins, pts.min(axis=0))
+            np.testing.assert_array_equal(maxs, pts.max(axis=0))
+
+    def test_matches_numpy_stl(self):
+        """Test agreement with numpy-stl on a library part."""
+        try:
+            from stl import mesh
+        except ImportError:
+            self.skipTest('numpy-stl not installed')
+        expected = mesh.Mesh.from_file(main_stl)
+        stl = stl_io.read(main_stl)
+        np.testing.assert_array_equal(stl.vectors, expected.vectors)
+        np.testing.assert_array_equal(stl.points, expected.points)
+        self.assertTrue(np.shares_memory(stl.points, stl.facets))
+        self.assertFalse(stl.points.flags.writeable)
+        thing = things.STL(main_stl)
+        np.testing.assert_allclose([thing.dim1, thing.dim2, thing.length],
+                                   expected.max_ - expected.min_)
+
+    def test_not_stl(self):
+        """Test that other files and empty meshes are rejected with ValueError."""
+        fn = os.path.join(self.temp_dir, 'x.stl')
+        with open(fn, 'w') as f:
+            f.write('hello')
+        with self.assertRaises(ValueError):
+            stl_io.read(fn)
+        empty = stl_io.write(os.path.join(self.temp_dir, 'e.stl'), np.zeros((0, 3, 3)))
+        self.assertEqual(len(stl_io.read(empty)), 0)
+        with self.assertRaises(ValueError):
+            stl_io.bounds(empty)
+
+
+class TestMeshCache(unittest.TestCase):
+    """Test sharing and invalidation of parsed STL files."""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.vectors = np.arange(90, dtype=np.float32).reshape((10, 3, 3))
+        self.fn = stl_io.write(os.path.join(self.temp_dir, 'a.stl'), self.vectors)
+        self.size = os.path.getsize(self.fn)
+        self.cache = stl_io.MeshCache(max_bytes=2 * self.size)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_shared(self):
+        """Test that a second load returns the same read-only mesh."""
+        stl = self.cache.load(self.fn)
+        self.assertIs(self.cache.load(self.fn), stl)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+        self.assertFalse(stl.vectors.flags.writeable)
+        mins, maxs = stl.bounds()
+        mins[:] = 100
+        self.assertEqual(list(stl.bounds()[0]), [0, 1, 2])
+
+    def test_rewritten_file_is_reloaded(self):
+        """Test that a new mtime or size replaces the cached mesh."""
+        stl = self.cache.load(self.fn)
+        stl_io.write(self.fn, self.vectors[:5])
+        os.utime(self.fn, ns=(0, 10 ** 9))
+        self.assertEqual(len(self.cache.load(self.fn)), 5)
+        self.assertEqual(len(stl), 10)
+        self.assertEqual(self.cache.stats()['entries'], 1)
+
+    def test_lru_eviction(self):
+        """Test that the least recently used mesh is dropped over budget."""
+        fns = [shutil.copy(self.fn, os.path.join(self.temp_dir, f'{c}.stl')) for c in 'ABC']
+        for fn in fns[:2] + fns[:1] + fns[2:]:
+            self.cache.load(fn)
+        self.assertEqual(self.cache.evictions, 1)
+        self.assertLessEqual(self.cache.nbytes, self.cache.max_bytes)
+        self.cache.load(fns[0])
+        self.assertEqual(self.cache.hits, 2)
+
+    def test_dup_does_not_reread(self):
+        """Test that duplicating an imported STL shares its mesh."""
+        thing = things.STL(main_stl)
+        self.assertIs(thing.dup().mesh, thing.mesh)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,162 @@
+"""
+Unit tests for the incremental thumbnail builder in packages.thumbnails.
+"""
+
+import os
+import shutil
+import stat
+import sys
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+
+import numpy as np
+
+# Add the scripts directory to the path
+project_root = Path(__file__).parent.parent
+scripts_dir = project_root / "scripts"
+sys.path.insert(0, str(scripts_dir))
+
+from packages import thumbnails
+
+
+class TestBuild(unittest.TestCase):
+    """Test which thumbnails are rendered and how results are recorded."""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.rendered = []
+        self.lock = threading.Lock()
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def renderer(self, scad, png, openscad=None):
+        if 'bad' in scad:
+            raise RuntimeError('OpenSCAD failed')
+        with open(png, 'w') as f:
+            f.write(scad)
+        with self.lock:
+            self.rendered.append(os.path.basename(png))
+
+    def build(self, jobs, **kw):
+        return thumbnails.build(self.temp_dir, jobs, workers=4, renderer=self.renderer, **kw)
+
+    def test_incremental(self):
+        """Test that only new or changed parts are rendered again."""
+        jobs = [(f'P{i}.png', f'cube({i});', f'hash{i}') for i in range(10)]
+        rendered, skipped, failed = self.build(jobs)
+        self.assertEqual((len(rendered), len(skipped), failed), (10, 0, {}))
+        jobs[3] = ('P3.png', 'cube(33);', 'changed')
+        os.remove(os.path.join(self.temp_dir, 'P5.png'))
+        rendered, skipped, failed = self.build(jobs)
+        self.assertEqual(sorted(rendered), ['P3.png', 'P5.png'])
+        self.assertEqual(len(skipped), 8)
+        rendered, skipped, failed = self.build(jobs, force=True)
+        self.assertEqual(len(rendered), 10)
+
+    def test_failures_are_retried(self):
+        """Test that a failed render is reported and not recorded as done."""
+        jobs = [('A.png', 'cube(1);', 'a'), ('B.png', 'bad', 'b')]
+        rendered, skipped, failed = self.build(jobs)
+        self.assertEqual((rendered, list(failed)), (['A.png'], ['B.png']))
+        self.assertEqual(thumbnails.load_manifest(self.temp_dir), {'A.png': 'a'})
+        rendered, skipped, failed = self.build(jobs)
+        self.assertEqual((rendered, skipped, list(failed)), ([], ['A.png'], ['B.png']))
+
+    def test_content_hash(self):
+        """Test that record, STL bytes and wireframe all change the hash."""
+        stl = os.path.join(self.temp_dir, 'part.stl')
+        with open(stl, 'wb') as f:
+            f.write(b'solid')
+        wireframe = np.zeros((4, 3))
+        digest = thumbnails.content_hash(('A', 20), stl, wireframe)
+        self.assertEqual(thumbnails.content_hash(('A', 20), stl, wireframe), digest)
+        self.assertNotEqual(thumbnails.content_hash(('A', 30), stl, wireframe), digest)
+        self.assertNotEqual(thumbnails.content_hash(('A', 20), stl, np.ones((4, 3))), digest)
+        with open(stl, 'ab') as f:
+            f.write(b' cube')
+        self.assertNotEqual(thumbnails.content_hash(('A', 20), stl, wireframe), digest)
+
+
+class TestImageCache(unittest.TestCase):
+    """Test the decoded thumbnail cache and background prefetch."""
+
+    def setUp(self):
+        from PIL import Image
+        self.temp_dir = tempfile.mkdtemp()
+        self.pngs = []
+        for i in range(4):
+            png = os.path.join(self.temp_dir, f'P{i}.png')
+            Image.new('RGB', (8, 8), (i, i, i)).save(png)
+            self.pngs.append(png)
+        self.cache = thumbnails.ImageCache(max_entries=3)
+
+    def tearDown(self):
+        self.cache.close()
+        shutil.rmtree(self.temp_dir)
+
+    def test_hits_and_eviction(self):
+        """Test that repeat gets share one image and old entries are dropped."""
+        image = self.cache.get(self.pngs[0])
+        self.assertIs(self.cache.get(self.pngs[0]), image)
+        self.assertEqual(image.getpixel((0, 0)), (0, 0, 0))
+        for png in self.pngs[1:]:
+            self.cache.get(png)
+        self.assertEqual(self.cache.stats()['entries'], 3)
+        self.assertIsNot(self.cache.get(self.pngs[0]), image)
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 5))
+
+    def test_rewritten_png_is_decoded(self):
+        """Test that a new mtime replaces the cached image."""
+        from PIL import Image
+        self.cache.get(self.pngs[0])
+        Image.new('RGB', (8, 8), (9, 9, 9)).save(self.pngs[0])
+        os.utime(self.pngs[0], ns=(0, 10 ** 9))
+        self.assertEqual(self.cache.get(self.pngs[0]).getpixel((0, 0)), (9, 9, 9))
+
+    def test_prefetch(self):
+        """Test that prefetched images are hits and missing files are skipped."""
+        missing = os.path.join(self.temp_dir, 'missing.png')
+        self.cache.prefetch([self.pngs[1], missing, self.pngs[2]]).result()
+        self.assertEqual(self.cache.misses, 2)
+        self.cache.get(self.pngs[1])
+        self.cache.get(self.pngs[2])
+        self.assertEqual((self.cache.hits, self.cache.misses), (2, 2))
+        with self.assertRaises(OSError):
+            self.cache.get(missing)
+
+
+@unittest.skipIf(sys.platform == 'win32', 'uses a shell script as a stand-in for OpenSCAD')
+class TestRender(unittest.TestCase):
+    """Test OpenSCAD invocation with a stand-in executable."""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.openscad = os.path.join(self.temp_dir, 'openscad')
+        with open(self.openscad, 'w') as f:
+            f.write('#!/bin/sh\n[ "$2" = "--imgsize=512,512" ] || exit 1\ncp "$1" "$4"\n')
+        os.chmod(self.openscad, os.stat(self.openscad).st_mode | stat.S_IEXEC)
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def test_private_scad_file(self):
+        """Test that each render writes and removes its own .scad file."""
+        png = os.path.join(self.temp_dir, 'A.png')
+        scad_files = lambda: {fn for fn in os.listdir(tempfile.gettempdir()) if fn.endswith('.scad')}
+        before = scad_files()
+        thumbnails.render('cube(1);', png, openscad=self.openscad)
+        with open(png) as f:
+            self.assertEqual(f.read(), 'cube(1);')
+        self.assertEqual(scad_files() - before, set())
+
+    def test_failure_raises(self):
+        """Test that a failing OpenSCAD raises RuntimeError."""
+        with self.assertRaises(RuntimeError):
+            thumbnails.render('cube(1);', '/nonexistent/dir/A.png', openscad=self.openscad)
+
+
+if __name__ == '__main__':
+    unittest.main()
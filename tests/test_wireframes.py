@@ -0,0 +1,170 @@
+"""
+Unit tests for the shared wireframe store in packages.wireframes.
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+import numpy as np
+
+# Add the scripts directory to the path
+project_root = Path(__file__).parent.parent
+scripts_dir = project_root / "scripts"
+sys.path.insert(0, str(scripts_dir))
+
+from packages import wireframes
+from packages.wireframes import WireframeStore, ScaledWireframeCache, WireframePack
+
+
+class TestWireframeStore(unittest.TestCase):
+    """Test caching, invalidation and eviction of wireframe files."""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.store = WireframeStore(max_bytes=2 * 24 * 10) ## two 10 point wireframes
+
+    def tearDown(self):
+        self.store.clear()
+        shutil.rmtree(self.temp_dir)
+
+    def save(self, name, wireframe):
+        fn = os.path.join(self.temp_dir, name + '.npy')
+        np.save(fn, wireframe)
+        return fn
+
+    def test_hits_and_misses(self):
+        """Test that a second load is served from the store."""
+        fn = self.save('Cube', np.ones((10, 3)))
+        first = self.store.load(fn)
+        self.assertIs(self.store.load(fn), first)
+        self.assertEqual((self.store.hits, self.store.misses), (1, 1))
+        self.assertFalse(first.flags.writeable)
+        self.assertIs(type(first), np.ndarray)
+
+    def test_rewritten_file_is_reloaded(self):
+        """Test that a new mtime replaces the cached array."""
+        fn = self.save('Cube', np.ones((10, 3)))
+        self.store.load(fn)
+        self.save('Cube', np.zeros((10, 3)))
+        os.utime(fn, ns=(0, 10 ** 9))
+        self.assertEqual(self.store.load(fn).sum(), 0)
+        self.assertEqual(self.store.stats()['entries'], 1)
+
+    def test_lru_eviction(self):
+        """Test that the least recently used array is dropped over budget."""
+        fns = [self.save(name, np.ones((10, 3))) for name in 'ABC']
+        self.store.load(fns[0])
+        self.store.load(fns[1])
+        self.store.load(fns[0])
+        self.store.load(fns[2])
+        self.assertEqual(self.store.evictions, 1)
+        self.store.load(fns[0])
+        self.assertEqual(self.store.hits, 2)
+        self.store.load(fns[1])
+        self.assertEqual(self.store.misses, 4)
+        self.assertLessEqual(self.store.nbytes, self.store.max_bytes)
+
+
+class TestScaledWireframeCache(unittest.TestCase):
+    """Test interning of scaled wireframes."""
+
+    def setUp(self):
+        self.cache = ScaledWireframeCache(max_entries=2)
+        self.unit = np.ones((4, 3))
+
+    def test_identical_members_share_array(self):
+        """Test that equal profile and length return one read-only array."""
+        a = self.cache.get(self.unit, 20, 20, 300)
+        self.assertIs(self.cache.get(self.unit, 20., 20., 300.), a)
+        self.assertFalse(a.flags.writeable)
+        self.assertEqual(list(a[0]), [20, 20, 300])
+
+    def test_distinct_keys(self):
+        """Test that other lengths and other unit wireframes are not shared."""
+        a = self.cache.get(self.unit, 20, 20, 300)
+        self.assertIsNot(self.cache.get(self.unit, 20, 20, 400), a)
+        self.assertIsNot(self.cache.get(np.ones((4, 3)), 20, 20, 300), a)
+
+    def test_bounded(self):
+        """Test that the least recently used entry is dropped."""
+        for length in (100, 200, 300):
+            self.cache.get(self.unit, 20, 20, length)
+        self.assertEqual(self.cache.stats()['entries'], 2)
+        self.cache.get(self.unit, 20, 20, 100)
+        self.assertEqual(self.cache.misses, 4)
+
+
+class TestWireframePack(unittest.TestCase):
+    """Test the single file wireframe pack."""
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.wireframe_dir = os.path.join(self.temp_dir, 'Wireframes')
+        os.mkdir(self.wireframe_dir)
+        self.cube = np.arange(48.).reshape((16, 3))
+        self.prism = np.full((12, 3), np.nan)
+        np.save(os.path.join(self.wireframe_dir, 'Cube.npy'), self.cube)
+        np.save(os.path.join(self.wireframe_dir, 'Prism.npy'), self.prism)
+        self.pack_fn = os.path.join(self.temp_dir, 'Wireframes.pack')
+
+    def tearDown(self):
+        wireframes.store.clear()
+        shutil.rmtree(self.temp_dir)
+
+    def test_round_trip(self):
+        """Test that packed wireframes read back unchanged as read-only views."""
+        self.assertEqual(wireframes.pack_directory(self.wireframe_dir, self.pack_fn), 2)
+        pack = WireframePack(self.pack_fn)
+        self.assertEqual(pack.names(), ['Cube', 'Prism'])
+        np.testing.assert_array_equal(pack.get('Cube'), self.cube)
+        np.testing.assert_array_equal(pack.get('Prism'), self.prism)
+        self.assertFalse(pack.get('Cube').flags.writeable)
+        self.assertTrue(np.shares_memory(pack.get('Cube'), pack.data))
+        self.assertIs(pack.get('Cube'), pack.get('Cube'))
+        self.assertNotIn('Cone', pack)
+
+    def test_scratch_files_left_out(self):
+        """Test that add_wf's half written scratch files are not packed."""
+        np.save(os.path.join(self.wireframe_dir, 'Cone.tmp.npy'), self.cube)
+        self.assertEqual(wireframes.pack_directory(self.wireframe_dir, self.pack_fn), 2)
+        self.assertEqual(WireframePack(self.pack_fn).names(), ['Cube', 'Prism'])
+
+    def test_empty_pack(self):
+        """Test a pack without wireframes."""
+        wireframes.write_pack(self.pack_fn, {})
+        self.assertEqual(WireframePack(self.pack_fn).names(), [])
+
+    def test_bad_shape_and_magic(self):
+        """Test that malformed input is rejected with ValueError."""
+        with self.assertRaises(ValueError):
+            wireframes.write_pack(self.pack_fn, {'Flat': np.zeros((4, 2))})
+        with open(self.pack_fn, 'wb') as f:
+            f.write(b'not a pack at all')
+        with self.assertRaises(ValueError):
+            WireframePack(self.pack_fn)
+
+    def test_current_pack(self):
+        """Test that a pack is only used while the directory is unchanged."""
+        self.assertIsNone(wireframes.current_pack(self.pack_fn, self.wireframe_dir))
+        wireframes.pack_directory(self.wireframe_dir, self.pack_fn)
+        pack = wireframes.current_pack(self.pack_fn, self.wireframe_dir)
+        self.assertIs(wireframes.current_pack(self.pack_fn, self.wireframe_dir), pack)
+        os.utime(self.wireframe_dir, ns=(0, os.stat(self.pack_fn).st_mtime_ns + 10 ** 9))
+        self.assertIsNone(wireframes.current_pack(self.pack_fn, self.wireframe_dir))
+        wireframes.pack_directory(self.wireframe_dir, self.pack_fn)
+        self.assertIsNotNone(wireframes.current_pack(self.pack_fn, self.wireframe_dir))
+        ### a change in the same tick as the pack was written
+        np.save(os.path.join(self.wireframe_dir, 'Cone.npy'), self.cube)
+        os.utime(self.wireframe_dir, ns=(0, os.stat(self.pack_fn).st_mtime_ns))
+        self.assertIsNone(wireframes.current_pack(self.pack_fn, self.wireframe_dir))
+        shutil.rmtree(self.wireframe_dir)
+        self.assertEqual(wireframes.current_pack(self.pack_fn, self.wireframe_dir).names(),
+                         ['Cube', 'Prism'])
+
+
+if __name__ == '__main__':
+    unittest.main()